@@ -0,0 +1,70 @@
+import asyncio
+import argparse
+import logging
+import os
+import sys
+
+from omegaconf import OmegaConf
+
+from mcp_agent_client.runner.batch_eval import BatchRunner
+
+logger = logging.getLogger(__name__)
+
+
+def parse_configs():
+    # Define argparse arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--config",
+        type=str,
+        default="./src/mcp_agent_client/configs/twenty_fourty_eight/config.yaml"
+    )
+    parser.add_argument(
+        "--batch_config",
+        type=str,
+        default="./src/mcp_agent_client/configs/twenty_fourty_eight/batch.yaml"
+    )
+    args, unknown = parser.parse_known_args()
+
+    # Load configuration files
+    cfg = OmegaConf.load(args.config)
+    batch_cfg = OmegaConf.load(args.batch_config)
+
+    # Override the game configuration with command-line arguments
+    cli_cfg = OmegaConf.from_cli(unknown)
+    cfg = OmegaConf.merge(cfg, cli_cfg)
+
+    return cfg, batch_cfg
+
+
+async def main():
+    # uv run ./scripts/batch_play_game.py --config ./src/mcp_agent_client/configs/twenty_fourty_eight/config.yaml --batch_config ./src/mcp_agent_client/configs/twenty_fourty_eight/batch.yaml
+    config, batch_config = parse_configs()
+
+    batch_runner = BatchRunner(batch_config)
+
+    # Set up logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s] [%(levelname)s] [%(filename)s:%(lineno)d] %(message)s',
+        handlers=[
+            logging.FileHandler(os.path.join(batch_runner.output_path, 'batch.log')),
+            logging.StreamHandler()
+        ]
+    )
+
+    def log_uncaught_exceptions(exctype, value, tb):
+        logging.critical("Uncaught exception", exc_info=(exctype, value, tb))
+
+    sys.excepthook = log_uncaught_exceptions
+
+    results = await batch_runner.run(config)
+
+    num_failed = sum(result["status"] != "ok" for result in results)
+    logger.info(f"Finished {len(results)} episodes ({num_failed} failed)")
+    logger.info(f"Results: {batch_runner.results_file}")
+    logger.info(f"Summary: {batch_runner.summary_file}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
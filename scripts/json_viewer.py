@@ -5,6 +5,8 @@ import sys
 import time
 import argparse
 
+from mcp_agent_client.llms.conversation_log import ConversationLogReader
+
 
 def get_json_files(folder_path):
     json_files = sorted(
@@ -18,6 +20,13 @@ def load_json_content(file_path):
     try:
         with open(file_path, "r", encoding="utf-8") as f:
             data = json.load(f)
+        return format_messages(data)
+    except Exception as e:
+        return f"Error: {e}"
+
+
+def format_messages(data):
+    try:
         if not data:
             return "[EMPTY JSON]"
         
@@ -40,7 +49,45 @@ def load_json_content(file_path):
         return f"Error: {e}"
 
 
+def view_conversation_log(folder_path):
+    reader = ConversationLogReader(folder_path)
+    if len(reader) == 0:
+        print("No conversations logged yet.")
+        return
+
+    index = 0
+
+    while True:
+        os.system('clear' if os.name == 'posix' else 'cls')
+        print("=" * 50)
+        try:
+            print(format_messages(reader.read(index)["messages"]))
+        except Exception as e:
+            print(f"Error: {e}")
+        print("-" * 50)
+        print(f"Viewing record {index}/{len(reader) - 1} (step {reader.step_of(index)}) of {reader.log_file}")
+        print("Press A(Left)/D(Right) to navigate, <N> to jump to record N, S<N> to jump to step N, Q to quit.")
+
+        line = input()
+        key = line.strip().lower()
+        reader.refresh()
+        if key == 'q':
+            break
+        elif key == 'd' and index < len(reader) - 1:
+            index += 1
+        elif key == 'a' and index > 0:
+            index -= 1
+        elif key.startswith('s') and key[1:].isdigit():
+            index = reader.find_step(int(key[1:]))
+        elif key.isdigit():
+            index = min(max(0, int(key)), len(reader) - 1)
+
+
 def main(folder_path):
+    if ConversationLogReader.exists(folder_path):
+        return view_conversation_log(folder_path)
+
+    # logs written before conversations.jsonl: one JSON file per LLM call
     json_files = get_json_files(folder_path)
     if not json_files:
         print("No JSON files found.")
@@ -77,7 +124,7 @@ def main(folder_path):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="JSON Viewer")
-    parser.add_argument("--path", type=str, required=True, help="Path to JSON files folder")
+    parser.add_argument("--path", type=str, required=True, help="Path to the log folder (conversations.jsonl or JSON files)")
     args = parser.parse_args()
 
     main(args.path)
\ No newline at end of file
@@ -11,6 +11,8 @@ from omegaconf import OmegaConf
 from mcp_agent_client.runner.eval import BaseRunner
 from mcp_agent_client.base_agent import BaseAgent
 from mcp_agent_client.base_client import MCPAgentClient
+from mcp_agent_client.llms.utils import aclose_async_http_client
+from mcp_game_servers.utils.tracing import enable_tracing
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +40,7 @@ def set_log_path(cfg):
     agent_server_config = OmegaConf.create({
         "env_name": cfg.env_name,
         "log_path": cfg.log_path,
+        "trace": cfg.get("trace", False),
         "agent": cfg.agent,
     })
     with open(agent_server_config_path, 'w') as f:
@@ -47,6 +50,9 @@ def set_log_path(cfg):
     game_server_config = OmegaConf.create({
         "env_name": cfg.env_name,
         "log_path": cfg.log_path,
+        "obs_transport": cfg.get("obs_transport", "json"),
+        "trace": cfg.get("trace", False),
+        "policy_tier": OmegaConf.select(cfg, "runner.policy_tier", default=False),
         "env": cfg.env,
     })
     with open(game_server_config_path, 'w') as f:
@@ -67,6 +73,9 @@ def set_log_path(cfg):
 
     sys.excepthook = log_uncaught_exceptions
 
+    if cfg.get("trace", False):
+        enable_tracing(os.path.join(log_path, 'trace_client.json'), "client")
+
     return cfg
 
 def parse_configs():
@@ -106,7 +115,10 @@ async def main():
     runner.set_agent(llm_agent)
 
     # play with game and agent servers
-    score, step = await runner.mcp_play(config.game_server, config.agent_server, config.env.log_path, config)
+    try:
+        score, step = await runner.mcp_play(config.game_server, config.agent_server, config.env.log_path, config)
+    finally:
+        await aclose_async_http_client()
 
     # save result
     out_path = f"{config.env.log_path}/final_score.json"
@@ -117,6 +129,7 @@ async def main():
         "task": config.env.task,
         "score": score,
         "final_step": step,
+        **runner.policy_stats(),
         "game_server": config.game_server,
         "agent_server": config.agent_server,
         "input_modality": config.env.input_modality,
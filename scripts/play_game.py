@@ -9,6 +9,7 @@ from omegaconf import OmegaConf
 from mcp_agent_client.runner.eval import BaseRunner
 from mcp_game_servers.utils.module_creator import EnvCreator
 from mcp_agent_client.base_agent import BaselineAgent
+from mcp_game_servers.utils.tracing import enable_tracing
 
 
 logger = logging.getLogger(__name__)
@@ -41,6 +42,9 @@ def set_log_path(cfg):
         ]
     )
 
+    if cfg.get("trace", False):
+        enable_tracing(os.path.join(log_path, 'trace.json'), "play_game")
+
     return cfg
 
 def parse_configs():
@@ -90,6 +94,7 @@ def main():
         "task": config.env.task,
         "score": score,
         "final_step": step,
+        **runner.policy_stats(),
         "input_modality": config.env.input_modality
     }
     with open(out_path, 'w', encoding='utf-8') as f:
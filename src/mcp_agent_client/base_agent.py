@@ -1,24 +1,31 @@
+import asyncio
 import importlib
+import logging
 import os
 import json
+from collections import Counter
 from dataclasses import dataclass, field
-from typing import Dict, Optional, Union, Any
+from typing import Dict, List, Optional, Union, Any
 
 from omegaconf import DictConfig
 
-from mcp_agent_client.llms.llm import load_model, LocalBase
+from mcp_agent_client.llms.llm import load_model, ChatGPTBase, LocalBase
+from mcp_agent_client.llms.cache import CompletionCache, hash_image
+from mcp_agent_client.llms.conversation_log import get_conversation_log
 from mcp_agent_client.llms.openai_utils import (
-    Logger,
     MoneyManager,
     pretty_print_conversation,
 )
 from mcp_agent_client.json_schemas import SCHEMA_REGISTRY
 
 from mcp_game_servers.utils.types.misc import Configurable
+from mcp_game_servers.utils.tracing import span
+from mcp_game_servers.utils.types.encoded_image import EncodedImage
 
 from mcp_agent_servers.base_server import (
     PREFIXS,
     AGENT_MODULES,
+    IncrementalSectionParser,
     GenericMemory,
     SkillManager,
     agent_get_local_memory,
@@ -30,18 +37,29 @@ from mcp_agent_servers.base_server import (
     agent_add_new_skill,
     agent_retrieve_skills
 )
+from mcp_agent_servers.prompt_registry import get_prompt_registry
+from mcp_agent_servers.embeddings import get_embedding_provider
+from mcp_agent_servers.context_budget import ContextBudget
 
 from PIL import Image
 from io import BytesIO
 import re
 import base64
 
+logger = logging.getLogger(__name__)
+
 # Function to encode PIL.Image.Image to base64
 def encode_image(image: Image.Image) -> str:
     buffered = BytesIO()
     image.save(buffered, format="PNG")
     return base64.b64encode(buffered.getvalue()).decode("utf-8")
 
+# Function to get the data URL of an image, reusing its encoded bytes if already encoded
+def image_to_data_url(image: Union[Image.Image, EncodedImage]) -> str:
+    if isinstance(image, EncodedImage):
+        return image.to_data_url()
+    return f"data:image/png;base64,{encode_image(image)}"
+
 class BaseAgent(Configurable):
     @dataclass
     class Config:
@@ -59,6 +77,22 @@ class BaseAgent(Configurable):
         structured_output: Optional[Dict[str, str]] = field(default_factory=dict)
         long_term_memory_len: int = 10
 
+        cache_path: str = ""  # completion cache is disabled if empty
+        cache_max_size_mb: int = 1024
+        prompt_caching: bool = False  # mark static prompt prefixes as cacheable on the provider side
+        memory_capacities: Dict[str, int] = field(default_factory=dict)  # per-key ring buffer sizes
+        embedding_provider: str = "openai"  # openai, local (sentence-transformers on CPU) or hashing
+        embedding_model: str = ""  # provider default if empty
+        compress_conversation_log: bool = False  # gzip each record of conversations.jsonl
+        max_prompt_tokens: int = 0  # 0: context window of the model minus its output budget, < 0: no budgeting
+        local_batch_size: int = 0  # > 1: coalesce concurrent requests to a local server into batches of up to this size
+        local_batch_wait_ms: float = 5.0  # how long a batch waits for more requests
+        streaming: bool = False  # stream completions and stop once the sections below are complete
+        stream_stop_sections: Dict[str, List[str]] = field(
+            default_factory=lambda: {"action_inference": ["action"]}
+        )  # module -> sections after which the generation is cancelled
+        action_candidates: int = 1  # > 1: sample this many action_inference responses and vote on their actions
+
     cfg: Config  # add this to every subclass to enable static type checking
 
     def configure(self):
@@ -83,8 +117,12 @@ class BaseAgent(Configurable):
         self.agent_modules = AGENT_MODULES[self.agent_type]
         self.structured_output = self.cfg.structured_output
 
+        self.rate_limiter = None
+        self.env = None
+
         self._setup_model()
         self._setup_logger()
+        self._setup_cache()
 
     def _setup_model(self):
         loaded_model = load_model(
@@ -92,7 +130,10 @@ class BaseAgent(Configurable):
             temperature=self.temperature,
             repetition_penalty=self.repetition_penalty,
             api_key=self.api_key,
-            api_base_url=self.api_base_url
+            api_base_url=self.api_base_url,
+            prompt_caching=self.cfg.prompt_caching,
+            local_batch_size=self.cfg.local_batch_size,
+            local_batch_wait_ms=self.cfg.local_batch_wait_ms,
         )
 
         self.model_name = loaded_model["model_name"]
@@ -101,12 +142,78 @@ class BaseAgent(Configurable):
         self.tokenizer = loaded_model["tokenizer"]
 
     def _setup_logger(self):
-        self.logger = Logger(log_path=self.log_path)
+        self.step = 0
+        self.conversation_log = get_conversation_log(
+            self.log_path, compress=self.cfg.compress_conversation_log
+        )
+
+    def set_step(self, step: int) -> None:
+        # recorded with every logged conversation so that viewers can seek by step
+        self.step = step
+
+    def end_episode(self) -> None:
+        self.conversation_log.flush(sync=True)
+
+    def _setup_cache(self):
+        self.cache = None
+        if self.cfg.cache_path:
+            self.cache = CompletionCache(
+                self.cfg.cache_path,
+                max_size_bytes=self.cfg.cache_max_size_mb * 1024 * 1024,
+            )
+
+    def set_rate_limiter(self, rate_limiter) -> None:
+        self.rate_limiter = rate_limiter
+
+    def _cache_key(self, system_prompt, user_prompt, images, kwargs):
+        if self.cache is None:
+            return None
+        # sampled completions are not replayed: trials, retries and voting candidates must differ
+        params = dict(kwargs)
+        temperature = params.pop("temperature", None)
+        if temperature is None:
+            temperature = self.temperature
+        if temperature > 0:
+            return None
+        return self.cache.make_key(
+            self.model_name,
+            system_prompt,
+            user_prompt,
+            image_hashes={k: hash_image(v) for k, v in images.items()},
+            temperature=temperature,
+            repetition_penalty=self.repetition_penalty,
+            **params,
+        )
+
+    def _cache_get(self, cache_key):
+        if cache_key is None:
+            return None
+        completion = self.cache.get(cache_key)
+        self.ctx_manager.record_cache(completion is not None)
+        return completion
 
-    def chat_completion(self, system_prompt, user_prompt, images={}, **kwargs):
+    def _cache_put(self, cache_key, completion):
+        if cache_key is not None:
+            self.cache.put(cache_key, completion, model=self.model_name)
+
+    def _system_content(self, system_prompt):
+        """
+        With prompt caching, the system prompt is split into text parts and the
+        static prefix of its template (identical at every step) is marked as the
+        cache breakpoint. The text rendered from the slots after it is not cached.
+        """
+        static_prefix = getattr(system_prompt, "static_prefix", "")
+        if not getattr(self.llm, "prompt_caching", False) or not static_prefix:
+            return system_prompt
+        content = [{"type": "text", "text": static_prefix, "cache_control": {"type": "ephemeral"}}]
+        if len(system_prompt) > len(static_prefix):
+            content.append({"type": "text", "text": system_prompt[len(static_prefix):]})
+        return content
+
+    def _build_messages(self, system_prompt, user_prompt, images={}):
         messages = []
 
-        messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "system", "content": self._system_content(system_prompt)})
 
         if images:
             pattern = r"(<\|cur_state_image\|>|<\|prev_state_image\|>)"
@@ -123,12 +230,11 @@ class BaseAgent(Configurable):
                             }
                         )
                         continue
-                    base64_image = encode_image(images["cur_image"])
                     user_prompt.append(
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}",
+                                "url": image_to_data_url(images["cur_image"]),
                             }
                         }
                     )
@@ -141,12 +247,11 @@ class BaseAgent(Configurable):
                             }
                         )
                         continue
-                    base64_image = encode_image(images["prev_image"])
                     user_prompt.append(
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}",
+                                "url": image_to_data_url(images["prev_image"]),
                             }
                         }
                     )
@@ -160,23 +265,145 @@ class BaseAgent(Configurable):
 
         messages.append({"role": "user", "content": user_prompt})
 
-        output = self.llm(messages, **kwargs)
+        return messages
 
+    def _finalize_completion(self, messages, completion, candidates=None):
         messages.append(
             {
-                "content": output["response"].choices[0].message.content,
-                "role": output["response"].choices[0].message.role,
+                "content": completion,
+                "role": "assistant",
             }
         )
-        messages.append({"total_cost": self.ctx_manager.total_cost})
+        messages.append({
+            "total_cost": self.ctx_manager.total_cost,
+            "cache_hits": self.ctx_manager.cache_hits,
+            "cache_misses": self.ctx_manager.cache_misses,
+            "prompt_cache_read_tokens": self.ctx_manager.prompt_cache_read_tokens,
+            "prompt_cache_write_tokens": self.ctx_manager.prompt_cache_write_tokens,
+        })
 
         if self.debug_mode:
             pretty_print_conversation(messages)
-        self.logger(messages)
+        fields = {"candidates": candidates} if candidates else {}
+        self.conversation_log.log(messages, step=self.step, model=self.model_name, **fields)
 
-        completion = output["response"].choices[0].message.content
         return completion
 
+    def _section_parser(self, module_type, kwargs) -> Optional[IncrementalSectionParser]:
+        """
+        Parser that cancels a streamed response of `module_type` once its stop
+        sections are complete, or None if the response is not streamed. Backends
+        stream through `stream`/`astream` methods; DeepSeek has a `stream` flag instead.
+        """
+        stop_sections = self.cfg.stream_stop_sections.get(module_type) if module_type else None
+        if not self.cfg.streaming or not stop_sections or not callable(getattr(self.llm, "stream", None)):
+            return None
+        if any(key.startswith("guided_") for key in kwargs):
+            # structured outputs are parsed as a whole
+            return None
+        return IncrementalSectionParser(PREFIXS[module_type], stop_sections)
+
+    def _num_candidates(self, module_type) -> int:
+        return self.cfg.action_candidates if module_type == "action_inference" else 1
+
+    def _candidate_action(self, candidate, module_type, kwargs) -> Optional[str]:
+        try:
+            if "guided_json" in kwargs:
+                action = json.loads(candidate).get("action")
+            else:
+                action = parse_module_response(candidate, module_type).get("action")
+        except (ValueError, AttributeError):
+            return None
+        return str(action) if action else None
+
+    def _action_validity(self, action) -> float:
+        if action is None:
+            return -1.0
+        validity = self.env.action_validity(action) if self.env is not None else None
+        return 0.0 if validity is None else validity
+
+    def _vote(self, candidates, module_type, kwargs) -> str:
+        """
+        Picks one of several sampled responses of `module_type`. Candidates whose
+        action the env rates most valid win, ties go to the action proposed most
+        often among them, then to the earliest sample. Responses without a
+        parsable action lose to every other candidate.
+        """
+        actions = [self._candidate_action(candidate, module_type, kwargs) for candidate in candidates]
+        validities = [self._action_validity(action) for action in actions]
+        keys = [" ".join(action.lower().split()) if action else None for action in actions]
+
+        best_validity = max(validities)
+        pool = [i for i, validity in enumerate(validities) if validity == best_validity]
+        votes = Counter(keys[i] for i in pool)
+        winner = max(pool, key=lambda i: (votes[keys[i]], -i))
+        logger.info(
+            f"{module_type}: picked candidate {winner + 1} of {len(candidates)} "
+            f"(validity {validities[winner]:.2f}, {votes[keys[winner]]} votes)"
+        )
+        return candidates[winner]
+
+    def _sample(self, messages, n, kwargs) -> List[str]:
+        if isinstance(self.llm, (ChatGPTBase, LocalBase)):
+            output = self.llm(messages, n=n, **kwargs)
+            return [choice.message.content for choice in output["response"].choices]
+        # providers without `n` are sampled one request at a time
+        return [self.llm(messages, **kwargs)["response"].choices[0].message.content for _ in range(n)]
+
+    async def _asample(self, messages, n, kwargs) -> List[str]:
+        if isinstance(self.llm, (ChatGPTBase, LocalBase)):
+            output = await self.llm.acall(messages, n=n, **kwargs)
+            return [choice.message.content for choice in output["response"].choices]
+        outputs = await asyncio.gather(*(self.llm.acall(messages, **kwargs) for _ in range(n)))
+        return [output["response"].choices[0].message.content for output in outputs]
+
+    def chat_completion(self, system_prompt, user_prompt, images={}, module_type=None, **kwargs):
+        n = self._num_candidates(module_type)
+        cache_key = self._cache_key(system_prompt, user_prompt, images, dict(kwargs, n=n) if n > 1 else kwargs)
+        messages = self._build_messages(system_prompt, user_prompt, images)
+
+        completion = self._cache_get(cache_key)
+        candidates = None
+        if completion is None:
+            parser = self._section_parser(module_type, kwargs) if n == 1 else None
+            with span("llm.chat_completion", "llm", model=self.model_name, stream=parser is not None, n=n):
+                if n > 1:
+                    candidates = self._sample(messages, n, kwargs)
+                    completion = self._vote(candidates, module_type, kwargs)
+                elif parser is not None:
+                    self.llm.stream(messages, parser.feed, **kwargs)
+                    completion = parser.text
+                else:
+                    output = self.llm(messages, **kwargs)
+                    completion = output["response"].choices[0].message.content
+            self._cache_put(cache_key, completion)
+        return self._finalize_completion(messages, completion, candidates)
+
+    async def achat_completion(self, system_prompt, user_prompt, images={}, module_type=None, **kwargs):
+        n = self._num_candidates(module_type)
+        cache_key = self._cache_key(system_prompt, user_prompt, images, dict(kwargs, n=n) if n > 1 else kwargs)
+        messages = self._build_messages(system_prompt, user_prompt, images)
+
+        completion = self._cache_get(cache_key)
+        candidates = None
+        if completion is None:
+            if self.rate_limiter is not None:
+                with span("llm.rate_limit", "llm"):
+                    await self.rate_limiter.acquire()
+            parser = self._section_parser(module_type, kwargs) if n == 1 else None
+            with span("llm.chat_completion", "llm", model=self.model_name, stream=parser is not None, n=n):
+                if n > 1:
+                    candidates = await self._asample(messages, n, kwargs)
+                    completion = self._vote(candidates, module_type, kwargs)
+                elif parser is not None:
+                    await self.llm.astream(messages, parser.feed, **kwargs)
+                    completion = parser.text
+                else:
+                    output = await self.llm.acall(messages, **kwargs)
+                    completion = output["response"].choices[0].message.content
+            self._cache_put(cache_key, completion)
+        return self._finalize_completion(messages, completion, candidates)
+
     def update_parameters(
         self,
         temperature: float | None = None,
@@ -212,14 +439,36 @@ class BaselineAgent(BaseAgent):
         structured_output: Optional[Dict[str, str]] = field(default_factory=dict)
         long_term_memory_len: int = 10
 
+        cache_path: str = ""  # completion cache is disabled if empty
+        cache_max_size_mb: int = 1024
+        prompt_caching: bool = False  # mark static prompt prefixes as cacheable on the provider side
+        memory_capacities: Dict[str, int] = field(default_factory=dict)  # per-key ring buffer sizes
+        embedding_provider: str = "openai"  # openai, local (sentence-transformers on CPU) or hashing
+        embedding_model: str = ""  # provider default if empty
+        compress_conversation_log: bool = False  # gzip each record of conversations.jsonl
+        max_prompt_tokens: int = 0  # 0: context window of the model minus its output budget, < 0: no budgeting
+        local_batch_size: int = 0  # > 1: coalesce concurrent requests to a local server into batches of up to this size
+        local_batch_wait_ms: float = 5.0  # how long a batch waits for more requests
+        streaming: bool = False  # stream completions and stop once the sections below are complete
+        stream_stop_sections: Dict[str, List[str]] = field(
+            default_factory=lambda: {"action_inference": ["action"]}
+        )  # module -> sections after which the generation is cancelled
+        action_candidates: int = 1  # > 1: sample this many action_inference responses and vote on their actions
+
     cfg: Config
 
     def configure(self):
         self.prompt_path = self.cfg.prompt_path
+        self.prompt_registry = get_prompt_registry(self.prompt_path)
         self.long_term_memory_len = self.cfg.long_term_memory_len
 
-        self.memory = GenericMemory(path=self.cfg.log_path)
-        self.skill_manager = SkillManager(path=self.cfg.log_path)
+        embedding_provider = get_embedding_provider(self.cfg.embedding_provider, self.cfg.embedding_model)
+        self.memory = GenericMemory(
+            path=self.cfg.log_path,
+            capacities=dict(self.cfg.memory_capacities),
+            embedding_provider=embedding_provider,
+        )
+        self.skill_manager = SkillManager(path=self.cfg.log_path, embedding_provider=embedding_provider)
         
         self.modality = self.cfg.prompt_path.split('.')[-1]
         self.agent_type = self.cfg.agent_type
@@ -238,6 +487,17 @@ class BaselineAgent(BaseAgent):
             
         self.last_module = ""
 
+    def _setup_model(self):
+        super()._setup_model()
+        self.context_budget = None
+        if self.cfg.max_prompt_tokens >= 0:
+            # local models share the tokenizer (and count cache) the LLM already loaded
+            self.context_budget = ContextBudget.for_model(
+                self.model_name,
+                self.cfg.max_prompt_tokens,
+                counter=self.llm.token_counter if isinstance(self.llm, LocalBase) else None,
+            )
+
     def set_env_interface(self, env):
         self.env = env
 
@@ -268,9 +528,12 @@ class BaselineAgent(BaseAgent):
         if self.process_state and self.toolset is not None:
             try:
                 from mcp_game_servers.pokemon_red.game.utils.pokemon_tools import process_state_tool
+                # dialog the runner's policy tier advanced through since the agent's last turn
+                self.memory.dialog_buffer.extend(getattr(obs, 'dialog_buffer', None) or [])
                 text_obs, self.memory.state_dict, self.memory.map_memory_dict, self.memory.step_count, self.memory.dialog_buffer = process_state_tool(
                     self.env, self.toolset, self.memory.map_memory_dict,
                     self.memory.step_count, self.memory.dialog_buffer, text_obs,
+                    state_dict=getattr(obs, 'state_dict', None),
                 )
                 obs.set_text(text_obs)
             except ImportError:
@@ -279,7 +542,8 @@ class BaselineAgent(BaseAgent):
         # Update observation to memory
         self.memory.add("observation", text_obs)
         if image_obs is not None:
-            self.memory.add("image", image_obs)
+            # encode once per step; every module reuses the same encoded bytes
+            self.memory.add("image", EncodedImage.from_pil(image_obs, format="PNG"))
 
         for module in self.agent_modules:
             self.local_memory = agent_get_local_memory(self, game_info)
@@ -295,7 +559,8 @@ class BaselineAgent(BaseAgent):
                     structured_output_kwargs.update({"guided_json": json_schema})
                     structured_output_kwargs.update({"output_keys": self.structured_output[module]["output_keys"]})
 
-            action = self.module2func(module)(**structured_output_kwargs)
+            with span(f"agent.{module}", "agent"):
+                action = self.module2func(module)(**structured_output_kwargs)
             self.last_module = module
 
         return str(action)
@@ -308,7 +573,7 @@ class BaselineAgent(BaseAgent):
 
         images = {k: self.local_memory[k] for k in ("cur_image", "prev_image") if k in self.local_memory}
 
-        response = self.chat_completion(system_prompt, user_prompt, images=images, **kwargs)
+        response = self.chat_completion(system_prompt, user_prompt, images=images, module_type="self_reflection", **kwargs)
 
         if "guided_json" in kwargs:
             output = json.loads(response)
@@ -331,7 +596,7 @@ class BaselineAgent(BaseAgent):
 
         images = {k: self.local_memory[k] for k in ("cur_image", "prev_image") if k in self.local_memory}
 
-        response = self.chat_completion(system_prompt, user_prompt, images=images, **kwargs)
+        response = self.chat_completion(system_prompt, user_prompt, images=images, module_type="subtask_planning", **kwargs)
 
         if "guided_json" in kwargs:
             output = json.loads(response)
@@ -348,7 +613,7 @@ class BaselineAgent(BaseAgent):
         system_prompt, user_prompt = get_module_prompts(
             self, False, "knowledge_retrieval_system", "knowledge_retrieval_user")
 
-        response = self.chat_completion(system_prompt, user_prompt)
+        response = self.chat_completion(system_prompt, user_prompt, module_type="knowledge_retrieval")
 
         if "guided_json" in kwargs:
             output = json.loads(response)
@@ -369,7 +634,7 @@ class BaselineAgent(BaseAgent):
         # add new skills if the "previous" subtask succeeds
         # TODO: to handle general prefixs
         if "true" in str(self.local_memory.get("success", "")).lower(): # FIXME: "success" prefix should be from self_reflection
-            response = self.chat_completion(system_prompt, user_prompt)
+            response = self.chat_completion(system_prompt, user_prompt, module_type="skill_management")
             output = parse_module_response(response, "skill_management")
             agent_update_memory(self, output)
 
@@ -389,7 +654,7 @@ class BaselineAgent(BaseAgent):
         if system_prompt is None and user_prompt is None:
             return
 
-        response = self.chat_completion(system_prompt, user_prompt)
+        response = self.chat_completion(system_prompt, user_prompt, module_type="long_term_management")
         output = parse_module_response(response, "long_term_management")
         agent_update_memory(self, output)
 
@@ -407,7 +672,7 @@ class BaselineAgent(BaseAgent):
         
         images = {k: self.local_memory[k] for k in ("cur_image", "prev_image") if k in self.local_memory}
 
-        response = self.chat_completion(system_prompt, user_prompt, images=images, **kwargs)
+        response = self.chat_completion(system_prompt, user_prompt, images=images, module_type="action_inference", **kwargs)
 
         if "guided_json" in kwargs:
             output = json.loads(response)
@@ -427,7 +692,7 @@ class BaselineAgent(BaseAgent):
 
         images = {k: self.local_memory[k] for k in ("cur_image", "prev_image") if k in self.local_memory}
 
-        response = self.chat_completion(system_prompt, user_prompt, images=images, **kwargs)
+        response = self.chat_completion(system_prompt, user_prompt, images=images, module_type="history_summarization", **kwargs)
 
         if "guided_json" in kwargs:
             output = json.loads(response)
@@ -439,8 +704,8 @@ class BaselineAgent(BaseAgent):
             if key not in output:
                 output[key] = None
 
-        action_memory = self.memory.get_all('action')
-        output['short_term_summary'] += f"\nExecuted Action Sequence: (oldest)[{'->'.join(map(str, action_memory[-self.memory.num_action_buffer:]))}](latest)" if action_memory else None
+        action_memory = self.memory.get_recent('action', self.memory.num_action_buffer)
+        output['short_term_summary'] += f"\nExecuted Action Sequence: (oldest)[{'->'.join(map(str, action_memory))}](latest)" if action_memory else None
 
         agent_update_memory(self, output)
 
@@ -484,9 +749,7 @@ class BaselineAgent(BaseAgent):
                     # Lazy import pokemon tools only when needed
                     from mcp_game_servers.pokemon_red.game.utils.memory_manager import extract_memory_entries
                     memory_entries = extract_memory_entries(self.memory.get_last('self_reflection'))
-                
-                    for entry in memory_entries:
-                        self.memory.add_long_term_memory(entry, similarity_threshold=0.2)
+                    self.memory.add_long_term_memories(memory_entries or [])
                 except ImportError:
                     print("Pokemon Red tools not available")
                     pass
@@ -504,7 +767,7 @@ class BaselineAgent(BaseAgent):
         if query is None:
             print("Query could not be built.")
 
-        memory_snippets = self.memory.retrieve_long_term_memory(query, similarity_threshold=0.4)
+        memory_snippets = self.memory.retrieve_long_term_memory(query)
 
         self.memory.add('relevant_memory', memory_snippets or None)
 
@@ -560,14 +823,16 @@ class BaselineAgent(BaseAgent):
         lessons = self.memory.get_last('lessons_learned')
         if lessons and lessons != "Not Provided":
             lessons_list = lessons.split('\n')
+            lesson_texts = []
             for lesson in lessons_list:
                 lesson = lesson.strip()
                 lesson_match = re.match(r"^\s*[-*]\s*(.*)", lesson)
                 if lesson_match:
                     lesson_text = lesson_match.group(1).strip()
                     if lesson_text:
-                        self.memory.add_long_term_memory(lesson_text, similarity_threshold=0.2)
+                        lesson_texts.append(lesson_text)
                 elif lesson:
-                    self.memory.add_long_term_memory(lesson, similarity_threshold=0.2)
+                    lesson_texts.append(lesson)
+            self.memory.add_long_term_memories(lesson_texts)
 
         return final_action
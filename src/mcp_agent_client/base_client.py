@@ -8,9 +8,9 @@ from typing import List, Tuple
 from contextlib import AsyncExitStack
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
-import base64
-from PIL import Image
-from io import BytesIO
+
+from mcp_game_servers.utils.tracing import span
+from mcp_game_servers.utils.types.encoded_image import EncodedImage
 
 
 logger = logging.getLogger(__name__)
@@ -82,13 +82,6 @@ class MCPAgentClient:
             'write': write
         }
 
-    def str2image(self, img_str):
-        img_data = base64.b64decode(img_str)
-        loaded_image = Image.open(BytesIO(img_data))
-        image = loaded_image.copy()
-        loaded_image.close()
-        return image
-
     def _parse_server_response(self, result, return_payload=False):
         try:
             payload = []
@@ -103,6 +96,10 @@ class MCPAgentClient:
         except Exception as e:
             print("Error processing response:", e)
 
+    async def _call_tool(self, server_id: str, name: str, arguments: dict = None):
+        with span(f"mcp.{name}", "mcp", server=server_id):
+            return await self.sessions[server_id]['session'].call_tool(name, arguments)
+
     def _get_payload(self, result):
         return json.loads(self._parse_server_response(result, return_payload=True)[0])
 
@@ -127,22 +124,67 @@ class MCPAgentClient:
         if server_id not in self.sessions:
             raise ValueError(f"Server {server_id} is not connected")
         
-        result = await self.sessions[server_id]['session'].call_tool("load-obs", None)
+        result = await self._call_tool(server_id, "load-obs", None)
+        payload = self._get_payload(result)
+        obs_image = None
+        if payload.get("obs_image_handle") is not None:
+            obs_image = EncodedImage.from_handle(payload["obs_image_handle"], payload["obs_image_mime_type"], payload["obs_image_sha256"])
+        elif payload["obs_image_str"] != "":
+            obs_image = EncodedImage.from_base64(payload["obs_image_str"], payload["obs_image_mime_type"], payload["obs_image_sha256"])
+        return payload["obs_str"], obs_image, payload["game_info"]
+
+    async def call_load_obs_payload(self, server_id: str) -> dict:
+        """Returns the raw load-obs payload, to be forwarded to step-agent-modules as-is."""
+        if server_id not in self.sessions:
+            raise ValueError(f"Server {server_id} is not connected")
+
+        result = await self._call_tool(server_id, "load-obs", None)
+        return self._get_payload(result)
+
+    async def call_dispatch_and_observe(self, action_str: str, server_id: str) -> Tuple[int, bool, dict]:
+        if server_id not in self.sessions:
+            raise ValueError(f"Server {server_id} is not connected")
+
+        result = await self._call_tool(server_id, "dispatch-and-observe", {"action_str": action_str})
+        payload = self._get_payload(result)
+        return payload["score"], payload["is_finished"], payload["obs"]
+
+    async def call_step_agent_modules(self, server_id: str, response: str = None, structured_output_kwargs: dict = None, obs: dict = None) -> dict:
+        if server_id not in self.sessions:
+            raise ValueError(f"Server {server_id} is not connected")
+
+        arguments = {}
+        if obs is not None:
+            arguments["obs"] = obs
+        else:
+            arguments.update({"response": response, "structured_output_kwargs": structured_output_kwargs or {}})
+        result = await self._call_tool(server_id, "step-agent-modules", arguments)
         payload = self._get_payload(result)
-        return payload["obs_str"], payload["obs_image_str"], payload["game_info"]
+        if not payload["done"]:
+            payload["images"] = {k: EncodedImage.from_dict(v) for k, v in payload["images"].items()}
+        return payload
 
-    async def call_add_observation_to_memory(self, obs_str: str, obs_image_str: str, server_id: str):
+    async def call_add_observation_to_memory(self, obs_str: str, obs_image: EncodedImage, server_id: str):
         if server_id not in self.sessions:
             raise ValueError(f"Server {server_id} is not connected")
         
-        result = await self.sessions[server_id]['session'].call_tool("add-observation-to-memory", {"obs_str": obs_str, "obs_image_str": obs_image_str})
+        arguments = {"obs_str": obs_str, "obs_image_str": ""}
+        if obs_image is not None:
+            image = obs_image.to_dict()
+            arguments.update({
+                "obs_image_str": image.get("data", ""),
+                "obs_image_mime_type": image["mime_type"],
+                "obs_image_sha256": image["sha256"],
+                "obs_image_handle": image.get("handle", None),
+            })
+        result = await self._call_tool(server_id, "add-observation-to-memory", arguments)
         self._parse_server_response(result)
 
     async def call_dispatch_final_action(self, action_str: str, server_id: str) -> Tuple[int, bool]:
         if server_id not in self.sessions:
             raise ValueError(f"Server {server_id} is not connected")
             
-        result = await self.sessions[server_id]['session'].call_tool("dispatch-final-action", {"action_str": action_str})
+        result = await self._call_tool(server_id, "dispatch-final-action", {"action_str": action_str})
         payload = self._get_payload(result)
         return payload["score"], payload["is_finished"]
 
@@ -150,7 +192,7 @@ class MCPAgentClient:
         if server_id not in self.sessions:
             raise ValueError(f"Server {server_id} is not connected")
             
-        result = await self.sessions[server_id]['session'].call_tool("list-agent-module-type", None)
+        result = await self._call_tool(server_id, "list-agent-module-type", None)
         payloads = self._parse_server_response(result, return_payload=True)
         return payloads[0] if payloads else ""
 
@@ -158,16 +200,16 @@ class MCPAgentClient:
         if server_id not in self.sessions:
             raise ValueError(f"Server {server_id} is not connected")
             
-        result = await self.sessions[server_id]['session'].call_tool("get-agent-module-prompts", {"module_type": module_type, "game_info": game_info})
+        result = await self._call_tool(server_id, "get-agent-module-prompts", {"module_type": module_type, "game_info": game_info})
         payload = self._get_payload(result)
-        images = {k: self.str2image(v) for k, v in payload["image_strs"].items()}
+        images = {k: EncodedImage.from_dict(v) for k, v in payload["images"].items()}
         return payload["system_prompt"], payload["user_prompt"], images, payload["call_chat_completion"]
 
     async def call_send_agent_module_response(self, response: str, server_id: str, structured_output_kwargs: dict) -> dict:
         if server_id not in self.sessions:
             raise ValueError(f"Server {server_id} is not connected")
             
-        result = await self.sessions[server_id]['session'].call_tool("send-agent-module-response", {"response": response, "structured_output_kwargs": structured_output_kwargs})
+        result = await self._call_tool(server_id, "send-agent-module-response", {"response": response, "structured_output_kwargs": structured_output_kwargs})
         payload = self._get_payload(result)
         return payload["parsed_output"]
 
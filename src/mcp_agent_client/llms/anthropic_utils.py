@@ -8,8 +8,10 @@ for type_name in collections.abc.__all__:
 
 import os
 import logging
+import weakref
+from typing import Callable, Tuple
 
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
 from anthropic.types import Message as AnthropicMessage
 from openai.types.chat.chat_completion import (
     ChatCompletion as OpenAIChatCompletion,
@@ -23,6 +25,10 @@ from openai.types.chat.chat_completion import (
 )
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 
+from mcp_game_servers.utils.types.encoded_image import parse_data_url
+
+from .utils import get_async_http_client, get_loop_local
+
 logger = logging.getLogger(__name__)
 
 # Message(id='msg_01VjSSR3zifDHfwgfFUmk7oa',
@@ -52,6 +58,19 @@ except Exception as e:
     print(f"Exception occurred while setting up Anthropic client: {e}")
     client = None
 
+async_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncAnthropic
+
+
+def get_async_client() -> AsyncAnthropic | None:
+    try:
+        return get_loop_local(
+            async_clients,
+            lambda: AsyncAnthropic(api_key=setup_anthropic(), http_client=get_async_http_client()),
+        )
+    except Exception as e:
+        print(f"Exception occurred while setting up AsyncAnthropic client: {e}")
+        return None
+
 
 def port_to_openai(response: AnthropicMessage) -> OpenAIChatCompletion:
     openai_choices = []
@@ -76,27 +95,46 @@ def port_to_openai(response: AnthropicMessage) -> OpenAIChatCompletion:
         created=int(time.time()),
         model=response.model,
         object="chat.completion",
-        usage=OpenAICompletionUsage(
-            completion_tokens=response.usage.input_tokens,
-            prompt_tokens=response.usage.output_tokens,
-            total_tokens=(
-                response.usage.input_tokens + response.usage.output_tokens
-            ),
-        ),
+        usage=port_usage_to_openai(response.usage),
     )
     return openai_response
 
 
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(5))
-def chat_completion_request(
-    messages, model: str = "gpt-3.5-turbo-0613", **kwargs
-) -> OpenAIChatCompletion | None:
+def port_usage_to_openai(usage) -> OpenAICompletionUsage:
+    # anthropic reports cached input separately from input_tokens, while openai
+    # counts it in prompt_tokens and breaks out the cached part in prompt_tokens_details
+    cache_read_tokens = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write_tokens = getattr(usage, "cache_creation_input_tokens", None) or 0
+    prompt_tokens = usage.input_tokens + cache_read_tokens + cache_write_tokens
+    return OpenAICompletionUsage(
+        completion_tokens=usage.output_tokens,
+        prompt_tokens=prompt_tokens,
+        total_tokens=prompt_tokens + usage.output_tokens,
+        prompt_tokens_details={"cached_tokens": cache_read_tokens},
+        cache_creation_input_tokens=cache_write_tokens,
+    )
+
+
+def _build_json_data(messages, model: str = "gpt-3.5-turbo-0613", **kwargs) -> dict:
     json_data = {"model": model, "messages": messages}
     # recap message for anthropic
     claude_messages = []
     for msg in messages:
         if msg["role"] == "system":
-            json_data.update({"system": msg["content"]})
+            if isinstance(msg["content"], list):
+                # text parts, the static one marked as a cache breakpoint by the agent
+                json_data.update({"system": msg["content"]})
+            elif kwargs.get("prompt_caching", False):
+                # a plain system prompt has no known dynamic part, so cache it whole
+                json_data.update({
+                    "system": [{
+                        "type": "text",
+                        "text": msg["content"],
+                        "cache_control": {"type": "ephemeral"},
+                    }]
+                })
+            else:
+                json_data.update({"system": msg["content"]})
         else:
             if isinstance(msg["content"], str):
                 new_packet = {"role": msg["role"], "content": msg["content"]}
@@ -107,13 +145,14 @@ def chat_completion_request(
                     if content["type"] == "text":
                         new_content.append(content)
                     elif content["type"] == "image_url":
+                        media_type, data = parse_data_url(content["image_url"]["url"])
                         new_content.append(
                             {
                                 "type": "image",
                                 "source": {
                                     "type": "base64",
-                                    "media_type": "image/png",
-                                    "data": content["image_url"]["url"][len("data:image/png;base64,"):]
+                                    "media_type": media_type,
+                                    "data": data,
                                 }
                             }
                         )
@@ -144,6 +183,15 @@ def chat_completion_request(
         else:
             json_data.update({"stream": True})
 
+    return json_data
+
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(5))
+def chat_completion_request(
+    messages, model: str = "gpt-3.5-turbo-0613", **kwargs
+) -> OpenAIChatCompletion | None:
+    json_data = _build_json_data(messages, model, **kwargs)
+
     try:
         response = client.messages.create(**json_data)
         return port_to_openai(response)
@@ -153,6 +201,76 @@ def chat_completion_request(
         raise e
 
 
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(5))
+async def achat_completion_request(
+    messages, model: str = "gpt-3.5-turbo-0613", **kwargs
+) -> OpenAIChatCompletion | None:
+    json_data = _build_json_data(messages, model, **kwargs)
+
+    try:
+        response = await get_async_client().messages.create(**json_data)
+        return port_to_openai(response)
+    except Exception as e:
+        logger.info("Unable to generate ChatCompletion response")
+        logger.info(f"Exception: {e}")
+        raise e
+
+
+def _stream_usage(message_usage, output_tokens) -> OpenAICompletionUsage | None:
+    # output tokens are reported with the final message_delta event, which a cancelled stream never gets
+    if message_usage is None or output_tokens is None:
+        return None
+    message_usage.output_tokens = output_tokens
+    return port_usage_to_openai(message_usage)
+
+
+def chat_completion_stream_request(
+    messages, on_delta: Callable[[str], bool], model: str = "gpt-3.5-turbo-0613", **kwargs
+) -> Tuple[str, OpenAICompletionUsage | None]:
+    """Streams a response to `on_delta` until it returns True; see openai_utils.chat_completion_stream_request."""
+    json_data = _build_json_data(messages, model, **kwargs)
+    json_data.update({"stream": True})
+
+    text, message_usage, output_tokens = [], None, None
+    stream = client.messages.create(**json_data)
+    try:
+        for event in stream:
+            if event.type == "message_start":
+                message_usage = event.message.usage
+            elif event.type == "message_delta":
+                output_tokens = event.usage.output_tokens
+            elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                text.append(event.delta.text)
+                if on_delta(event.delta.text):
+                    break
+    finally:
+        stream.close()
+    return "".join(text), _stream_usage(message_usage, output_tokens)
+
+
+async def achat_completion_stream_request(
+    messages, on_delta: Callable[[str], bool], model: str = "gpt-3.5-turbo-0613", **kwargs
+) -> Tuple[str, OpenAICompletionUsage | None]:
+    json_data = _build_json_data(messages, model, **kwargs)
+    json_data.update({"stream": True})
+
+    text, message_usage, output_tokens = [], None, None
+    stream = await get_async_client().messages.create(**json_data)
+    try:
+        async for event in stream:
+            if event.type == "message_start":
+                message_usage = event.message.usage
+            elif event.type == "message_delta":
+                output_tokens = event.usage.output_tokens
+            elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                text.append(event.delta.text)
+                if on_delta(event.delta.text):
+                    break
+    finally:
+        await stream.close()
+    return "".join(text), _stream_usage(message_usage, output_tokens)
+
+
 if __name__ == "__main__":
     # api test
     messages = [
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import weakref
+from typing import Dict, List, Optional, Set, Tuple
+
+from openai import AsyncOpenAI
+from openai.types import Completion, CompletionUsage
+from tenacity import retry, stop_after_attempt, wait_random_exponential
+
+from mcp_agent_servers.context_budget import TokenCounter
+
+from .openai_utils import _build_completion_json_data
+from .utils import get_loop_local
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionBatcher:
+    """
+    Coalesces concurrent completion requests to one OpenAI-compatible server.
+
+    Requests submitted within `max_wait_ms` of each other with identical
+    parameters (model, sampling settings, guided decoding schema) are sent as a
+    single `/v1/completions` request with a list of prompts, so a local vLLM
+    server receives them together instead of one at a time. Choices are routed
+    back to each request by their index. The server reports usage for the whole
+    batch only; its prompt and completion tokens are attributed to the requests in
+    proportion to their prompt and completion texts as counted by `token_counter`
+    (evenly without one), so the usage of each request is an estimate whose sum
+    over the batch matches the server's.
+    """
+
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        token_counter: Optional[TokenCounter] = None,
+    ):
+        self.client = client
+        self.token_counter = token_counter
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.num_requests = 0
+        self.num_batches = 0
+
+        # parameter key -> [(prompt, future)]
+        self._pending: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _spawn(self, coro) -> None:
+        # keep a reference so that the task is not garbage collected while running
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def submit(self, prompt: str, model: str, **kwargs) -> Completion:
+        json_data = _build_completion_json_data(prompt, model, **kwargs)
+        del json_data["prompt"]
+        key = json.dumps(json_data, sort_keys=True, default=str)
+
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append((prompt, future))
+        if len(pending) == 1:
+            self._spawn(self._flush_later(key, json_data, pending))
+        if len(pending) >= self.max_batch_size:
+            self._flush(key, json_data)
+        return await future
+
+    async def _flush_later(self, key: str, json_data: dict, pending: list) -> None:
+        await asyncio.sleep(self.max_wait_ms / 1000)
+        # the batch may already have been sent because it filled up
+        if self._pending.get(key) is pending:
+            self._flush(key, json_data)
+
+    def _flush(self, key: str, json_data: dict) -> None:
+        requests = self._pending.pop(key, [])
+        if requests:
+            self._spawn(self._send(requests, json_data))
+
+    @retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(5))
+    async def _create(self, prompts: List[str], json_data: dict) -> Completion:
+        return await self.client.completions.create(prompt=prompts, **json_data)
+
+    async def _send(self, requests: List[Tuple[str, asyncio.Future]], json_data: dict) -> None:
+        self.num_requests += len(requests)
+        self.num_batches += 1
+        try:
+            response = await self._create([prompt for prompt, _ in requests], json_data)
+        except Exception as e:
+            print("Unable to generate Completion response")
+            print(f"Exception: {e}")
+            for _, future in requests:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        n = json_data.get("n", 1)
+        choices = [
+            [
+                choice.model_copy(update={"index": choice.index - i * n})
+                for choice in response.choices
+                if i * n <= choice.index < (i + 1) * n
+            ]
+            for i in range(len(requests))
+        ]
+        usages = self._split_usage(
+            response.usage,
+            [prompt for prompt, _ in requests],
+            [[choice.text for choice in request_choices] for request_choices in choices],
+        )
+        for (_, future), request_choices, usage in zip(requests, choices, usages):
+            if not future.done():
+                future.set_result(response.model_copy(update={"choices": request_choices, "usage": usage}))
+
+    def _count(self, text: str) -> int:
+        return self.token_counter.count(text) if self.token_counter is not None else 0
+
+    def _split_usage(
+        self, usage: CompletionUsage | None, prompts: List[str], completions: List[List[str]]
+    ) -> List[CompletionUsage | None]:
+        if usage is None:
+            return [None] * len(prompts)
+        prompt_tokens = _apportion(usage.prompt_tokens, [self._count(prompt) for prompt in prompts])
+        completion_tokens = _apportion(
+            usage.completion_tokens, [sum(self._count(text) for text in texts) for texts in completions]
+        )
+        return [
+            CompletionUsage(prompt_tokens=p, completion_tokens=c, total_tokens=p + c)
+            for p, c in zip(prompt_tokens, completion_tokens)
+        ]
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.num_requests / max(1, self.num_batches)
+
+
+# event loop -> (api_base_url, api_key) -> batcher, the pending requests and clients are bound to the loop
+def _apportion(total: int, weights: List[int]) -> List[int]:
+    """Splits `total` in proportion to `weights` (evenly if they are all 0) into integers that add up to it."""
+    if sum(weights) == 0:
+        weights = [1] * len(weights)
+    scale = sum(weights)
+    parts = [total * weight // scale for weight in weights]
+    # the rounding remainder goes to the largest fractional parts
+    order = sorted(range(len(weights)), key=lambda i: total * weights[i] % scale, reverse=True)
+    for i in order[:total - sum(parts)]:
+        parts[i] += 1
+    return parts
+
+
+_BATCHERS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], CompletionBatcher]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_completion_batcher(
+    client: AsyncOpenAI,
+    api_base_url: str,
+    max_batch_size: int = 32,
+    max_wait_ms: float = 5.0,
+    token_counter: Optional[TokenCounter] = None,
+) -> CompletionBatcher:
+    """Returns the batcher of `api_base_url`, shared by every agent on the running event loop."""
+    batchers = get_loop_local(_BATCHERS, dict)
+    key = (api_base_url, str(client.api_key))
+    if key not in batchers:
+        batchers[key] = CompletionBatcher(
+            client, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, token_counter=token_counter
+        )
+        logger.info(f"Batching completion requests to {api_base_url} (max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms})")
+    return batchers[key]
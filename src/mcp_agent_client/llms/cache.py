@@ -0,0 +1,132 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Union
+
+from PIL import Image
+
+from mcp_game_servers.utils.types.encoded_image import EncodedImage
+
+logger = logging.getLogger(__name__)
+
+
+def hash_image(image: Union[Image.Image, EncodedImage]) -> str:
+    """Hashes the content of an image, reusing the hash carried by encoded images."""
+    if isinstance(image, EncodedImage):
+        return image.sha256
+    h = hashlib.sha256()
+    h.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode("utf-8"))
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+class CompletionCache:
+    """
+    Content-addressed, on-disk cache of LLM completions.
+
+    Each entry is stored as `{path}/{key[:2]}/{key}.json`, where `key` is the
+    SHA-256 of the request. Entries are evicted in least-recently-used order
+    once the total size on disk exceeds `max_size_bytes`.
+    """
+
+    def __init__(self, path: str, max_size_bytes: int = 1024 * 1024 * 1024):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+
+        # key -> (size in bytes, last access time)
+        self._index: Dict[str, tuple] = {}
+        self._total_size = 0
+
+        os.makedirs(self.path, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self) -> None:
+        for shard in os.listdir(self.path):
+            shard_path = os.path.join(self.path, shard)
+            if not os.path.isdir(shard_path):
+                continue
+            for filename in os.listdir(shard_path):
+                if not filename.endswith(".json"):
+                    continue
+                stat = os.stat(os.path.join(shard_path, filename))
+                self._index[filename[:-len(".json")]] = (stat.st_size, stat.st_mtime)
+                self._total_size += stat.st_size
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.json")
+
+    def make_key(
+        self,
+        model: str,
+        system_prompt: Any,
+        user_prompt: Any,
+        image_hashes: Optional[Dict[str, str]] = None,
+        **params,
+    ) -> str:
+        request = {
+            "model": model,
+            "system_prompt": system_prompt,
+            "user_prompt": user_prompt,
+            "image_hashes": image_hashes or {},
+            "params": params,
+        }
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        now = time.time()
+        try:
+            os.utime(entry_path, (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            if key in self._index:
+                self._index[key] = (self._index[key][0], now)
+        return entry["completion"]
+
+    def put(self, key: str, completion: str, model: str = "") -> None:
+        if completion is None:
+            return
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+        # write to a temporary file first so that concurrent readers never see partial entries
+        tmp_path = f"{entry_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": model, "completion": completion}, f, ensure_ascii=False)
+        os.replace(tmp_path, entry_path)
+
+        size = os.path.getsize(entry_path)
+        with self._lock:
+            if key in self._index:
+                self._total_size -= self._index[key][0]
+            self._index[key] = (size, time.time())
+            self._total_size += size
+            if self._total_size > self.max_size_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # evict down to 90% of the budget so that eviction does not run on every put
+        target_size = int(self.max_size_bytes * 0.9)
+        for key, (size, _) in sorted(self._index.items(), key=lambda x: x[1][1]):
+            if self._total_size <= target_size:
+                break
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+            del self._index[key]
+            self._total_size -= size
+        logger.info(f"Completion cache evicted to {self._total_size} bytes ({len(self._index)} entries)")
@@ -0,0 +1,199 @@
+import atexit
+import bisect
+import gzip
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LOG_NAME = "conversations.jsonl"
+INDEX_NAME = "conversations.idx"
+
+# byte offset and length of a record in the log, and the step it was logged at
+INDEX_ENTRY = struct.Struct("<QII")
+
+
+class ConversationLog:
+    """
+    Append-only log of the LLM conversations of an episode.
+
+    Every logged conversation becomes one JSON line of `{path}/conversations.jsonl`
+    (or, with `compress`, one gzip member of `conversations.jsonl.gz`, so the file
+    still reads as plain JSONL through `zcat` or `gzip.open`). Records are
+    serialized and written in batches on a background thread, and each one gets a
+    fixed-size entry in `conversations.idx` so that readers can seek to any record
+    or step without parsing the log. `flush(sync=True)` fsyncs both files and is
+    called at episode boundaries.
+
+    Logged messages are serialized later on the writer thread and must not be
+    modified by the caller afterwards.
+    """
+
+    def __init__(self, path: str, compress: bool = False, batch_size: int = 64):
+        self.path = path
+        self.compress = compress
+        self.batch_size = batch_size
+        self.num_records = 0
+
+        os.makedirs(self.path, exist_ok=True)
+        log_file = os.path.join(self.path, LOG_NAME + (".gz" if compress else ""))
+        self._log_file = open(log_file, "ab")
+        self._index_file = open(os.path.join(self.path, INDEX_NAME), "ab")
+        self._offset = self._log_file.tell()
+
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="conversation-log", daemon=True)
+        self._thread.start()
+
+    def log(self, messages: List[dict], step: int = 0, **fields) -> None:
+        if self._closed:
+            raise ValueError(f"Conversation log {self.path} is closed")
+        record = {"step": step, "time": time.time(), **fields, "messages": messages}
+        self._queue.put(("record", record))
+
+    def flush(self, sync: bool = False) -> None:
+        """Blocks until every record logged so far is written (and fsynced if `sync`)."""
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(("flush", (done, sync)))
+        done.wait()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.flush(sync=True)
+        self._closed = True
+        self._queue.put(("close", None))
+        self._thread.join()
+        self._log_file.close()
+        self._index_file.close()
+
+    def _encode(self, record: dict) -> bytes:
+        line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        if self.compress:
+            return gzip.compress(line, compresslevel=6)
+        return line
+
+    def _write(self, records: List[dict]) -> None:
+        chunks, entries = [], []
+        for record in records:
+            chunk = self._encode(record)
+            chunks.append(chunk)
+            entries.append(INDEX_ENTRY.pack(self._offset, len(chunk), max(0, record["step"])))
+            self._offset += len(chunk)
+
+        # the log is flushed before the index, so an indexed record is always readable
+        self._log_file.write(b"".join(chunks))
+        self._log_file.flush()
+        self._index_file.write(b"".join(entries))
+        self._index_file.flush()
+        self.num_records += len(records)
+
+    def _sync(self) -> None:
+        os.fsync(self._log_file.fileno())
+        os.fsync(self._index_file.fileno())
+
+    def _run(self) -> None:
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            records = []
+            for kind, item in items:
+                if kind == "record":
+                    records.append(item)
+                    continue
+
+                # write everything queued before the marker first
+                try:
+                    if records:
+                        self._write(records)
+                        records = []
+                    if kind == "flush" and item[1]:
+                        self._sync()
+                except Exception as e:
+                    logger.error(f"Failed to write conversation log {self.path}: {e}")
+                if kind == "close":
+                    return
+                item[0].set()
+
+            if records:
+                try:
+                    self._write(records)
+                except Exception as e:
+                    logger.error(f"Failed to write conversation log {self.path}: {e}")
+
+
+class ConversationLogReader:
+    """Random access to the records of a conversation log through its index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.compressed = os.path.exists(os.path.join(path, LOG_NAME + ".gz"))
+        self.log_file = os.path.join(path, LOG_NAME + (".gz" if self.compressed else ""))
+        self.index_file = os.path.join(path, INDEX_NAME)
+        self.entries: List[tuple] = []
+        self.refresh()
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, INDEX_NAME))
+
+    def refresh(self) -> None:
+        """Picks up records appended since the index was last read."""
+        with open(self.index_file, "rb") as f:
+            f.seek(len(self.entries) * INDEX_ENTRY.size)
+            data = f.read()
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        self.entries.extend(INDEX_ENTRY.iter_unpack(data[:usable]))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def step_of(self, i: int) -> int:
+        return self.entries[i][2]
+
+    def find_step(self, step: int) -> int:
+        """Index of the first record logged at or after `step`."""
+        steps = [entry[2] for entry in self.entries]
+        return min(bisect.bisect_left(steps, step), len(self.entries) - 1)
+
+    def read(self, i: int) -> dict:
+        offset, length, _ = self.entries[i]
+        with open(self.log_file, "rb") as f:
+            f.seek(offset)
+            chunk = f.read(length)
+        if self.compressed:
+            chunk = gzip.decompress(chunk)
+        return json.loads(chunk)
+
+
+_LOGS: Dict[str, ConversationLog] = {}
+_LOGS_LOCK = threading.Lock()
+
+
+def get_conversation_log(path: str, compress: bool = False) -> ConversationLog:
+    """Returns the log of `path`, shared by every agent of the process that logs there."""
+    key = os.path.abspath(path)
+    with _LOGS_LOCK:
+        if key not in _LOGS or _LOGS[key]._closed:
+            _LOGS[key] = ConversationLog(path, compress=compress)
+        return _LOGS[key]
+
+
+@atexit.register
+def _close_conversation_logs() -> None:
+    for conversation_log in list(_LOGS.values()):
+        conversation_log.close()
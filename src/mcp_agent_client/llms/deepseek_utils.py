@@ -1,8 +1,12 @@
 import os
-from openai import OpenAI
+import asyncio
+import weakref
+from openai import AsyncOpenAI, OpenAI
 from openai.types.chat import ChatCompletion
 import time
 
+from .utils import get_async_http_client, get_loop_local
+
 def setup_deepseek(key_path: str = "src/mcp_agent_servers/keys/deepseek-key/key.env") -> str:
     with open(key_path, "r") as f:
         api_key = f.read().strip()
@@ -18,6 +22,22 @@ except Exception as e:
     print(f"Exception occurred while setting up DeepSeek client: {e}")
     client = None
 
+async_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncOpenAI
+
+def get_async_client() -> AsyncOpenAI | None:
+    try:
+        return get_loop_local(
+            async_clients,
+            lambda: AsyncOpenAI(
+                api_key=setup_deepseek(),
+                base_url="https://api.deepseek.com",
+                http_client=get_async_http_client(),
+            ),
+        )
+    except Exception as e:
+        print(f"Exception occurred while setting up async DeepSeek client: {e}")
+        return None
+
 def chat_completion_request(
     messages,
     model: str = "deepseek-reasoner",
@@ -49,3 +69,37 @@ def chat_completion_request(
             else:
                 print(f"[Error] chat_completion_request failed after {max_retries} attempts.")
                 raise e
+
+
+async def achat_completion_request(
+    messages,
+    model: str = "deepseek-reasoner",
+    temperature: float = 1.0,
+    max_tokens: int = 8192,
+    stop=None,
+    stream: bool = False,
+    **kwargs
+) -> ChatCompletion:
+
+    async_client = get_async_client()
+    max_retries = 10
+    for attempt in range(max_retries):
+        try:
+            response = await async_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=stream,
+                stop=stop,
+                **kwargs
+            )
+            return response
+        except Exception as e:
+            if attempt < max_retries-1:
+                print(f"[Warning] achat_completion_request failed (attempt {attempt+1}), retrying...")
+                await asyncio.sleep(0.5)
+                continue
+            else:
+                print(f"[Error] achat_completion_request failed after {max_retries} attempts.")
+                raise e
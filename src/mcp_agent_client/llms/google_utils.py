@@ -1,12 +1,16 @@
 from typing import List, Dict, Union
 import os
+import asyncio
 import logging
 import base64
+import time
 
 from google.oauth2 import service_account
 from google import genai
 from google.genai import types
 
+from mcp_game_servers.utils.types.encoded_image import parse_data_url
+
 logger = logging.getLogger(__name__)
 
 def setup_gemini(
@@ -141,15 +145,12 @@ class GeminiChatCompletionResponse:
 
 #     return GeminiChatCompletionResponse(text=full_text, role=response_role)
 
-def chat_completion_request(
-    model: str,
+def _build_request(
     messages: List[Dict[str, str]],
     temperature: float = 0.2,
     top_p: float = 0.8,
     max_tokens: int = 1024,
-    stream: bool = False,
-) -> GeminiChatCompletionResponse:
-
+):
     system_prompt = None
     contents = []
 
@@ -174,12 +175,12 @@ def chat_completion_request(
                             )
                         )
                     elif part["type"] == "image_url":
-                        base64_image = part["image_url"]["url"][len("data:image/png;base64,"):]
+                        mime_type, base64_image = parse_data_url(part["image_url"]["url"])
                         image_bytes = base64.b64decode(base64_image)
                         contents.append(
                             types.Content(
                                 role=m["role"],
-                                parts=[types.Part.from_bytes(data=image_bytes, mime_type="image/png")]
+                                parts=[types.Part.from_bytes(data=image_bytes, mime_type=mime_type)]
                             )
                         )
                     else:
@@ -196,6 +197,34 @@ def chat_completion_request(
         safety_settings=[],
         system_instruction=[types.Part(text=system_prompt)],
     )
+    return contents, generate_content_config
+
+
+def _extract_text(response):
+    full_text = ""
+    response_role = ""
+    if hasattr(response, "candidates") and response.candidates:
+        for candidate in response.candidates:
+            if candidate.content.parts:
+                for part in candidate.content.parts:
+                    if hasattr(part, "text") and part.text:
+                        full_text += part.text
+                        response_role = "assistant"
+    return full_text, response_role
+
+
+def chat_completion_request(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float = 0.2,
+    top_p: float = 0.8,
+    max_tokens: int = 1024,
+    stream: bool = False,
+) -> GeminiChatCompletionResponse:
+
+    contents, generate_content_config = _build_request(
+        messages, temperature, top_p, max_tokens
+    )
 
     full_text = ""
     response_role = ""  # default role
@@ -213,27 +242,64 @@ def chat_completion_request(
         max_retries = 10
         for attempt in range(max_retries):
             try:
-                full_text = ""
-                response_role = ""
                 response = client.models.generate_content(
                     model=model,
                     contents=contents,
                     config=generate_content_config,
                 )
-                if hasattr(response, "candidates") and response.candidates:
-                    for candidate in response.candidates:
-                        if candidate.content.parts:
-                            for part in candidate.content.parts:
-                                if hasattr(part, "text") and part.text:
-                                    full_text += part.text
-                                    response_role = "assistant"
+                full_text, response_role = _extract_text(response)
 
                 if full_text and response_role:
                     break
                 print(f"[Retry {attempt+1}] Empty response. Retrying...")
             except Exception as e:
-                import time
                 print(f"[Retry {attempt + 1}] Unexpected error: {e}. Retrying...")
                 time.sleep(2 ** attempt)
 
-    return GeminiChatCompletionResponse(text=full_text, role=response_role)
\ No newline at end of file
+    return GeminiChatCompletionResponse(text=full_text, role=response_role)
+
+
+async def achat_completion_request(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float = 0.2,
+    top_p: float = 0.8,
+    max_tokens: int = 1024,
+    stream: bool = False,
+) -> GeminiChatCompletionResponse:
+
+    contents, generate_content_config = _build_request(
+        messages, temperature, top_p, max_tokens
+    )
+
+    full_text = ""
+    response_role = ""  # default role
+
+    if stream:
+        async for chunk in await client.aio.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=generate_content_config,
+        ):
+            if hasattr(chunk, "text") and chunk.text:
+                full_text += chunk.text
+                response_role = "assistant"
+    else:
+        max_retries = 10
+        for attempt in range(max_retries):
+            try:
+                response = await client.aio.models.generate_content(
+                    model=model,
+                    contents=contents,
+                    config=generate_content_config,
+                )
+                full_text, response_role = _extract_text(response)
+
+                if full_text and response_role:
+                    break
+                print(f"[Retry {attempt+1}] Empty response. Retrying...")
+            except Exception as e:
+                print(f"[Retry {attempt + 1}] Unexpected error: {e}. Retrying...")
+                await asyncio.sleep(2 ** attempt)
+
+    return GeminiChatCompletionResponse(text=full_text, role=response_role)
@@ -1,11 +1,12 @@
 import os
 import logging
+import weakref
 from typing import Any, Dict, Iterable, List, Union
 
 import numpy as np
 import tiktoken
 from anthropic.types import MessageParam
-from openai import OpenAI, Stream
+from openai import AsyncOpenAI, OpenAI, Stream
 from openai.types import Completion as OpenAICompletion
 from openai.types.chat.chat_completion import (
     ChatCompletion as OpenAIChatCompletion,
@@ -20,19 +21,40 @@ from .openai_utils import (
     MoneyManager, 
     chat_completion_request, 
     completion_request,
+    achat_completion_request,
+    acompletion_request,
+    chat_completion_stream_request,
+    achat_completion_stream_request,
+    completion_stream_request,
+    acompletion_stream_request,
+    estimate_usage,
 )
 from .anthropic_utils import (
     chat_completion_request as anthropic_chat_completion_request,
+    achat_completion_request as anthropic_achat_completion_request,
+    chat_completion_stream_request as anthropic_chat_completion_stream_request,
+    achat_completion_stream_request as anthropic_achat_completion_stream_request,
 )
 from .deepseek_utils import (
     chat_completion_request as deepseek_chat_completion_request,
+    achat_completion_request as deepseek_achat_completion_request,
 )
 from .google_utils import (
     chat_completion_request as google_chat_completion_request,
+    achat_completion_request as google_achat_completion_request,
 )
 
-from .utils import CompletionFunc, Message, chat_messages_to_prompt
+from .utils import (
+    CompletionFunc,
+    Message,
+    chat_messages_to_prompt,
+    get_async_http_client,
+    get_loop_local,
+)
 from .constants import llama_chat_template
+from .batching import get_completion_batcher
+
+from mcp_agent_servers.context_budget import TokenCounter, get_max_prompt_tokens, get_token_counter
 
 #os.environ["TRANSFORMERS_CACHE"] = "./loaded_model_info"
 
@@ -44,6 +66,9 @@ def load_model(
     repetition_penalty: float = 0,
     api_key: str = None,
     api_base_url: str = None,
+    prompt_caching: bool = False,
+    local_batch_size: int = 0,
+    local_batch_wait_ms: float = 5.0,
 ) -> Dict[str, Any]:
     if "gpt-3.5" in model:
         default_model = model
@@ -88,6 +113,7 @@ def load_model(
             desired_output_length=output_budget,
             temperature=temperature,
             repetition_penalty=repetition_penalty,
+            prompt_caching=prompt_caching,
         )
         enc = tiktoken.get_encoding("cl100k_base")
     elif model_type == "claude":
@@ -96,6 +122,7 @@ def load_model(
             ctx_manager=ctx_manager,
             desired_output_length=output_budget,
             temperature=temperature,
+            prompt_caching=prompt_caching,
         )
         # DISCLAIMER: This is not compatible with claude, but only used to count the number of tokens
         # As claude-3 can get 1,000,000 tokens as inputs, we do not need to prune the input tokens now.
@@ -128,8 +155,10 @@ def load_model(
             repetition_penalty=repetition_penalty,
             api_key=api_key,
             api_base_url=api_base_url,
+            batch_size=local_batch_size,
+            batch_wait_ms=local_batch_wait_ms,
         )
-        enc = tiktoken.get_encoding("cl100k_base")  # llm.engine.get_tokenizer()
+        enc = llm.tok
     else:
         raise NotImplementedError
 
@@ -140,6 +169,14 @@ def load_model(
         "ctx_manager": ctx_manager,
     }
 
+def _message_text(message: Message) -> str:
+    content = message.get("content")
+    if isinstance(content, list):
+        # text parts only; images are not counted
+        return "".join(part["text"] for part in content if part.get("type") == "text")
+    return content or ""
+
+
 # ChatGPT having tools
 class ChatGPTBase:
     def __init__(
@@ -150,6 +187,7 @@ class ChatGPTBase:
         desired_output_length: int = 512,
         temperature: float = 1.0,
         repetition_penalty: float = 1.0,
+        prompt_caching: bool = False,
     ):
         self.model = model
         self.tool = tool
@@ -174,6 +212,10 @@ class ChatGPTBase:
         self.desired_output_length = desired_output_length
         self.temperature = temperature
         self.repetition_penalty = (repetition_penalty - 1.0,)
+        self.prompt_caching = prompt_caching
+        # the same tokenizer and prompt budget as the agent's context budget
+        self.token_counter = get_token_counter(self.model)
+        self.max_prompt_tokens = get_max_prompt_tokens(self.model)
 
         if "o1" in self.model or "o3" in self.model:
             self.temperature = None
@@ -191,32 +233,19 @@ class ChatGPTBase:
         return message
 
     def manage_length(self, messages: List[Message]) -> None:
-        # TODO: implement this 
-        # last_message = messages[-1]["content"]
-        # if len(messages) > 1:
-        #     previous_tokens_length = 0
-        #     for msg in messages[:-1]:
-        #         if "content" in msg.keys() and msg["content"] is not None:
-        #             previous_tokens_length += len(
-        #                 self.enc.encode(msg["content"])
-        #             )
-        #         elif (
-        #             "function_call" in msg.keys()
-        #             and msg["function_call"] is not None
-        #         ):
-        #             previous_tokens_length += (
-        #                 len(self.enc.encode(msg["function_call"]["arguments"]))
-        #                 + 30
-        #             )
-        # else:
-        #     previous_tokens_length = 0
-        # budget = (
-        #     self.max_budget
-        #     - self.desired_output_length
-        #     - previous_tokens_length
-        # )
-        # messages[-1]["content"] = self.cutoff(last_message, budget)
-        pass
+        # Prompts are already fitted by the agent's context budget, which trims
+        # history and memories first; this only guards the hard context limit.
+        last_message = messages[-1]["content"]
+        if not isinstance(last_message, str):
+            # contains visual input
+            return
+        previous_tokens_length = sum(
+            self.token_counter.count(_message_text(msg)) for msg in messages[:-1]
+        )
+        budget = self.max_prompt_tokens - previous_tokens_length
+        if self.token_counter.count(last_message) > budget:
+            logger.warning(f"Truncating the last message to {budget} tokens to fit the context of {self.model}")
+            messages[-1]["content"] = self.cutoff(last_message, max(0, budget))
 
     def chat(
         self,
@@ -233,6 +262,7 @@ class ChatGPTBase:
                 model=self.model,
                 temperature=self.temperature,
                 frequency_penalty=self.repetition_penalty,
+                prompt_caching=self.prompt_caching,
                 **kwargs,
             )
         else:
@@ -240,6 +270,7 @@ class ChatGPTBase:
                 messages,
                 model=self.model,
                 temperature=self.temperature,
+                prompt_caching=self.prompt_caching,
                 **kwargs,
             )
         self.ctx_manager(response)
@@ -283,6 +314,100 @@ class ChatGPTBase:
                 "function_results": None,
             }
 
+    async def achat(
+        self,
+        messages: List[Message],
+        function: List[CompletionFunc | None] = [None],
+        disable_function: bool = False,
+        **kwargs,
+    ):
+        self.manage_length(messages)
+        if self.tool is not None and not disable_function:
+            response = await achat_completion_request(
+                messages,
+                self.tool.functions,
+                model=self.model,
+                temperature=self.temperature,
+                frequency_penalty=self.repetition_penalty,
+                prompt_caching=self.prompt_caching,
+                **kwargs,
+            )
+        else:
+            response = await achat_completion_request(
+                messages,
+                model=self.model,
+                temperature=self.temperature,
+                prompt_caching=self.prompt_caching,
+                **kwargs,
+            )
+        self.ctx_manager(response)
+        return response
+
+    async def acall(
+        self,
+        messages: List[Message],
+        disable_function: bool = False,
+        stop: List[str] | str | None = None,
+        n: int = 1,
+        max_tokens: int | None = None,
+        **kwargs,
+    ):
+        response = await self.achat(
+            messages,
+            disable_function=disable_function,
+            stop=stop,
+            n=n,
+            max_tokens=max_tokens,
+            **kwargs,
+        )
+
+        full_message = response.choices[0]
+        if full_message.finish_reason == "function_call":
+            messages.append(full_message["message"])
+            func_results = self.tool.call_function(messages, full_message)
+
+            try:
+                response = await self.achat(messages, disable_function=True)
+                return {
+                    "response": response,
+                    "function_results": func_results,
+                }
+            except Exception as e:
+                print(type(e))
+                raise Exception("Function chat request failed")
+        else:
+            return {
+                "response": response,
+                "function_results": None,
+            }
+
+    def stream(self, messages: List[Message], on_delta, **kwargs) -> str:
+        """Streams the response to `on_delta`, which cancels the generation by returning True."""
+        self.manage_length(messages)
+        text, usage = chat_completion_stream_request(
+            messages,
+            on_delta,
+            model=self.model,
+            temperature=self.temperature,
+            prompt_caching=self.prompt_caching,
+            **kwargs,
+        )
+        self.ctx_manager.add_usage(usage or estimate_usage(messages, text))
+        return text
+
+    async def astream(self, messages: List[Message], on_delta, **kwargs) -> str:
+        self.manage_length(messages)
+        text, usage = await achat_completion_stream_request(
+            messages,
+            on_delta,
+            model=self.model,
+            temperature=self.temperature,
+            prompt_caching=self.prompt_caching,
+            **kwargs,
+        )
+        self.ctx_manager.add_usage(usage or estimate_usage(messages, text))
+        return text
+
 
 # Claude Models
 class ClaudeBase:
@@ -292,6 +417,7 @@ class ClaudeBase:
         ctx_manager: MoneyManager = None,
         desired_output_length: int = 512,
         temperature: float = 1.0,
+        prompt_caching: bool = False,
     ):
         self.model = model
         assert ctx_manager is not None
@@ -300,10 +426,15 @@ class ClaudeBase:
         self.max_tokens = 8192
         self.desired_output_length = desired_output_length
         self.temperature = temperature
+        self.prompt_caching = prompt_caching
 
     def chat(self, messages: List[MessageParam], *args, **kwargs):
         response = anthropic_chat_completion_request(
-            messages, model=self.model, temperature=self.temperature, **kwargs
+            messages,
+            model=self.model,
+            temperature=self.temperature,
+            prompt_caching=self.prompt_caching,
+            **kwargs,
         )
         self.ctx_manager(response)
         return response
@@ -325,6 +456,60 @@ class ClaudeBase:
             "function_results": None,
         }
 
+    async def achat(self, messages: List[MessageParam], *args, **kwargs):
+        response = await anthropic_achat_completion_request(
+            messages,
+            model=self.model,
+            temperature=self.temperature,
+            prompt_caching=self.prompt_caching,
+            **kwargs,
+        )
+        self.ctx_manager(response)
+        return response
+
+    async def acall(
+        self,
+        messages: List[MessageParam],
+        disable_function: bool = False,
+        stop: List[str] | str | None = None,
+    ):
+        response = await self.achat(
+            messages,
+            disable_function=disable_function,
+            stop=stop,
+            max_tokens=self.max_tokens,
+        )
+        return {
+            "response": response,
+            "function_results": None,
+        }
+
+    def stream(self, messages: List[MessageParam], on_delta, **kwargs) -> str:
+        text, usage = anthropic_chat_completion_stream_request(
+            messages,
+            on_delta,
+            model=self.model,
+            temperature=self.temperature,
+            prompt_caching=self.prompt_caching,
+            max_tokens=self.max_tokens,
+            **kwargs,
+        )
+        self.ctx_manager.add_usage(usage or estimate_usage(messages, text))
+        return text
+
+    async def astream(self, messages: List[MessageParam], on_delta, **kwargs) -> str:
+        text, usage = await anthropic_achat_completion_stream_request(
+            messages,
+            on_delta,
+            model=self.model,
+            temperature=self.temperature,
+            prompt_caching=self.prompt_caching,
+            max_tokens=self.max_tokens,
+            **kwargs,
+        )
+        self.ctx_manager.add_usage(usage or estimate_usage(messages, text))
+        return text
+
 
 # Deepseek
 class DeepseekBase:
@@ -368,6 +553,33 @@ class DeepseekBase:
             "response": response,
             "function_results": None,
         }
+
+    async def achat(self, messages: List[dict], *args, **kwargs):
+        response = await deepseek_achat_completion_request(
+            messages=messages,
+            model=self.model,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            stream=self.stream,
+            **kwargs,
+        )
+        self.ctx_manager(response)
+        return response
+
+    async def acall(
+        self,
+        messages: List[dict],
+        disable_function: bool = False,
+        stop: Union[List[str], str, None] = None,
+    ):
+        response = await self.achat(
+            messages,
+            stop=stop,
+        )
+        return {
+            "response": response,
+            "function_results": None,
+        }
     
 # Gemini
 class GeminiBase:
@@ -409,6 +621,39 @@ class GeminiBase:
             "function_results": None,
         }
 
+    async def achat(self, messages: List[dict], *args, **kwargs):
+        response = await google_achat_completion_request(
+            messages=messages,
+            model=self.model,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            **kwargs,
+        )
+        #self.ctx_manager(response) # No response.usage in gemini
+        return response
+
+    async def acall(
+        self,
+        messages: List[dict],
+        disable_function: bool = False,
+    ):
+        response = await self.achat(
+            messages,
+        )
+        return {
+            "response": response,
+            "function_results": None,
+        }
+
+LOCAL_STOP_SEQUENCES = [
+    "### USER",
+    "### ASSISTANT",
+    "### SYSTEM",
+    "<extra_id_1>",
+    #"###",
+    #"#",
+]
+
 # Llama2 Model Base
 class LocalBase:
     def __init__(
@@ -421,18 +666,22 @@ class LocalBase:
         desired_output_length: int = 1024,
         temperature: float = 1.0,
         repetition_penalty: float = 1.0,
+        batch_size: int = 0,
+        batch_wait_ms: float = 5.0,
     ):
         self.model = model
         self.tool = tool
         self.api_key = api_key
         self.api_base_url = api_base_url
+        self.batch_size = batch_size
+        self.batch_wait_ms = batch_wait_ms
         self.client = OpenAI(
             api_key=api_key,
             base_url=api_base_url,
         )
+        self.async_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncOpenAI
         assert ctx_manager is not None
         self.ctx_manager = ctx_manager
-        self.enc = tiktoken.get_encoding("cl100k_base")
         self.max_budget = 8192
         self.output_budget = 1024
         self.desired_output_length = desired_output_length
@@ -455,29 +704,33 @@ class LocalBase:
         if self.model.startswith("meta-llama/Llama-3.2"):
             self.tok.chat_template = llama_chat_template
 
+        # counts with the model's own tokenizer; repeated system prompts are cache hits
+        self.token_counter = TokenCounter(
+            lambda text: self.tok.encode(text, add_special_tokens=False), name=self.model
+        )
+
     def cutoff(self, message: str, budget: int) -> str:
-        tokens = self.enc.encode(message)
+        tokens = self.tok.encode(message, add_special_tokens=False)
         if len(tokens) > budget:
-            message = self.enc.decode(tokens[:budget])
+            message = self.tok.decode(tokens[:max(0, budget)])
         return message
 
     def manage_length(self, messages: List[Message]) -> None:
+        # Prompts are already fitted by the agent's context budget, which trims
+        # history and memories first; this only guards the hard context limit.
         last_message = messages[-1]["content"]
-        if len(messages) > 1:
-            previous_tokens_length = 0
-            for msg in messages[:-1]:
-                if "content" in msg.keys() and msg["content"] is not None:
-                    previous_tokens_length += len(
-                        self.enc.encode(msg["content"])
-                    )
-        else:
-            previous_tokens_length = 0
+        previous_tokens_length = 0
+        for msg in messages[:-1]:
+            if "content" in msg.keys() and msg["content"] is not None:
+                previous_tokens_length += self.token_counter.count(msg["content"])
         budget = (
             self.max_budget
             - self.desired_output_length
             - previous_tokens_length
         )
-        messages[-1]["content"] = self.cutoff(last_message, budget)
+        if self.token_counter.count(last_message) > budget:
+            logger.warning(f"Truncating the last message to {budget} tokens to fit the context of {self.model}")
+            messages[-1]["content"] = self.cutoff(last_message, budget)
 
     def chat(
         self, messages: List[Message], lora=None, **kwargs
@@ -502,22 +755,56 @@ class LocalBase:
         self.ctx_manager(response)
         return response
 
-    def __call__(
-        self,
-        messages: List[Message],
-        disable_function: bool = False,
-        stop: List[str] = [
-            "### USER",
-            "### ASSISTANT",
-            "### SYSTEM",
-            "<extra_id_1>",
-            #"###",
-            #"#",
-        ],
-        n: int = 1,
-        max_tokens: int | None = None,
-        **kwargs,
-    ) -> Dict[str, Any]:
+    def _get_async_client(self) -> AsyncOpenAI:
+        return get_loop_local(
+            self.async_clients,
+            lambda: AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.api_base_url,
+                http_client=get_async_http_client(),
+            ),
+        )
+
+    async def achat(
+        self, messages: List[Message], lora=None, **kwargs
+    ) -> OpenAICompletion | None:
+        self.manage_length(messages)
+
+        # turn messages to prompt
+        prompt = chat_messages_to_prompt(
+            self.tok,
+            messages,
+            tokenize=False,
+            add_generation_prompt=True,
+        )
+
+        if self.batch_size > 1:
+            # coalesced with the concurrent requests of other episodes to the same server
+            batcher = get_completion_batcher(
+                self._get_async_client(),
+                self.api_base_url,
+                self.batch_size,
+                self.batch_wait_ms,
+                token_counter=self.token_counter,
+            )
+            response = await batcher.submit(
+                prompt,
+                model=self.model if lora is None else lora,
+                temperature=self.temperature,
+                **kwargs,
+            )
+        else:
+            response = await acompletion_request(
+                prompt,
+                model=self.model if lora is None else lora,
+                temperature=self.temperature,
+                client=self._get_async_client(),
+                **kwargs,
+            )
+        self.ctx_manager(response)
+        return response
+
+    def _prepare_messages(self, messages: List[Message]):
         if "gemma" in self.model:  # Gemma model do not have the system prompt!
             if messages[0]["role"] == "system":
                 system_message = messages[0]
@@ -578,18 +865,12 @@ class LocalBase:
 
         desired_output_length = min(
             self.desired_output_length,
-            self.max_budget - len(self.enc.encode(prompt)),
+            self.max_budget - self.token_counter.count(prompt),
         )  #  - 516
         # print(desired_output_length, self.max_budget - len(self.enc.encode(prompt))) # if max_tokens is None else max_tokens
-        response = self.chat(
-            messages,
-            disable_function=disable_function,
-            stop=stop,
-            n=n,
-            max_tokens=desired_output_length,
-            repetition_penalty=self.repetition_penalty,
-            **kwargs,
-        )
+        return messages, desired_output_length
+
+    def _port_to_chat_completion(self, response) -> OpenAIChatCompletion:
         choices = []
         for choice in response.choices:
             choices.append(
@@ -611,7 +892,95 @@ class LocalBase:
             model=response.model,
             object="chat.completion",
         )
+        return return_response
+
+    def __call__(
+        self,
+        messages: List[Message],
+        disable_function: bool = False,
+        stop: List[str] = LOCAL_STOP_SEQUENCES,
+        n: int = 1,
+        max_tokens: int | None = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        messages, desired_output_length = self._prepare_messages(messages)
+        response = self.chat(
+            messages,
+            disable_function=disable_function,
+            stop=stop,
+            n=n,
+            max_tokens=desired_output_length,
+            repetition_penalty=self.repetition_penalty,
+            **kwargs,
+        )
         return {
-            "response": return_response,
+            "response": self._port_to_chat_completion(response),
             "function_results": None,
         }
+
+    async def acall(
+        self,
+        messages: List[Message],
+        disable_function: bool = False,
+        stop: List[str] = LOCAL_STOP_SEQUENCES,
+        n: int = 1,
+        max_tokens: int | None = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        messages, desired_output_length = self._prepare_messages(messages)
+        response = await self.achat(
+            messages,
+            disable_function=disable_function,
+            stop=stop,
+            n=n,
+            max_tokens=desired_output_length,
+            repetition_penalty=self.repetition_penalty,
+            **kwargs,
+        )
+        return {
+            "response": self._port_to_chat_completion(response),
+            "function_results": None,
+        }
+
+    def _stream_prompt(self, messages: List[Message]):
+        messages, desired_output_length = self._prepare_messages(messages)
+        self.manage_length(messages)
+        prompt = chat_messages_to_prompt(
+            self.tok,
+            messages,
+            tokenize=False,
+            add_generation_prompt=True,
+        )
+        return prompt, desired_output_length
+
+    def stream(self, messages: List[Message], on_delta, stop: List[str] = LOCAL_STOP_SEQUENCES, **kwargs) -> str:
+        prompt, desired_output_length = self._stream_prompt(messages)
+        text, usage = completion_stream_request(
+            prompt,
+            on_delta,
+            model=self.model,
+            temperature=self.temperature,
+            client=self.client,
+            stop=stop,
+            max_tokens=desired_output_length,
+            repetition_penalty=self.repetition_penalty,
+            **kwargs,
+        )
+        self.ctx_manager.add_usage(usage or estimate_usage(prompt, text))
+        return text
+
+    async def astream(self, messages: List[Message], on_delta, stop: List[str] = LOCAL_STOP_SEQUENCES, **kwargs) -> str:
+        prompt, desired_output_length = self._stream_prompt(messages)
+        text, usage = await acompletion_stream_request(
+            prompt,
+            on_delta,
+            model=self.model,
+            temperature=self.temperature,
+            client=self._get_async_client(),
+            stop=stop,
+            max_tokens=desired_output_length,
+            repetition_penalty=self.repetition_penalty,
+            **kwargs,
+        )
+        self.ctx_manager.add_usage(usage or estimate_usage(prompt, text))
+        return text
@@ -1,11 +1,13 @@
+import hashlib
 import json
 import os
-from datetime import datetime
+import weakref
 from pathlib import Path
-from typing import Dict, Iterable, List
+from typing import Callable, Dict, Iterable, List, Tuple
 
-from openai import OpenAI, Stream
-from openai.types import Completion, Embedding
+import tiktoken
+from openai import AsyncOpenAI, OpenAI, Stream
+from openai.types import Completion, CompletionUsage, Embedding
 from openai.types.chat import ChatCompletion
 from tenacity import (
     retry,
@@ -21,6 +23,8 @@ from .utils import (
     CompletionFunc,
     CompletionFuncCall,
     Message,
+    get_async_http_client,
+    get_loop_local,
 )
 
 # ChatCompletion(id='chatcmpl-9A75C93aAVgd8l4X2zz3EhN8Okkdd',
@@ -36,17 +40,57 @@ except Exception as e:
     print(f"Exception occurred while setting up OpenAI client: {e}")
     client = None
 
+async_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncOpenAI
 
-@retry(wait=wait_random(min=1, max=10), stop=stop_after_attempt(5))
-def chat_completion_request(
+
+def get_async_client() -> AsyncOpenAI | None:
+    try:
+        return get_loop_local(
+            async_clients,
+            lambda: AsyncOpenAI(**setup_openai(), http_client=get_async_http_client()),
+        )
+    except Exception as e:
+        print(f"Exception occurred while setting up AsyncOpenAI client: {e}")
+        return None
+
+
+def get_prompt_cache_key(messages: List[Message]) -> str:
+    # key on the static part of the system prompt when it is marked, so that every
+    # step of an episode is routed to the same cache despite its dynamic suffix
+    texts = []
+    for msg in messages:
+        if msg["role"] != "system":
+            continue
+        if isinstance(msg["content"], str):
+            texts.append(msg["content"])
+        else:
+            texts.extend(part["text"] for part in msg["content"] if "cache_control" in part)
+    return hashlib.sha256("".join(texts).encode("utf-8")).hexdigest()[:32]
+
+
+def strip_cache_control(messages: List[Message]) -> List[Message]:
+    """Drops the cache breakpoints set for anthropic; openai caches prompt prefixes on its own."""
+    stripped = []
+    for msg in messages:
+        if isinstance(msg["content"], list) and any("cache_control" in part for part in msg["content"]):
+            content = [{k: v for k, v in part.items() if k != "cache_control"} for part in msg["content"]]
+            msg = dict(msg, content=content)
+        stripped.append(msg)
+    return stripped
+
+
+def _build_chat_json_data(
     messages: List[Message],
     functions: Iterable[CompletionFunc] | None = None,
     function_call: CompletionFuncCall | None = None,
     model: str = "gpt-3.5-turbo-0613",
-    client: OpenAI = client,
     **kwargs,
-) -> Stream[ChatCompletion] | None:
-    json_data = {"model": model, "messages": messages}
+) -> Dict:
+    json_data = {"model": model, "messages": strip_cache_control(messages)}
+    if kwargs.get("prompt_caching", False):
+        # openai caches long prompt prefixes automatically; routing requests that
+        # share a system prompt with the same key keeps them on the same cache
+        json_data.update({"extra_body": {"prompt_cache_key": get_prompt_cache_key(messages)}})
     if functions is not None:
         json_data.update({"functions": functions})
     if function_call is not None:
@@ -70,6 +114,23 @@ def chat_completion_request(
         and kwargs["response_format"] is not None
     ):
         json_data.update({"response_format": kwargs["response_format"]})
+    return json_data
+
+
+@retry(wait=wait_random(min=1, max=10), stop=stop_after_attempt(5))
+def chat_completion_request(
+    messages: List[Message],
+    functions: Iterable[CompletionFunc] | None = None,
+    function_call: CompletionFuncCall | None = None,
+    model: str = "gpt-3.5-turbo-0613",
+    client: OpenAI = client,
+    **kwargs,
+) -> Stream[ChatCompletion] | None:
+    json_data = _build_chat_json_data(
+        messages, functions, function_call, model, **kwargs
+    )
+
+    if kwargs.get("response_format") is not None:
         # if the response_format is given, we need to use the "beta" call function
         try:
             response = client.beta.chat.completions.parse(**json_data)
@@ -88,10 +149,43 @@ def chat_completion_request(
             raise e
 
 
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(5))
-def completion_request(
-    prompt, model: str = "gpt-3.5-turbo-0613", client: OpenAI = client, **kwargs
+@retry(wait=wait_random(min=1, max=10), stop=stop_after_attempt(5))
+async def achat_completion_request(
+    messages: List[Message],
+    functions: Iterable[CompletionFunc] | None = None,
+    function_call: CompletionFuncCall | None = None,
+    model: str = "gpt-3.5-turbo-0613",
+    client: AsyncOpenAI | None = None,
+    **kwargs,
 ) -> ChatCompletion | None:
+    if client is None:
+        client = get_async_client()
+    json_data = _build_chat_json_data(
+        messages, functions, function_call, model, **kwargs
+    )
+
+    if kwargs.get("response_format") is not None:
+        # if the response_format is given, we need to use the "beta" call function
+        try:
+            response = await client.beta.chat.completions.parse(**json_data)
+            return response
+        except Exception as e:
+            print("Unable to generate ChatCompletion response")
+            print(f"Exception: {e}")
+            raise e
+    else:
+        try:
+            response = await client.chat.completions.create(**json_data)
+            return response
+        except Exception as e:
+            print("Unable to generate ChatCompletion response")
+            print(f"Exception: {e}")
+            raise e
+
+
+def _build_completion_json_data(
+    prompt, model: str = "gpt-3.5-turbo-0613", **kwargs
+) -> Dict:
     json_data = {"model": model, "prompt": prompt}
     extra_data = {}
 
@@ -123,6 +217,14 @@ def completion_request(
         json_data.update({"extra_body": extra_data})
 
     # json_data.update({"request_timeout": 30})
+    return json_data
+
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(5))
+def completion_request(
+    prompt, model: str = "gpt-3.5-turbo-0613", client: OpenAI = client, **kwargs
+) -> ChatCompletion | None:
+    json_data = _build_completion_json_data(prompt, model, **kwargs)
     try:
         response = client.completions.create(**json_data)
         return response
@@ -132,6 +234,152 @@ def completion_request(
         raise e
 
 
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(5))
+async def acompletion_request(
+    prompt, model: str = "gpt-3.5-turbo-0613", client: AsyncOpenAI | None = None, **kwargs
+) -> Completion | None:
+    if client is None:
+        client = get_async_client()
+    json_data = _build_completion_json_data(prompt, model, **kwargs)
+    try:
+        response = await client.completions.create(**json_data)
+        return response
+    except Exception as e:
+        print("Unable to generate Completion response")
+        print(f"Exception: {e}")
+        raise e
+
+
+def estimate_usage(messages: List[Message] | str, completion: str) -> CompletionUsage:
+    """Usage of a stream cancelled before the server reported it, counted with cl100k_base."""
+    enc = tiktoken.get_encoding("cl100k_base")
+    if isinstance(messages, str):
+        texts = [messages]
+    else:
+        texts = []
+        for msg in messages:
+            if isinstance(msg.get("content"), str):
+                texts.append(msg["content"])
+            elif isinstance(msg.get("content"), list):
+                texts.extend(c["text"] for c in msg["content"] if c.get("type") == "text")
+    prompt_tokens = sum(len(enc.encode(text)) for text in texts)
+    completion_tokens = len(enc.encode(completion))
+    return CompletionUsage(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+
+
+# Streaming requests call `on_delta` with every text delta and cancel the
+# generation as soon as it returns True. They return the streamed text and the
+# usage reported by the server, which is None if the stream was cancelled.
+# They are not retried, since a retry would replay deltas to `on_delta`.
+
+def chat_completion_stream_request(
+    messages: List[Message],
+    on_delta: Callable[[str], bool],
+    model: str = "gpt-3.5-turbo-0613",
+    client: OpenAI = client,
+    **kwargs,
+) -> Tuple[str, CompletionUsage | None]:
+    json_data = _build_chat_json_data(messages, None, None, model, **kwargs)
+    json_data.update({"stream": True, "stream_options": {"include_usage": True}})
+
+    text, usage = [], None
+    stream = client.chat.completions.create(**json_data)
+    try:
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                text.append(chunk.choices[0].delta.content)
+                if on_delta(chunk.choices[0].delta.content):
+                    break
+    finally:
+        stream.close()
+    return "".join(text), usage
+
+
+async def achat_completion_stream_request(
+    messages: List[Message],
+    on_delta: Callable[[str], bool],
+    model: str = "gpt-3.5-turbo-0613",
+    client: AsyncOpenAI | None = None,
+    **kwargs,
+) -> Tuple[str, CompletionUsage | None]:
+    if client is None:
+        client = get_async_client()
+    json_data = _build_chat_json_data(messages, None, None, model, **kwargs)
+    json_data.update({"stream": True, "stream_options": {"include_usage": True}})
+
+    text, usage = [], None
+    stream = await client.chat.completions.create(**json_data)
+    try:
+        async for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                text.append(chunk.choices[0].delta.content)
+                if on_delta(chunk.choices[0].delta.content):
+                    break
+    finally:
+        await stream.close()
+    return "".join(text), usage
+
+
+def completion_stream_request(
+    prompt: str,
+    on_delta: Callable[[str], bool],
+    model: str = "gpt-3.5-turbo-0613",
+    client: OpenAI = client,
+    **kwargs,
+) -> Tuple[str, CompletionUsage | None]:
+    json_data = _build_completion_json_data(prompt, model, **kwargs)
+    json_data.update({"stream": True, "stream_options": {"include_usage": True}})
+
+    text, usage = [], None
+    stream = client.completions.create(**json_data)
+    try:
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].text:
+                text.append(chunk.choices[0].text)
+                if on_delta(chunk.choices[0].text):
+                    break
+    finally:
+        stream.close()
+    return "".join(text), usage
+
+
+async def acompletion_stream_request(
+    prompt: str,
+    on_delta: Callable[[str], bool],
+    model: str = "gpt-3.5-turbo-0613",
+    client: AsyncOpenAI | None = None,
+    **kwargs,
+) -> Tuple[str, CompletionUsage | None]:
+    if client is None:
+        client = get_async_client()
+    json_data = _build_completion_json_data(prompt, model, **kwargs)
+    json_data.update({"stream": True, "stream_options": {"include_usage": True}})
+
+    text, usage = [], None
+    stream = await client.completions.create(**json_data)
+    try:
+        async for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].text:
+                text.append(chunk.choices[0].text)
+                if on_delta(chunk.choices[0].text):
+                    break
+    finally:
+        await stream.close()
+    return "".join(text), usage
+
+
 @retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(5))
 def embedding_request(
     text: str, model: str = "text-embedding-3-small"
@@ -153,7 +401,18 @@ def embedding_request(
 class MoneyManager:
     def __init__(self, model: str = "gpt-3.5-turbo-0613"):
         self.total_cost = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.prompt_cache_read_tokens = 0
+        self.prompt_cache_write_tokens = 0
         self.model = model
+        # price of provider-side cached input relative to regular input
+        if "claude" in self.model:
+            self.cache_read_cost_ratio = 0.1
+            self.cache_write_cost_ratio = 1.25
+        else:
+            self.cache_read_cost_ratio = 0.5
+            self.cache_write_cost_ratio = 1.0
         if self.model == "gpt-3.5-turbo-16k-0613":
             self.input_cost = 0.003
             self.output_cost = 0.004
@@ -215,44 +474,48 @@ class MoneyManager:
             print("No usage in response")
             print(response)
             return
-
-        input_cost = response.usage.prompt_tokens / 1000 * self.input_cost
+        self.add_usage(response.usage)
+
+    def add_usage(self, usage: CompletionUsage) -> None:
+        cache_read_tokens, cache_write_tokens = self.get_prompt_cache_tokens(usage)
+        self.prompt_cache_read_tokens += cache_read_tokens
+        self.prompt_cache_write_tokens += cache_write_tokens
+
+        uncached_tokens = usage.prompt_tokens - cache_read_tokens - cache_write_tokens
+        input_cost = (
+            uncached_tokens
+            + cache_read_tokens * self.cache_read_cost_ratio
+            + cache_write_tokens * self.cache_write_cost_ratio
+        ) / 1000 * self.input_cost
         if (
-            response.usage.completion_tokens is not None
-        ):  # "completion_tokens" in response.usage.keys():
+            usage.completion_tokens is not None
+        ):  # "completion_tokens" in usage.keys():
             output_cost = (
-                response.usage.completion_tokens / 1000 * self.output_cost
+                usage.completion_tokens / 1000 * self.output_cost
             )
         else:
             output_cost = 0.0
         self.total_cost += input_cost + output_cost
 
-    def refresh(self) -> None:
-        self.total_cost = 0.0
+    @staticmethod
+    def get_prompt_cache_tokens(usage) -> tuple:
+        prompt_tokens_details = getattr(usage, "prompt_tokens_details", None)
+        cache_read_tokens = getattr(prompt_tokens_details, "cached_tokens", None) or 0
+        cache_write_tokens = getattr(usage, "cache_creation_input_tokens", None) or 0
+        return cache_read_tokens, cache_write_tokens
 
+    def record_cache(self, hit: bool) -> None:
+        if hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
 
-class Logger:
-    def __init__(
-        self,
-        agent_name: str = "sql",
-        log_path: os.PathLike = "logs/custom/",
-    ):
-        nowdate = datetime.now().strftime("%Y%m%d")
-
-        self.log_path = log_path
-        os.makedirs(self.log_path, exist_ok=True)
-
-    def __call__(self, messages: List[Message]):
-        nowtime = datetime.now().time().strftime("%H%M%S%f")[:8]
-        filepath = f"{self.log_path}/{nowtime}.json"
-        with open(filepath, "w+", encoding="utf-8") as f:
-            json.dump(
-                messages,
-                f,
-                ensure_ascii=False,
-                indent=4,
-            )
-        # print(f"Dump output complete {str(filepath)}")
+    def refresh(self) -> None:
+        self.total_cost = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.prompt_cache_read_tokens = 0
+        self.prompt_cache_write_tokens = 0
 
 
 def pretty_print_conversation(messages: List[Message]):
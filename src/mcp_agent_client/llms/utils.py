@@ -1,9 +1,61 @@
-from typing import Any, Dict, TypeAlias
+import asyncio
+import weakref
+from typing import Any, Callable, Dict, TypeAlias, TypeVar
+
+import httpx
 from openai.types.chat import completion_create_params
 
 CompletionFunc: TypeAlias = completion_create_params.Function
 CompletionFuncCall: TypeAlias = completion_create_params.FunctionCall
 Message: TypeAlias = Dict[str, Any]
+T = TypeVar("T")
+
+# Connection pool shared by every async LLM client on the same event loop, so
+# that concurrent episodes reuse keep-alive connections instead of opening new
+# ones. An httpx.AsyncClient is bound to the loop it first sends requests on,
+# so each `asyncio.run` gets a pool (and clients using it) of its own.
+ASYNC_HTTP_LIMITS = httpx.Limits(max_connections=256, max_keepalive_connections=64)
+ASYNC_HTTP_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+# every cache passed to get_loop_local, so that closing a loop's pool can evict the clients built on it
+_loop_local_caches: "weakref.WeakValueDictionary[int, weakref.WeakKeyDictionary]" = weakref.WeakValueDictionary()
+
+
+def get_loop_local(cache: weakref.WeakKeyDictionary, factory: Callable[[], T]) -> T:
+    """Returns the entry of `cache` for the running event loop, created with `factory` on first use."""
+    loop = asyncio.get_running_loop()
+    _loop_local_caches[id(cache)] = cache
+    if loop not in cache:
+        cache[loop] = factory()
+    return cache[loop]
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    if loop in _async_http_clients and _async_http_clients[loop].is_closed:
+        del _async_http_clients[loop]
+    return get_loop_local(
+        _async_http_clients,
+        lambda: httpx.AsyncClient(limits=ASYNC_HTTP_LIMITS, timeout=ASYNC_HTTP_TIMEOUT),
+    )
+
+
+async def aclose_async_http_client() -> None:
+    """
+    Closes the connection pool of the running event loop, before the loop itself
+    is closed. The SDK clients and batchers of the loop use that pool, so they
+    are dropped too and the next call on the loop builds new ones.
+    """
+    loop = asyncio.get_running_loop()
+    for cache in list(_loop_local_caches.values()):
+        if cache is not _async_http_clients:
+            cache.pop(loop, None)
+    client = _async_http_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
+
 
 def chat_messages_to_prompt(
     tokenizer,
@@ -0,0 +1,284 @@
+import asyncio
+import csv
+import itertools
+import json
+import logging
+import os
+import re
+import statistics
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List
+
+import omegaconf
+from omegaconf import OmegaConf
+
+from mcp_game_servers.utils.types.misc import Configurable
+from mcp_agent_client.base_agent import BaseAgent
+from mcp_agent_client.base_client import MCPAgentClient
+from mcp_agent_client.llms.utils import aclose_async_http_client
+from mcp_agent_client.runner.eval import BaseRunner
+
+logger = logging.getLogger(__name__)
+
+RESULT_FIELDS = [
+    "game",
+    "task",
+    "llm",
+    "agent_type",
+    "input_modality",
+    "trial",
+    "score",
+    "final_step",
+    "policy_steps",
+    "policy_hit_rate",
+    "time_sec",
+    "status",
+    "log_path",
+]
+GROUP_FIELDS = ["game", "task", "llm", "agent_type", "input_modality"]
+
+# swept keys that are already directories of the episode log path
+LOG_PATH_KEYS = {"env_name", "agent.llm_name", "env.input_modality", "agent.agent_type", "env.task"}
+
+
+class AsyncRateLimiter:
+    """Spaces out acquisitions so that at most `requests_per_minute` pass per minute."""
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute
+        self._lock = asyncio.Lock()
+        self._next_time = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            if self._next_time > now:
+                await asyncio.sleep(self._next_time - now)
+                now = time.monotonic()
+            self._next_time = max(now, self._next_time) + self.interval
+
+
+def get_avg_std(arr):
+    """
+    Returns (average, population_std, sample_std) rounded to 4 decimals.
+    """
+    if not arr:
+        return 0.0, 0.0, 0.0
+    avg = statistics.mean(arr)
+    pop_std = statistics.pstdev(arr)
+    sample_std = statistics.stdev(arr) if len(arr) > 1 else 0.0
+    return round(avg, 4), round(pop_std, 4), round(sample_std, 4)
+
+
+def write_server_configs(cfg: omegaconf.DictConfig, log_path: str) -> None:
+    """Writes the client, agent server and game server configs read by mcp_play."""
+    OmegaConf.save(config=cfg, f=os.path.join(log_path, "config_client.yaml"))
+    OmegaConf.save(
+        config=OmegaConf.create({
+            "env_name": cfg.env_name,
+            "log_path": cfg.log_path,
+            "trace": cfg.get("trace", False),
+            "agent": cfg.agent,
+        }),
+        f=os.path.join(log_path, "config_agent.yaml"),
+    )
+    OmegaConf.save(
+        config=OmegaConf.create({
+            "env_name": cfg.env_name,
+            "log_path": cfg.log_path,
+            "obs_transport": cfg.get("obs_transport", "json"),
+            "trace": cfg.get("trace", False),
+            "policy_tier": OmegaConf.select(cfg, "runner.policy_tier", default=False),
+            "env": cfg.env,
+        }),
+        f=os.path.join(log_path, "config_game.yaml"),
+    )
+
+
+class BatchRunner(Configurable):
+    """
+    Runs a sweep of MCP episodes concurrently in a single process.
+
+    Every combination of the `sweep` values is played `trials` times. At most
+    `max_workers` episodes run at once, and LLM requests of each model listed
+    in `rate_limits` are throttled to the given requests per minute. Per-episode
+    results are appended to a CSV table as soon as each episode finishes.
+    """
+
+    @dataclass
+    class Config:
+        max_workers: int = 4
+        trials: int = 1
+        output_path: str = "./logs/batch"
+        # dotted config key -> list of values, e.g. {"agent.llm_name": ["gpt-4o", "o3-mini"]}
+        sweep: Dict[str, List[Any]] = field(default_factory=dict)
+        # llm_name -> max LLM requests per minute
+        rate_limits: Dict[str, float] = field(default_factory=dict)
+        # llm_name -> api_base_url, for locally served models
+        api_base_urls: Dict[str, str] = field(default_factory=dict)
+
+    cfg: Config
+
+    def configure(self):
+        self.max_workers = self.cfg.max_workers
+        self.trials = self.cfg.trials
+        self.output_path = self.cfg.output_path
+        self.rate_limiters = {
+            model: AsyncRateLimiter(rpm)
+            for model, rpm in self.cfg.rate_limits.items()
+        }
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        os.makedirs(self.output_path, exist_ok=True)
+        self.results_file = os.path.join(self.output_path, f"{timestamp}_results.csv")
+        self.summary_file = os.path.join(self.output_path, f"{timestamp}_summary.csv")
+
+    def build_episodes(self, base_cfg: omegaconf.DictConfig) -> List[omegaconf.DictConfig]:
+        keys = list(self.cfg.sweep.keys())
+        values = [list(self.cfg.sweep[key]) for key in keys]
+
+        episodes = []
+        for combination in itertools.product(*values):
+            # swept values not already in the log path, e.g. "temperature-0.7"
+            overrides = "_".join(
+                f"{key.rsplit('.', 1)[-1]}-{value}"
+                for key, value in zip(keys, combination)
+                if key not in LOG_PATH_KEYS
+            )
+            for trial in range(1, self.trials + 1):
+                cfg = OmegaConf.create(OmegaConf.to_container(base_cfg))
+                for key, value in zip(keys, combination):
+                    OmegaConf.update(cfg, key, value)
+
+                # keep prompt_path consistent with the swept modality/agent
+                if "agent.prompt_path" not in keys and (
+                    "agent.agent_type" in keys or "env.input_modality" in keys
+                ):
+                    prompt_root = cfg.agent.prompt_path.rsplit(".", 2)[0]
+                    cfg.agent.prompt_path = f"{prompt_root}.{cfg.env.input_modality}.{cfg.agent.agent_type}"
+
+                if cfg.agent.llm_name in self.cfg.api_base_urls:
+                    cfg.agent.api_base_url = self.cfg.api_base_urls[cfg.agent.llm_name]
+
+                cfg.trial = trial
+                cfg.episode = len(episodes)
+                cfg.episode_overrides = re.sub(r"[^\w.=-]+", "_", overrides)
+                episodes.append(cfg)
+        return episodes
+
+    def set_episode_log_path(self, cfg: omegaconf.DictConfig) -> omegaconf.DictConfig:
+        # episode index and a random suffix keep concurrent episodes (and batches) apart
+        name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_ep{cfg.episode}_{cfg.env.task}_trial{cfg.trial}"
+        if cfg.episode_overrides:
+            name += f"_{cfg.episode_overrides}"
+        log_path = os.path.join(
+            cfg.log_path,
+            cfg.env_name,
+            cfg.agent.llm_name,
+            cfg.env.input_modality,
+            cfg.agent.agent_type,
+            f"{name}_{uuid.uuid4().hex[:8]}",
+        )
+        cfg.log_path = log_path
+        cfg.env.log_path = log_path
+        cfg.agent.log_path = log_path
+        os.makedirs(log_path, exist_ok=True)
+        write_server_configs(cfg, log_path)
+        return cfg
+
+    async def run_episode(self, cfg: omegaconf.DictConfig) -> dict:
+        cfg = self.set_episode_log_path(cfg)
+
+        runner = BaseRunner(cfg.runner)
+        client = MCPAgentClient()
+        runner.set_client(client)
+        agent = BaseAgent(cfg.agent)
+        agent.set_rate_limiter(self.rate_limiters.get(cfg.agent.llm_name, None))
+        runner.set_agent(agent)
+
+        result = {
+            "game": cfg.env_name,
+            "task": cfg.env.task,
+            "llm": cfg.agent.llm_name,
+            "agent_type": cfg.agent.agent_type,
+            "input_modality": cfg.env.input_modality,
+            "trial": cfg.trial,
+            "score": None,
+            "final_step": None,
+            "policy_steps": None,
+            "policy_hit_rate": None,
+            "time_sec": None,
+            "status": "ok",
+            "log_path": cfg.log_path,
+        }
+
+        start = time.time()
+        try:
+            score, step = await runner.mcp_play(cfg.game_server, cfg.agent_server, cfg.env.log_path, cfg)
+            result["score"] = score
+            result["final_step"] = step
+            stats = runner.policy_stats()
+            result["policy_steps"] = stats["policy_steps"]
+            result["policy_hit_rate"] = stats["policy_hit_rate"]
+        except Exception as e:
+            logger.exception(f"Episode failed: {cfg.log_path}")
+            result["status"] = f"failed: {type(e).__name__}: {e}"
+            await client.cleanup()
+        result["time_sec"] = round(time.time() - start, 3)
+
+        with open(os.path.join(cfg.log_path, "final_score.json"), "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=4)
+        return result
+
+    def write_result(self, result: dict) -> None:
+        is_new = not os.path.exists(self.results_file)
+        with open(self.results_file, "a", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            if is_new:
+                writer.writeheader()
+            writer.writerow(result)
+
+    def write_summary(self, results: List[dict]) -> None:
+        groups = {}
+        for result in results:
+            if result["status"] != "ok":
+                continue
+            key = tuple(result[k] for k in GROUP_FIELDS)
+            groups.setdefault(key, []).append(result)
+
+        with open(self.summary_file, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(GROUP_FIELDS + ["trials", "score", "final_step", "time_sec"])
+            for key, group in groups.items():
+                row = list(key) + [len(group)]
+                for metric in ("score", "final_step", "time_sec"):
+                    avg, pop_std, sample_std = get_avg_std([float(r[metric]) for r in group])
+                    row.append(f"{avg}±{pop_std}({sample_std})")
+                writer.writerow(row)
+
+    async def run(self, base_cfg: omegaconf.DictConfig) -> List[dict]:
+        episodes = self.build_episodes(base_cfg)
+        semaphore = asyncio.Semaphore(self.max_workers)
+        logger.info(f"Running {len(episodes)} episodes with {self.max_workers} workers")
+
+        async def _worker(cfg):
+            async with semaphore:
+                result = await self.run_episode(cfg)
+            self.write_result(result)
+            logger.info(
+                f"[{result['task']} | {result['llm']} | {result['agent_type']}] "
+                f"trial {result['trial']}: score={result['score']}, step={result['final_step']}, "
+                f"time={result['time_sec']}s, status={result['status']}"
+            )
+            return result
+
+        try:
+            results = await asyncio.gather(*[_worker(cfg) for cfg in episodes])
+        finally:
+            # the LLM connection pool of this event loop is shared by all episodes
+            await aclose_async_http_client()
+        self.write_summary(results)
+        return results
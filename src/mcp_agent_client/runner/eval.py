@@ -1,14 +1,16 @@
 import logging
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional
 import os
 
 from mcp_game_servers.utils.types.misc import Configurable
+from mcp_game_servers.utils.tracing import span
 from mcp_game_servers.base_env import BaseEnv
 from mcp_agent_client.base_agent import BaseAgent
 from mcp_agent_client.base_client import MCPAgentClient
 from mcp_agent_client.llms.llm import LocalBase
 from mcp_agent_client.json_schemas import SCHEMA_REGISTRY
+from mcp_agent_servers.prompt_registry import RenderedPrompt
 import omegaconf
 
 logger = logging.getLogger(__name__)
@@ -18,11 +20,14 @@ class BaseRunner(Configurable):
     @dataclass
     class Config:
         max_steps: int
+        policy_tier: bool = False  # let the env act on trivial states without calling the agent
 
     cfg: Config
 
     def configure(self):
         self.max_steps = self.cfg.max_steps
+        self.policy_tier = self.cfg.policy_tier
+        self.reset_policy_stats()
 
     def set_agent(self, agent: BaseAgent):
         self.agent = agent
@@ -44,30 +49,93 @@ class BaseRunner(Configurable):
     def set_client(self, client: MCPAgentClient):
         self.client = client
 
+    def reset_policy_stats(self):
+        self.policy_steps = 0
+        self.agent_steps = 0
+
+    def policy_stats(self) -> dict:
+        """Steps decided by the env's policy tier and by the agent, i.e. the LLM calls saved."""
+        total = self.policy_steps + self.agent_steps
+        return {
+            "policy_steps": self.policy_steps,
+            "agent_steps": self.agent_steps,
+            "policy_hit_rate": round(self.policy_steps / total, 4) if total else 0.0,
+        }
+
+    def log_policy_stats(self):
+        if self.policy_tier:
+            stats = self.policy_stats()
+            logger.info(
+                f"policy tier: {stats['policy_steps']} of {stats['policy_steps'] + stats['agent_steps']} steps "
+                f"handled without the agent (hit rate {stats['policy_hit_rate']:.1%})"
+            )
+
+    def _policy_action(self, obs) -> Optional[str]:
+        if not self.policy_tier:
+            return None
+        with span("env.policy_action", "env"):
+            text = self.env.policy_action(obs)
+        if text is not None:
+            self.policy_steps += 1
+            logger.info(f"policy tier action: {text}")
+        return text
+
+    def decide(self, obs) -> str:
+        """Returns the action text for `obs`, from the env's policy tier if it handles the state, else from the agent."""
+        text = self._policy_action(obs)
+        if text is not None:
+            return text
+        with span("env.get_game_info", "env"):
+            game_info = self.env.get_game_info()
+        with span("agent", "agent"):
+            text = self.agent(obs, game_info)
+        self.agent_steps += 1
+        return text
+
     def step(self, obs):
         # FIXME: logger
-        game_info = self.env.get_game_info()
-        text = self.agent(obs, game_info)
-        action = self.env.text2action(text)
-        logger.info(f"executing actions: {action}")
-        obs, reward, terminated, truncated, info = self.env.step(action)
-        _, done = self.env.evaluate(obs)
+        with span("runner.step", "runner"):
+            text = self.decide(obs)
+            with span("env.text2action", "env"):
+                action = self.env.text2action(text)
+            logger.info(f"executing actions: {action}")
+            with span("env.step", "env"):
+                obs, reward, terminated, truncated, info = self.env.step(action)
+            with span("env.evaluate", "env"):
+                _, done = self.env.evaluate(obs)
 
         return obs, terminated | truncated | done
 
     def play(self):
+        self.reset_policy_stats()
         obs = self.env.initial_obs()
 
         for i in range(self.max_steps):
             logger.info(f"================step: {i+1}================")
+            self.agent.set_step(i + 1)
             obs, done = self.step(obs)
             if done:
                 break
 
         score, _ = self.env.evaluate(obs)
+        self.agent.end_episode()
+        self.log_policy_stats()
 
         return score, i+1
     
+    def get_structured_output_kwargs(self, module_type: str) -> dict:
+        structured_output_kwargs = {}
+        if module_type in self.agent.structured_output:
+            assert isinstance(self.agent.llm, LocalBase), "Structured output is currently tested for local models."
+
+            if "guided_regex" in self.agent.structured_output[module_type]:
+                structured_output_kwargs.update(self.agent.structured_output[module_type])
+            elif "guided_json" in self.agent.structured_output[module_type]:
+                json_schema = SCHEMA_REGISTRY[self.agent.structured_output[module_type]["guided_json"]]
+                structured_output_kwargs.update({"guided_json": json_schema})
+                structured_output_kwargs.update({"output_keys": self.agent.structured_output[module_type]["output_keys"]})
+        return structured_output_kwargs
+
     async def mcp_play(self, game_server_path: str, agent_server_path: str, log_path: str, client_full_config: omegaconf.DictConfig):
         """
         Play the game with game and agent MCP servers.
@@ -88,46 +156,52 @@ class BaseRunner(Configurable):
         await self.client.setup_server(game_server_path, game_server_id, game_server_config_path, client_full_config)
         await self.client.setup_server(agent_server_path, agent_server_id, agent_server_config_path, client_full_config)
 
+        # Each step takes one agent server round-trip per LLM call plus one to start the
+        # step, and a single game server round-trip that dispatches the action and
+        # returns the next observation. With the policy tier on, the game server
+        # attaches the env's policy action to the observation, and such steps skip
+        # the agent server entirely.
+        self.reset_policy_stats()
+        obs = await self.client.call_load_obs_payload(game_server_id)
         for i in range(self.max_steps):
             logger.info(f"================step: {i+1}================")
-            
-            # Get observations from game server
-            obs_str, obs_image_str, game_info = await self.client.call_load_obs(game_server_id)
-
-            # Add observation to memory
-            await self.client.call_add_observation_to_memory(obs_str, obs_image_str, agent_server_id)
-
-            # Process agent modules using agent server
-            for module_type in self.agent.agent_modules:
-                structured_output_kwargs = {}
-                if module_type in self.agent.structured_output:
-                    assert isinstance(self.agent.llm, LocalBase), "Structured output is currently tested for local models."
-
-                    if "guided_regex" in self.agent.structured_output[module_type]:
-                        structured_output_kwargs.update(self.agent.structured_output[module_type])
-                    elif "guided_json" in self.agent.structured_output[module_type]:
-                        json_schema = SCHEMA_REGISTRY[self.agent.structured_output[module_type]["guided_json"]]
-                        structured_output_kwargs.update({"guided_json": json_schema})
-                        structured_output_kwargs.update({"output_keys": self.agent.structured_output[module_type]["output_keys"]})
-
-                system_prompt, user_prompt, images, call_chat_completion = await self.client.call_get_agent_module_prompts(
-                    module_type, 
-                    game_info,
-                    agent_server_id
-                )
-                if system_prompt is None and user_prompt is None:
+            self.agent.set_step(i + 1)
+            with span("runner.step", "runner"):
+                policy_action = obs.get("policy_action") if self.policy_tier else None
+                if policy_action is not None:
+                    self.policy_steps += 1
+                    logger.info(f"policy tier action: {policy_action}")
+                    score, done, obs = await self.client.call_dispatch_and_observe(policy_action, game_server_id)
+                    if done:
+                        break
                     continue
-                response, action_str = "", ""
-                if call_chat_completion:
-                    response = self.agent.chat_completion(system_prompt, user_prompt, images, **structured_output_kwargs)
-                #logger.info(f"system_prompt: {system_prompt}\n\nuser_prompt: {user_prompt}\n\nresponse: {response}")
-                action_str = await self.client.call_send_agent_module_response(response, agent_server_id, structured_output_kwargs)
-                
-            # Dispatch action to game server and check if game is finished
-            assert action_str is not None
-            score, done = await self.client.call_dispatch_final_action(action_str, game_server_id)
+
+                # Add observation to memory and get the prompts of the first agent module
+                payload = await self.client.call_step_agent_modules(agent_server_id, obs=obs)
+
+                # Process agent modules using agent server
+                while not payload["done"]:
+                    structured_output_kwargs = self.get_structured_output_kwargs(payload["module_type"])
+                    with span(f"agent.{payload['module_type']}", "agent"):
+                        system_prompt = RenderedPrompt(payload["system_prompt"], payload["system_prompt_static_prefix"])
+                        response = await self.agent.achat_completion(
+                            system_prompt, payload["user_prompt"], payload["images"],
+                            module_type=payload["module_type"], **structured_output_kwargs
+                        )
+                    #logger.info(f"system_prompt: {payload['system_prompt']}\n\nuser_prompt: {payload['user_prompt']}\n\nresponse: {response}")
+                    payload = await self.client.call_step_agent_modules(
+                        agent_server_id, response=response, structured_output_kwargs=structured_output_kwargs
+                    )
+
+                # Dispatch action to game server, check if game is finished and get the next observation
+                action_str = payload["action_str"]
+                assert action_str is not None
+                self.agent_steps += 1
+                score, done, obs = await self.client.call_dispatch_and_observe(action_str, game_server_id)
             if done:
                 break
 
+        self.agent.end_episode()
+        self.log_policy_stats()
         await self.client.cleanup()
         return score, i+1
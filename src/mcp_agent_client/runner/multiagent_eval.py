@@ -58,9 +58,13 @@ class MultiAgentRunner(Configurable):
 
         for i in range(self.max_steps):
             logger.info(f"================ Frame step: {i+1}================")
+            self.agent1.set_step(i + 1)
+            self.agent2.set_step(i + 1)
             obs1, obs2, done, action1, action2 = self.frame_step(obs1, obs2, action1, action2)
             if done:
                 score, _ = self.env.evaluate(obs1, obs2)
                 break
         score, _ = self.env.evaluate(obs1, obs2)
+        self.agent1.end_episode()
+        self.agent2.end_episode()
         return score
@@ -5,17 +5,19 @@ import json
 from datetime import datetime
 import omegaconf
 import logging
-import base64
-from PIL import Image
-from io import BytesIO
 from typing import Dict, Optional
 from dataclasses import field
 
 from mcp.server.fastmcp import FastMCP
 from mcp_agent_servers.agent_types import AGENT_MODULES
+from mcp_agent_servers.context_budget import ContextBudget
 
+from mcp_agent_servers.embeddings import get_embedding_provider
 from mcp_agent_servers.memory import GenericMemory
+from mcp_agent_servers.prompt_registry import get_prompt_registry
+from mcp_game_servers.utils.tracing import enable_tracing, span
 from mcp_agent_servers.skill_manager import SkillManager
+from mcp_game_servers.utils.types.encoded_image import EncodedImage
 
 logger = logging.getLogger(__name__)
 
@@ -105,49 +107,148 @@ def parse_semi_formatted_text(text, prefixs):
 
     return result_dict
 
-def agent_get_local_memory(agent, game_info: Optional[list] = None) -> dict:
-    local_memory = {}
-    local_memory.update(game_info)
+class IncrementalSectionParser:
+    """
+    Follows a streamed response and tells when the required sections are complete.
+
+    A section is complete once another section header, a markdown header or a
+    blank line follows its content. `feed` returns True at that point for the
+    last required section, so the caller can cancel the generation; `text` is
+    the response up to (excluding) the line that closed it, which
+    `parse_semi_formatted_text` parses as if the model had stopped there.
+    """
+
+    def __init__(self, prefixs: dict, required_keys):
+        self.prefixs = prefixs
+        self.required_keys = set(required_keys)
+        self.closed_keys = set()
+        self.current_key = None
+        self.current_has_content = False
+        self.buffer = ""
+        self.offset = 0  # length of the complete lines consumed so far
+        self.stop_offset = None
+
+    @property
+    def done(self) -> bool:
+        return self.stop_offset is not None
+
+    @property
+    def text(self) -> str:
+        return self.buffer if self.stop_offset is None else self.buffer[:self.stop_offset]
+
+    def _close_current(self, line_start: int) -> None:
+        if self.current_key is not None and self.current_has_content:
+            self.closed_keys.add(self.current_key)
+            if self.required_keys <= self.closed_keys:
+                self.stop_offset = line_start
+        self.current_key = None
+        self.current_has_content = False
+
+    def feed(self, delta: str) -> bool:
+        if self.done:
+            return True
+        self.buffer += delta
+        while not self.done:
+            end = self.buffer.find("\n", self.offset)
+            if end < 0:
+                break
+            line_start, line = self.offset, self.buffer[self.offset:end]
+            self.offset = end + 1
+
+            is_key, key = _is_line_key_candidate(line, self.prefixs)
+            if is_key:
+                self._close_current(line_start)
+                if not self.done:
+                    self.current_key = key
+            elif not line.strip() or line.lstrip().startswith("#"):
+                self._close_current(line_start)
+            elif self.current_key is not None:
+                self.current_has_content = True
+        return self.done
+
+PREFIX_KEYS = {key for prefixs in PREFIXS.values() for key in prefixs}
+
+class LocalMemoryView:
+    """
+    Local memory entries derived from GenericMemory, kept up to date incrementally.
+
+    Only entries whose source keys were written since the last refresh (per the
+    memory's version counters) are rebuilt, so building the local memory does
+    not scale with the length of the episode.
+    """
+
+    def __init__(self, memory: GenericMemory, long_term_memory_len: Optional[int] = None):
+        self.memory = memory
+        self.long_term_memory_len = long_term_memory_len
+        self.version = -1
+        self.entries = {}
+
+    def refresh(self) -> dict:
+        if self.version == self.memory.version:
+            return self.entries
+
+        if self.version < 0:
+            dirty_keys = PREFIX_KEYS | {"observation", "image", "retrieved_memory", "long_term_memory"}
+        else:
+            dirty_keys = {key for key, version in self.memory.versions.items() if version > self.version}
 
-    local_memory["cur_state_str"] = agent.memory.get_last("observation")
-    # update every prefix to local_memory
-    for _, dict in PREFIXS.items():
-        for key in dict:
-            if key in local_memory and agent.memory.get_last(key) is None: # To not update "subtask" to None in zeroshot_agent
-                continue
-            else:
-                local_memory[key] = agent.memory.get_last(key)
-
-    if len(agent.memory.get_all("observation")) > 1:
-        local_memory["prev_state_str"] = agent.memory.get_all("observation")[-2]
-    if len(agent.memory.get_all("image")) > 0:
-        local_memory["cur_image"] = agent.memory.get_last("image")
-    if len(agent.memory.get_all("image")) > 1:
-        local_memory["prev_image"] = agent.memory.get_all("image")[-2]
-    if len(agent.memory.get_all("reasoning")) > 0:
-        local_memory.update(
-            {
-                "prev_reasoning_str": agent.memory.get_all("reasoning")[-1],
-            }
-        )
-    if len(agent.memory.get_all("analysis")) > 0:
-        local_memory.update(
-            {
-                "prev_analysis_str": agent.memory.get_all("analysis")[-1],
-            }
-        )
-    if len(agent.memory.get_all("retrieved_memory")) > 0:
+        for key in dirty_keys:
+            if key in PREFIX_KEYS:
+                self.entries[key] = self.memory.get_last(key)
+            self._refresh_derived(key)
+
+        self.version = self.memory.version
+        return self.entries
+
+    def _set_or_pop(self, cond: bool, key: str, value_fn) -> None:
+        if cond:
+            self.entries[key] = value_fn()
+        else:
+            self.entries.pop(key, None)
+
+    def _refresh_derived(self, key: str) -> None:
+        memory = self.memory
+        if key == "observation":
+            self.entries["cur_state_str"] = memory.get_last("observation")
+            self._set_or_pop(memory.count("observation") > 1, "prev_state_str",
+                             lambda: memory.get_recent("observation", 2)[0])
+        elif key == "image":
+            self._set_or_pop(memory.count("image") > 0, "cur_image",
+                             lambda: memory.get_last("image"))
+            self._set_or_pop(memory.count("image") > 1, "prev_image",
+                             lambda: memory.get_recent("image", 2)[0])
+        elif key == "reasoning":
+            self._set_or_pop(memory.count("reasoning") > 0, "prev_reasoning_str",
+                             lambda: memory.get_last("reasoning"))
+        elif key == "analysis":
+            self._set_or_pop(memory.count("analysis") > 0, "prev_analysis_str",
+                             lambda: memory.get_last("analysis"))
+        elif key in ("retrieved_memory", "long_term_memory"):
+            self._set_or_pop(memory.count("retrieved_memory") > 0, "retrieved_memory_str",
+                             lambda: memory.get_last("retrieved_memory"))
+            self._set_or_pop(memory.count("retrieved_memory") > 0, "latest_saved_memory_str",
+                             self._latest_saved_memory_str)
+
+    def _latest_saved_memory_str(self) -> Optional[str]:
         latest_saved_memory_str = "\n".join(
-            f"{idx}: {lmem}" for idx, lmem in enumerate(agent.memory.get_all("long_term_memory")[-agent.long_term_memory_len:], start=1)
+            f"{idx}: {lmem}" for idx, lmem in enumerate(self.memory.get_recent("long_term_memory", self.long_term_memory_len), start=1)
         )
         if latest_saved_memory_str == "":
             latest_saved_memory_str = None
-        local_memory.update(
-            {
-                "retrieved_memory_str": agent.memory.get_all("retrieved_memory")[-1],
-                "latest_saved_memory_str": latest_saved_memory_str
-            }
-        )
+        return latest_saved_memory_str
+
+def agent_get_local_memory(agent, game_info: Optional[list] = None) -> dict:
+    view = getattr(agent, "local_memory_view", None)
+    if view is None or view.memory is not agent.memory:
+        view = agent.local_memory_view = LocalMemoryView(agent.memory, agent.long_term_memory_len)
+
+    local_memory = {}
+    local_memory.update(game_info)
+
+    for key, value in view.refresh().items():
+        if key in PREFIX_KEYS and key in local_memory and value is None: # To not update "subtask" to None in zeroshot_agent
+            continue
+        local_memory[key] = value
     return local_memory
 
 def agent_update_memory(agent, output: dict) -> None:
@@ -156,14 +257,23 @@ def agent_update_memory(agent, output: dict) -> None:
 
 def get_module_prompts(agent, obs_cond=False, system_prompt_filename="self_reflection_system", user_prompt_filename="self_reflection_user"):
     if obs_cond:
-        if len(agent.memory.get_all("observation")) <= 1:
+        if agent.memory.count("observation") <= 1:
             return None, None
         assert (
-            len(agent.memory.get_all("observation")) > 1
+            agent.memory.count("observation") > 1
         ), "Need at least 2 observations for agent reflection"
 
-    system_prompt = load_prompt(agent.prompt_path, system_prompt_filename).format(**agent.local_memory)
-    user_prompt = load_prompt(agent.prompt_path, user_prompt_filename).format(**agent.local_memory)
+    prompt_registry = get_prompt_registry(agent.prompt_path)
+    context_budget = getattr(agent, "context_budget", None)
+    if context_budget is not None:
+        system_prompt, user_prompt = context_budget.render(
+            [prompt_registry.get(system_prompt_filename), prompt_registry.get(user_prompt_filename)],
+            agent.local_memory,
+        )
+        return system_prompt, user_prompt
+
+    system_prompt = prompt_registry.render(system_prompt_filename, **agent.local_memory)
+    user_prompt = prompt_registry.render(user_prompt_filename, **agent.local_memory)
     return system_prompt, user_prompt
 
 def parse_module_response(response, module_type="self_reflection"):
@@ -224,145 +334,202 @@ class MCPAgentServer:
         logger.info(f"config_path: {config_path}")
         self.mcp = mcp_server
         self.register_tools()
+        if self.cfg.get("trace", False):
+            enable_tracing(os.path.join(self.cfg.log_path, "trace_agent_server.json"), "agent_server")
 
         # set agent
         self.agent_type = self.cfg.agent.agent_type
         self.prompt_path = self.cfg.agent.prompt_path
+        self.prompt_registry = get_prompt_registry(self.prompt_path)
         self.agent_modules = AGENT_MODULES[self.agent_type]
-        self.memory = GenericMemory(path=self.cfg.agent.log_path)
-        self.skill_manager = SkillManager(path=self.cfg.agent.log_path)
+        embedding_provider = get_embedding_provider(
+            self.cfg.agent.embedding_provider if hasattr(self.cfg.agent, "embedding_provider") else "openai",
+            self.cfg.agent.embedding_model if hasattr(self.cfg.agent, "embedding_model") else "",
+        )
+        self.memory = GenericMemory(
+            path=self.cfg.agent.log_path,
+            capacities=self.cfg.agent.memory_capacities if hasattr(self.cfg.agent, "memory_capacities") else None,
+            embedding_provider=embedding_provider,
+        )
+        self.skill_manager = SkillManager(path=self.cfg.agent.log_path, embedding_provider=embedding_provider)
         self.long_term_memory_len = self.cfg.agent.long_term_memory_len if hasattr(self.cfg.agent, "long_term_memory_len") else None
+        max_prompt_tokens = self.cfg.agent.max_prompt_tokens if hasattr(self.cfg.agent, "max_prompt_tokens") else 0
+        self.context_budget = None
+        if max_prompt_tokens >= 0:
+            self.context_budget = ContextBudget.for_model(self.cfg.agent.llm_name, max_prompt_tokens)
 
         # set temp var
         self.module_type = None
 
-    def image2str(self, image):
-        buffered = BytesIO()
-        image.save(buffered, format="JPEG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        return img_str
-
-    def str2image(self, img_str):
-        img_data = base64.b64decode(img_str)
-        loaded_image = Image.open(BytesIO(img_data))
-        image = loaded_image.copy()
-        loaded_image.close()
-        return image
-
     def create_config(self, config_path: str, expand_log_path: bool) -> omegaconf.omegaconf.DictConfig:
         cfg = omegaconf.OmegaConf.load(config_path)
         cfg = set_log_path(cfg, expand_log_path)
         return cfg
 
+    def add_observation(self, obs_str: str, obs_image_str: str, obs_image_mime_type: str = "image/jpeg", obs_image_sha256: str = "", obs_image_handle: Optional[dict] = None) -> None:
+        self.memory.add("observation", obs_str)
+        if obs_image_handle is not None:
+            self.memory.add("image", EncodedImage.from_handle(obs_image_handle, obs_image_mime_type, obs_image_sha256))
+        elif obs_image_str!= "":
+            # keep the encoded image as-is; it is forwarded to the client without re-encoding
+            obs_image = EncodedImage.from_base64(obs_image_str, obs_image_mime_type, obs_image_sha256)
+            self.memory.add("image", obs_image)
+
+    def get_module_prompts_payload(self, module_type: str, game_info: dict) -> dict:
+        self.module_type = module_type
+        self.local_memory = agent_get_local_memory(self, game_info)
+        call_chat_completion = True
+        if self.module_type == "action_inference":
+            system_prompt, user_prompt = get_module_prompts(
+                self, False, "action_inference_system", "action_inference_user")
+        elif self.module_type == "skill_management":
+            system_prompt, user_prompt = get_module_prompts(
+                self, False, "skill_management_system", "skill_management_user")
+            # add a new skill if the previous subtask succeeds
+            # TODO: to handle general prefixs
+            if not ("true" in str(self.local_memory.get("success", "")).lower()):
+                call_chat_completion = False
+        elif self.module_type == "subtask_planning":
+            system_prompt, user_prompt = get_module_prompts(
+                self, False, "subtask_planning_system", "subtask_planning_user")
+        elif self.module_type == "knowledge_retrieval":
+            system_prompt, user_prompt = get_module_prompts(
+                self, False, "knowledge_retrieval_system", "knowledge_retrieval_user")
+        elif self.module_type == "self_reflection":
+            system_prompt, user_prompt = get_module_prompts(
+                self, True, "self_reflection_system", "self_reflection_user")
+        elif self.module_type == "long_term_management":
+            system_prompt, user_prompt = get_module_prompts(
+                self, True, "long_term_system", "long_term_user")
+        else:
+            raise ValueError(f"Unknown module: {self.module_type}")
+
+        images = {k: self.local_memory[k].to_dict() for k in ("cur_image", "prev_image") if k in self.local_memory}
+
+        return {
+            "system_prompt": system_prompt,
+            "system_prompt_static_prefix": getattr(system_prompt, "static_prefix", ""),
+            "user_prompt": user_prompt,
+            "images": images,
+            "call_chat_completion": call_chat_completion
+        }
+
+    def _parse_module_response(self, response, module_type, structured_output_kwargs):
+        if "guided_json" in structured_output_kwargs:
+            output = json.loads(response)
+            output = {key: value for key, value in output.items() if key in structured_output_kwargs["output_keys"]}
+        else:
+            output = parse_module_response(response, module_type)
+        return output
+
+    def process_module_response(self, response: str, structured_output_kwargs: dict):
+        if "\\n" in response:
+            response = response.replace("\\n", "\n")
+        if self.module_type == "action_inference":
+            output = self._parse_module_response(response, "action_inference", structured_output_kwargs)
+            agent_update_memory(self, output)
+            parsed_output = output.get("action", None)
+        elif self.module_type == "skill_management":
+            if response is not None:
+                output = self._parse_module_response(response, "skill_management", structured_output_kwargs)
+                agent_update_memory(self, output)
+                agent_add_new_skill(self, output)
+            skills_text = agent_retrieve_skills(self)
+            output = {"retrieved_skills": skills_text}
+            agent_update_memory(self, output)
+            parsed_output = output
+        elif self.module_type == "subtask_planning":
+            output = self._parse_module_response(response, "subtask_planning", structured_output_kwargs)
+            agent_update_memory(self, output)
+            parsed_output = output
+        elif self.module_type == "knowledge_retrieval":
+            output = self._parse_module_response(response, "knowledge_retrieval", structured_output_kwargs)
+            agent_update_memory(self, output)
+            parsed_output = output
+        elif self.module_type == "self_reflection":
+            output = self._parse_module_response(response, "self_reflection", structured_output_kwargs)
+            for key in PREFIXS["self_reflection"]:
+                if key not in output:
+                    output[key] = None
+            agent_update_memory(self, output)
+            parsed_output = output
+        elif self.module_type == "long_term_management":
+            output = self._parse_module_response(response, "long_term_management", structured_output_kwargs)
+            agent_update_memory(self, output)
+            agent_add_new_long_term_memory(self, output)
+            retrieved_memory = agent_retrieve_long_term_memory(self)
+            output = {"retrieved_memory": retrieved_memory}
+            agent_update_memory(self, output)
+            parsed_output = output
+        else:
+            raise ValueError(f"Unknown module: {self.module_type}")
+        return parsed_output
+
+    def step_agent_modules(
+        self,
+        response: Optional[str] = None,
+        structured_output_kwargs: Optional[dict] = None,
+        obs: Optional[dict] = None,
+    ) -> dict:
+        """
+        Advances the agent module pipeline of the current step by one LLM call.
+
+        A new step starts when `obs` (the load-obs payload) is given. Otherwise
+        `response` answers the module returned by the previous call. Modules
+        without prompts are skipped and modules that need no chat completion are
+        answered with an empty response, both without a round-trip to the client.
+        """
+        if obs is not None:
+            self.add_observation(
+                obs["obs_str"], obs["obs_image_str"], obs["obs_image_mime_type"], obs["obs_image_sha256"], obs.get("obs_image_handle"))
+            self.step_game_info = obs["game_info"]
+            self.step_module_index = 0
+            self.step_action_str = None
+        else:
+            self.step_action_str = str(self.process_module_response(response, structured_output_kwargs or {}))
+            self.step_module_index += 1
+
+        while self.step_module_index < len(self.agent_modules):
+            payload = self.get_module_prompts_payload(self.agent_modules[self.step_module_index], self.step_game_info)
+            if payload["system_prompt"] is None and payload["user_prompt"] is None:
+                self.step_module_index += 1
+                continue
+            if not payload["call_chat_completion"]:
+                self.step_action_str = str(self.process_module_response("", {}))
+                self.step_module_index += 1
+                continue
+            payload.update({"module_type": self.module_type, "done": False})
+            return payload
+
+        return {"done": True, "action_str": self.step_action_str}
+
     def register_tools(self):
         @self.mcp.tool(name="list-agent-module-type", description="List the possible agent module type names.")
         def list_agent_module_type() -> str:
             return "The list of the possible agent module tpyes:\n" + "\n".join([module_type for module_type in self.agent_modules])
 
         @self.mcp.tool(name="add-observation-to-memory", description="Add a observation to the agent.")
-        def add_observation_to_memory(obs_str: str, obs_image_str: str) -> str:
-            self.memory.add("observation", obs_str)
-            if obs_image_str!= "":
-                obs_image = self.str2image(obs_image_str)
-                self.memory.add("image", obs_image)
+        def add_observation_to_memory(obs_str: str, obs_image_str: str, obs_image_mime_type: str = "image/jpeg", obs_image_sha256: str = "", obs_image_handle: Optional[dict] = None) -> str:
+            with span("tool.add-observation-to-memory", "mcp"):
+                self.add_observation(obs_str, obs_image_str, obs_image_mime_type, obs_image_sha256, obs_image_handle)
             return "Observation added"
 
         @self.mcp.tool(name="get-agent-module-prompts", description="Get an agent module named module_type and return its system and user prompts to response.")
         def get_agent_module_prompts(module_type: str, game_info: dict) -> str:
-            #logger.info(f"[DEBUG] get_agent_module_prompts(), module_type: {self.module_type}")
-
-            self.module_type = module_type
-            self.local_memory = agent_get_local_memory(self, game_info)
-            call_chat_completion = True
-            if self.module_type == "action_inference":
-                system_prompt, user_prompt = get_module_prompts(
-                    self, False, "action_inference_system", "action_inference_user")
-            elif self.module_type == "skill_management":
-                system_prompt, user_prompt = get_module_prompts(
-                    self, False, "skill_management_system", "skill_management_user")
-                # add a new skill if the previous subtask succeeds
-                # TODO: to handle general prefixs
-                if not ("true" in str(self.local_memory.get("success", "")).lower()):
-                    call_chat_completion = False
-            elif self.module_type == "subtask_planning":
-                system_prompt, user_prompt = get_module_prompts(
-                    self, False, "subtask_planning_system", "subtask_planning_user")
-            elif self.module_type == "knowledge_retrieval":
-                system_prompt, user_prompt = get_module_prompts(
-                    self, False, "knowledge_retrieval_system", "knowledge_retrieval_user")
-            elif self.module_type == "self_reflection":
-                system_prompt, user_prompt = get_module_prompts(
-                    self, True, "self_reflection_system", "self_reflection_user")
-            elif self.module_type == "long_term_management":
-                system_prompt, user_prompt = get_module_prompts(
-                    self, True, "long_term_system", "long_term_user")
-            else:
-                raise ValueError(f"Unknown module: {self.module_type}")
-            
-            image_strs = {k: self.image2str(self.local_memory[k]) for k in ("cur_image", "prev_image") if k in self.local_memory}
-            
-            return json.dumps({
-                "system_prompt": system_prompt,
-                "user_prompt": user_prompt,
-                "image_strs": image_strs,
-                "call_chat_completion": call_chat_completion
-            })
-
-        def _parse_module_response(response, module_type, structured_output_kwargs):
-            if "guided_json" in structured_output_kwargs:
-                output = json.loads(response)
-                output = {key: value for key, value in output.items() if key in structured_output_kwargs["output_keys"]}
-            else:
-                output = parse_module_response(response, module_type)
-            return output
+            with span("tool.get-agent-module-prompts", "mcp", module=module_type):
+                return json.dumps(self.get_module_prompts_payload(module_type, game_info))
 
         @self.mcp.tool(name="send-agent-module-response", description="Send a client response for the current agent module and return its parsed output.")
         def send_agent_module_response(response: str, structured_output_kwargs: dict) -> str:
-            #logger.info(f"[DEBUG] send_agent_module_response(), module_type: {self.module_type}")
-
-            if "\\n" in response:
-                response = response.replace("\\n", "\n")
-            if self.module_type == "action_inference":
-                output = _parse_module_response(response, "action_inference", structured_output_kwargs)
-                agent_update_memory(self, output)
-                parsed_output = output.get("action", None)
-            elif self.module_type == "skill_management":
-                if response is not None:
-                    output = _parse_module_response(response, "skill_management", structured_output_kwargs)
-                    agent_update_memory(self, output)
-                    agent_add_new_skill(self, output)
-                skills_text = agent_retrieve_skills(self)
-                output = {"retrieved_skills": skills_text}
-                agent_update_memory(self, output)
-                parsed_output = output
-            elif self.module_type == "subtask_planning":
-                output = _parse_module_response(response, "subtask_planning", structured_output_kwargs)
-                agent_update_memory(self, output)
-                parsed_output = output
-            elif self.module_type == "knowledge_retrieval":
-                output = _parse_module_response(response, "knowledge_retrieval", structured_output_kwargs)
-                agent_update_memory(self, output)
-                parsed_output = output
-            elif self.module_type == "self_reflection":
-                output = _parse_module_response(response, "self_reflection", structured_output_kwargs)
-                for key in PREFIXS["self_reflection"]:
-                    if key not in output:
-                        output[key] = None
-                agent_update_memory(self, output)
-                parsed_output = output
-            elif self.module_type == "long_term_management":
-                output = _parse_module_response(response, "long_term_management", structured_output_kwargs)
-                agent_update_memory(self, output)
-                agent_add_new_long_term_memory(self, output)
-                retrieved_memory = agent_retrieve_long_term_memory(self)
-                output = {"retrieved_memory": retrieved_memory}
-                agent_update_memory(self, output)
-                parsed_output = output
-            else:
-                raise ValueError(f"Unknown module: {self.module_type}")
-            return json.dumps({
-                "parsed_output": str(parsed_output),
-            })
+            with span("tool.send-agent-module-response", "mcp", module=self.module_type):
+                return json.dumps({
+                    "parsed_output": str(self.process_module_response(response, structured_output_kwargs)),
+                })
+
+        @self.mcp.tool(name="step-agent-modules", description="Start a step with an observation or answer the pending agent module, and return the prompts of the next module or the final action.")
+        def step_agent_modules(response: Optional[str] = None, structured_output_kwargs: Optional[dict] = None, obs: Optional[dict] = None) -> str:
+            with span("tool.step-agent-modules", "mcp"):
+                return json.dumps(self.step_agent_modules(response, structured_output_kwargs, obs))
 
     async def run(self):
         await self.mcp.run_stdio_async()
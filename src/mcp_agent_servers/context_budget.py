@@ -0,0 +1,215 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from mcp_agent_servers.prompt_registry import PromptTemplate
+
+logger = logging.getLogger(__name__)
+
+# (substring of the model name, context window in tokens, tokens reserved for the output)
+CONTEXT_WINDOWS = [
+    ("gpt-3.5-turbo-16k", 16384, 4096),
+    ("gpt-3.5-turbo-1106", 16384, 1024),
+    ("gpt-3.5", 4096, 1024),
+    ("gpt-4", 128000, 16384),
+    ("o1", 128000, 16384),
+    ("o3", 128000, 16384),
+    ("claude", 200000, 16384),
+    ("gemini", 1000000, 16384),
+    ("deepseek", 64000, 1024),
+]
+LOCAL_CONTEXT_WINDOW = (8192, 1024)  # matches LocalBase
+
+# Local memory entries that may be shortened when a prompt does not fit, in the
+# order they are given up. "tail" drops the last lines or items (retrieval
+# results are sorted by relevance), "head" drops the first ones (histories are
+# sorted from oldest to newest). Everything else, including the static
+# instructions of the prompt, is never trimmed.
+TRIM_PRIORITY: List[Tuple[str, str]] = [
+    ("retrieved_skills", "tail"),
+    ("relevant_memory", "tail"),
+    ("retrieved_memory_str", "tail"),
+    ("latest_saved_memory_str", "head"),
+    ("short_term_history", "head"),
+    ("prev_state_str", "head"),
+]
+
+
+class TokenCounter:
+    """
+    Counts tokens with the tokenizer of a model, caching the count of each text.
+
+    Prompt fields (the previous observation, memories, histories) are rendered
+    into several module prompts per step and stay the same over many steps, so
+    most counts are cache hits.
+    """
+
+    def __init__(self, encode: Callable[[str], list], name: str = "", max_entries: int = 4096):
+        self.encode = encode
+        self.name = name
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        with self._lock:
+            if text in self._cache:
+                self._cache.move_to_end(text)
+                return self._cache[text]
+        n = len(self.encode(text))
+        with self._lock:
+            self._cache[text] = n
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return n
+
+
+def _tiktoken_counter(model: str) -> TokenCounter:
+    import tiktoken
+
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return TokenCounter(encoding.encode, name=f"tiktoken/{encoding.name}")
+
+
+def _hf_counter(model: str) -> TokenCounter:
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model)
+    return TokenCounter(lambda text: tokenizer.encode(text, add_special_tokens=False), name=f"hf/{model}")
+
+
+_COUNTERS: Dict[str, TokenCounter] = {}
+
+
+def get_token_counter(model: str) -> TokenCounter:
+    """
+    Returns a cached token counter for `model`.
+
+    OpenAI models use their tiktoken encoding and local models their Hugging Face
+    tokenizer. Claude, Gemini and DeepSeek do not ship a local tokenizer, so they
+    are approximated with cl100k_base.
+    """
+    if model not in _COUNTERS:
+        if any(name in model for name, _, _ in CONTEXT_WINDOWS):
+            _COUNTERS[model] = _tiktoken_counter(model)
+        else:
+            try:
+                _COUNTERS[model] = _hf_counter(model)
+            except Exception as e:
+                logger.warning(f"Failed to load the tokenizer of {model}, approximating with cl100k_base: {e}")
+                _COUNTERS[model] = _tiktoken_counter(model)
+    return _COUNTERS[model]
+
+
+def get_max_prompt_tokens(model: str) -> int:
+    """Context window of `model` minus the tokens reserved for its output."""
+    for name, window, output_tokens in CONTEXT_WINDOWS:
+        if name in model:
+            return window - output_tokens
+    window, output_tokens = LOCAL_CONTEXT_WINDOW
+    return window - output_tokens
+
+
+def _units(value) -> list:
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return str(value).splitlines(keepends=True)
+
+
+def _join(value, units: list):
+    if isinstance(value, (list, tuple)):
+        return type(value)(units)
+    return "".join(units)
+
+
+class ContextBudget:
+    """
+    Renders module prompts within the prompt token budget of a model.
+
+    Token counts of the static text of every template are computed once, and
+    those of field values are cached, so prompts that fit cost no tokenization
+    beyond the first count of each new value. Prompts that do not fit are
+    shortened by trimming the entries of `TRIM_PRIORITY` in order, keeping the
+    instructions of the prompt intact. Images are not counted.
+    """
+
+    def __init__(self, counter: TokenCounter, max_prompt_tokens: int):
+        self.counter = counter
+        self.max_prompt_tokens = max_prompt_tokens
+        self._static_tokens: Dict[int, int] = {}
+
+    @classmethod
+    def for_model(cls, model: str, max_prompt_tokens: int = 0, counter: Optional[TokenCounter] = None) -> "ContextBudget":
+        return cls(counter or get_token_counter(model), max_prompt_tokens or get_max_prompt_tokens(model))
+
+    def static_tokens(self, template: PromptTemplate) -> int:
+        key = id(template)
+        if key not in self._static_tokens:
+            self._static_tokens[key] = sum(self.counter.count(literal_text) for literal_text, _, _ in template.segments)
+        return self._static_tokens[key]
+
+    def _field_tokens(self, value) -> int:
+        return self.counter.count(format(value, ""))
+
+    def render(self, templates: List[PromptTemplate], kwargs: dict) -> List[str]:
+        # number of slots of each field; a field used in both prompts counts twice
+        uses: Dict[str, int] = {}
+        for template in templates:
+            for _, name, _ in template.segments:
+                if name is not None:
+                    uses[name] = uses.get(name, 0) + 1
+        static_tokens = sum(self.static_tokens(template) for template in templates)
+
+        # every token spans at least one byte, so prompts this short fit without tokenizing them
+        upper_bound = static_tokens + sum(
+            n * len(format(kwargs.get(name), "").encode("utf-8")) for name, n in uses.items()
+        )
+        if upper_bound > self.max_prompt_tokens:
+            kwargs = self.fit(uses, static_tokens, kwargs)
+        return [template.render(**kwargs) for template in templates]
+
+    def fit(self, uses: Dict[str, int], static_tokens: int, kwargs: dict) -> dict:
+        field_tokens = {name: self._field_tokens(kwargs.get(name)) for name in uses}
+        excess = static_tokens + sum(uses[name] * n for name, n in field_tokens.items()) - self.max_prompt_tokens
+        if excess <= 0:
+            return kwargs
+
+        kwargs = dict(kwargs)
+        for name, side in TRIM_PRIORITY:
+            if excess <= 0:
+                break
+            if name not in uses or not kwargs.get(name):
+                continue
+            value = kwargs[name]
+            units = _units(value)
+            target = field_tokens[name] - -(-excess // uses[name])
+
+            # keep the largest number of units that brings the field under its target
+            lo, hi = 0, len(units)
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                kept = units[len(units) - mid:] if side == "head" else units[:mid]
+                if self._field_tokens(_join(value, kept)) <= target:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            kept = units[len(units) - lo:] if side == "head" else units[:lo]
+            kwargs[name] = _join(value, kept)
+
+            trimmed_tokens = self._field_tokens(kwargs[name])
+            logger.info(f"Context budget: trimmed {name} from {len(units)} to {lo} entries")
+            excess -= uses[name] * (field_tokens[name] - trimmed_tokens)
+            field_tokens[name] = trimmed_tokens
+
+        if excess > 0:
+            logger.warning(
+                f"Prompt exceeds the context budget of {self.max_prompt_tokens} tokens by {excess} "
+                f"after trimming history and memories"
+            )
+        return kwargs
@@ -0,0 +1,310 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODELS = {
+    "openai": "text-embedding-ada-002",
+    "local": "sentence-transformers/all-MiniLM-L6-v2",
+    "hashing": "",
+}
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class EmbeddingProvider:
+    """Embeds a batch of texts into L2-normalized float32 vectors."""
+
+    name: str = ""
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    def __init__(self, model: str = DEFAULT_EMBEDDING_MODELS["openai"]):
+        from langchain_openai import OpenAIEmbeddings
+        from mcp_agent_servers.setup_openai import setup_openai
+
+        setup_openai()
+        self.name = f"openai/{model}"
+        self.embeddings = OpenAIEmbeddings(model=model)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        # a single request for the whole batch
+        return normalize(np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32))
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """Runs a sentence-transformers model on CPU, so no request leaves the process."""
+
+    def __init__(self, model: str = DEFAULT_EMBEDDING_MODELS["local"], batch_size: int = 32):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "The local embedding provider requires sentence-transformers (pip install sentence-transformers)."
+            ) from e
+
+        self.name = f"local/{model}"
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model, device="cpu")
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return vectors.astype(np.float32)
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Dependency-free embedding from hashed word unigrams and bigrams.
+
+    Much weaker than a learned model, but deterministic and instant, which is
+    enough to deduplicate near-identical memories when running fully offline.
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.name = f"hashing/{dim}"
+        self.dim = dim
+
+    def _bucket(self, token: str) -> int:
+        return int.from_bytes(hashlib.md5(token.encode("utf-8")).digest()[:4], "little") % self.dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            words = re.findall(r"\w+", text.lower())
+            for token in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                vectors[i, self._bucket(token)] += 1.0
+        return normalize(vectors)
+
+
+class CachedEmbeddingProvider(EmbeddingProvider):
+    """Wraps a provider with an LRU cache keyed by the SHA-256 of each text."""
+
+    def __init__(self, provider: EmbeddingProvider, max_entries: int = 100000):
+        self.provider = provider
+        self.name = provider.name
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def text_key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        keys = [self.text_key(text) for text in texts]
+        vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    vectors[i] = self._cache[key]
+
+        # embed each distinct missing text once, in a single batch
+        missing = list(dict.fromkeys(keys[i] for i, v in enumerate(vectors) if v is None))
+        if missing:
+            missing_texts = {keys[i]: texts[i] for i in range(len(texts))}
+            new_vectors = self.provider.embed([missing_texts[key] for key in missing])
+            with self._lock:
+                for key, vector in zip(missing, new_vectors):
+                    self._cache[key] = vector
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+            computed = dict(zip(missing, new_vectors))
+            for i, key in enumerate(keys):
+                if vectors[i] is None:
+                    vectors[i] = computed[key]
+
+        return np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+
+_PROVIDERS: Dict[Tuple[str, str], EmbeddingProvider] = {}
+
+
+def get_embedding_provider(provider: str = "openai", model: str = "") -> EmbeddingProvider:
+    """Returns a cached provider, shared by every memory and skill index in the process."""
+    model = model or DEFAULT_EMBEDDING_MODELS.get(provider, "")
+    if (provider, model) not in _PROVIDERS:
+        if provider == "openai":
+            base_provider = OpenAIEmbeddingProvider(model)
+        elif provider == "local":
+            base_provider = LocalEmbeddingProvider(model)
+        elif provider == "hashing":
+            base_provider = HashingEmbeddingProvider()
+        else:
+            raise ValueError(f"Unknown embedding provider: {provider}")
+        _PROVIDERS[(provider, model)] = CachedEmbeddingProvider(base_provider)
+        logger.info(f"Embedding provider: {base_provider.name}")
+    return _PROVIDERS[(provider, model)]
+
+
+class VectorDocument:
+    def __init__(self, page_content: str, metadata: Dict[str, Any]):
+        self.page_content = page_content
+        self.metadata = metadata
+
+
+class VectorIndex:
+    """
+    In-process cosine-similarity index over normalized embeddings.
+
+    Vectors are kept in a preallocated NumPy matrix, so a query is a single
+    matrix-vector product. The index is persisted to `{path}/{name}.npy` and
+    `{path}/{name}.json` and reloaded when the same path is reopened.
+    Scores returned by `similarity_search_with_score` are cosine similarities.
+    """
+
+    def __init__(self, name: str, embedding_provider: EmbeddingProvider, path: Optional[str] = None):
+        self.name = name
+        self.embedding_provider = embedding_provider
+        self.path = path
+
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.id_to_index: Dict[str, int] = {}
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+
+        if self.path is not None:
+            self._load()
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def _matrix(self) -> np.ndarray:
+        return self.vectors[:self.count()]
+
+    def _reserve(self, n: int, dim: int) -> None:
+        if self.vectors.shape[1] != dim and self.count() > 0:
+            raise ValueError(f"Embedding dimension mismatch: {dim} != {self.vectors.shape[1]}")
+        if self.vectors.shape[0] < n or self.vectors.shape[1] != dim:
+            capacity = max(n, 2 * self.vectors.shape[0], 16)
+            vectors = np.zeros((capacity, dim), dtype=np.float32)
+            if self.count() > 0:
+                vectors[:self.count()] = self._matrix()
+            self.vectors = vectors
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.embedding_provider.embed(texts)
+
+    def add_vectors(
+        self,
+        vectors: np.ndarray,
+        texts: List[str],
+        ids: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        if len(texts) == 0:
+            return
+        metadatas = metadatas or [{} for _ in texts]
+        self._reserve(self.count() + len(texts), vectors.shape[1])
+        for vector, text, id, metadata in zip(vectors, texts, ids, metadatas):
+            if id in self.id_to_index:
+                # same id overwrites the existing entry
+                index = self.id_to_index[id]
+                self.texts[index] = text
+                self.metadatas[index] = metadata
+            else:
+                index = self.count()
+                self.id_to_index[id] = index
+                self.ids.append(id)
+                self.texts.append(text)
+                self.metadatas.append(metadata)
+            self.vectors[index] = vector
+        self._save()
+
+    def add_texts(
+        self,
+        texts: List[str],
+        ids: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        self.add_vectors(self.embed(texts), texts, ids, metadatas)
+
+    def max_similarity(self, vectors: np.ndarray) -> np.ndarray:
+        """Highest similarity of each query vector to the index, in one matrix product."""
+        if self.count() == 0:
+            return np.full(len(vectors), -np.inf, dtype=np.float32)
+        return (vectors @ self._matrix().T).max(axis=1)
+
+    def search_by_vector(self, vector: np.ndarray, k: int = 4) -> List[Tuple[VectorDocument, float]]:
+        k = min(k, self.count())
+        if k == 0:
+            return []
+        scores = self._matrix() @ vector
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+        else:
+            top = np.argsort(-scores)
+        return [
+            (VectorDocument(self.texts[i], self.metadatas[i]), float(scores[i]))
+            for i in top
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[VectorDocument, float]]:
+        if self.count() == 0:
+            return []
+        return self.search_by_vector(self.embed([query])[0], k=k)
+
+    def _files(self) -> Tuple[str, str]:
+        return (
+            os.path.join(self.path, f"{self.name}.npy"),
+            os.path.join(self.path, f"{self.name}.json"),
+        )
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        vectors_file, meta_file = self._files()
+        np.save(vectors_file, self._matrix())
+        with open(meta_file, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "embedding_provider": self.embedding_provider.name,
+                    "ids": self.ids,
+                    "texts": self.texts,
+                    "metadatas": self.metadatas,
+                },
+                f,
+                ensure_ascii=False,
+            )
+
+    def _load(self) -> None:
+        vectors_file, meta_file = self._files()
+        if not (os.path.exists(vectors_file) and os.path.exists(meta_file)):
+            return
+        with open(meta_file, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("embedding_provider") != self.embedding_provider.name:
+            logger.warning(
+                f"Ignoring {meta_file}: built with {meta.get('embedding_provider')}, "
+                f"not {self.embedding_provider.name}"
+            )
+            return
+        self.vectors = np.load(vectors_file).astype(np.float32)
+        self.ids = meta["ids"]
+        self.texts = meta["texts"]
+        self.metadatas = meta["metadatas"]
+        self.id_to_index = {id: i for i, id in enumerate(self.ids)}
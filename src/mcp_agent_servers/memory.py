@@ -1,27 +1,126 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
+from collections import deque
 from datetime import datetime
 import json
+import os
+import pickle
 import uuid
+import zlib
 import logging
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
-from mcp_agent_servers.setup_openai import setup_openai
+from mcp_agent_servers.embeddings import EmbeddingProvider, VectorIndex, get_embedding_provider
 
 logger = logging.getLogger(__name__)
 
-setup_openai()
+# Cosine similarity thresholds of long-term memory. They were L2 distances
+# between unit embeddings under Chroma (duplicate below 0.2, relevant below
+# 0.4); d^2 = 2 - 2 cos turns those into cos >= 0.98 and cos >= 0.92.
+DEDUP_SIMILARITY = 0.98
+RETRIEVAL_SIMILARITY = 0.92
+
+# Per-key number of entries kept in memory; older entries spill to disk.
+# Only the last one or two observations and images are read while playing.
+DEFAULT_MEMORY_CAPACITIES = {
+    "observation": 4,
+    "image": 2,
+}
+DEFAULT_MEMORY_CAPACITY = 32
+
+
+class SpillFile:
+    """Compressed, append-only file holding memory entries evicted from the ring buffers."""
 
-class GenericMemory:
     def __init__(self, path: str):
-        self.memories: Dict[str, List[Any]] = {}
+        self.path = path
+        self._file = None
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "a+b")
+        return self._file
+
+    def write(self, value: Any) -> Tuple[int, int]:
+        f = self._open()
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        f.seek(0, os.SEEK_END)
+        offset = f.tell()
+        f.write(data)
+        return offset, len(data)
+
+    def read(self, offset: int, length: int) -> Any:
+        f = self._open()
+        f.flush()
+        f.seek(offset)
+        return pickle.loads(zlib.decompress(f.read(length)))
+
+    def reset(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class MemoryBuffer:
+    """
+    Fixed-size ring buffer for one memory key.
+
+    Entries pushed out of the ring are pickled, zlib-compressed and appended
+    to a shared spill file; only their (offset, length) is kept in memory.
+    """
+
+    def __init__(self, capacity: int, spill_file: SpillFile):
+        self.ring = deque(maxlen=capacity)
+        self.spill_file = spill_file
+        self.spilled: List[Tuple[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.spilled) + len(self.ring)
+
+    def append(self, value: Any) -> None:
+        if len(self.ring) == self.ring.maxlen:
+            self.spilled.append(self.spill_file.write(self.ring[0]))
+        self.ring.append(value)
+
+    def last(self) -> Any:
+        return self.ring[-1] if self.ring else None
+
+    def recent(self, n: Optional[int] = None) -> List[Any]:
+        if n is None or n > len(self.ring):
+            num_spilled = len(self.spilled) if n is None else min(n - len(self.ring), len(self.spilled))
+            spilled = [self.spill_file.read(*loc) for loc in self.spilled[len(self.spilled) - num_spilled:]]
+            return spilled + list(self.ring)
+        if n <= 0:
+            return []
+        return list(self.ring)[-n:]
+
+
+class GenericMemory:
+    def __init__(
+        self,
+        path: str,
+        capacities: Optional[Dict[str, int]] = None,
+        default_capacity: int = DEFAULT_MEMORY_CAPACITY,
+        embedding_provider: Optional[EmbeddingProvider] = None,
+    ):
+        self.capacities = dict(DEFAULT_MEMORY_CAPACITIES)
+        self.capacities.update(capacities or {})
+        self.default_capacity = default_capacity
+        # one file per memory: agents of a multi-agent game share the log path
+        self.spill_file = SpillFile(os.path.join(path, f"memory_spill_{uuid.uuid4().hex}.bin"))
+        self.memories: Dict[str, MemoryBuffer] = {}
         self.histories = []
 
+        # version counters, bumped on every write so that derived views can refresh incrementally
+        self.version = 0
+        self.versions: Dict[str, int] = {}
+
         # long-term memory
         self.save_path = f"data/long_term_memory/{path.replace('logs/', '', 1)}/"
-        self.vectordb = Chroma(
-            collection_name="long_term_memory",
-            embedding_function=OpenAIEmbeddings(),
-            persist_directory=self.save_path,
+        self.vectordb = VectorIndex(
+            "long_term_memory",
+            embedding_provider or get_embedding_provider(),
+            path=self.save_path,
         )
         self.retrieval_top_k = 3
         
@@ -36,56 +135,105 @@ class GenericMemory:
         
     def add(self, key: str, value: Any) -> None:
         if key not in self.memories:
-            self.memories[key] = []
+            capacity = self.capacities.get(key, self.default_capacity)
+            self.memories[key] = MemoryBuffer(capacity, self.spill_file)
         self.memories[key].append(value)
+        self._touch(key)
+
+    def _touch(self, key: str) -> None:
+        self.version += 1
+        self.versions[key] = self.version
     
     def get_all(self, key: str) -> List[Any]:
-        return self.memories.get(key, [])
+        if key not in self.memories:
+            return []
+        return self.memories[key].recent()
+
+    def get_recent(self, key: str, n: Optional[int] = None) -> List[Any]:
+        """Returns the last n entries, reading from disk only if they were spilled."""
+        if key not in self.memories:
+            return []
+        return self.memories[key].recent(n)
+
+    def count(self, key: str) -> int:
+        if key not in self.memories:
+            return 0
+        return len(self.memories[key])
     
     def get_last(self, key: str) -> Any:
-        values = self.memories.get(key, [])
-        return values[-1] if values else None
+        if key not in self.memories:
+            return None
+        return self.memories[key].last()
 
     def is_exist(self, key: str) -> bool:
         return key in self.memories
     
     def clear(self) -> None:
+        for key in self.memories:
+            self._touch(key)
         self.memories = {}
+        self.spill_file.reset()
     
     def save_to_file(self, filepath: str) -> None:
         with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(self.memories, f, ensure_ascii=False, indent=2)
+            json.dump({key: self.get_all(key) for key in self.memories}, f, ensure_ascii=False, indent=2)
     
     def load_from_file(self, filepath: str) -> None:
         with open(filepath, 'r', encoding='utf-8') as f:
-            self.memories = json.load(f)
+            memories = json.load(f)
+        self.clear()
+        for key, values in memories.items():
+            for value in values:
+                self.add(key, value)
 
-    def add_long_term_memory(self, content: str, similarity_threshold: float = 0.8) -> None:
-        if not content:
-            return
+    def add_long_term_memory(self, content: str, similarity_threshold: float = DEDUP_SIMILARITY) -> None:
+        self.add_long_term_memories([content], similarity_threshold=similarity_threshold)
 
-        results = self.vectordb.similarity_search_with_score(content, k=1)
+    def add_long_term_memories(self, contents: List[str], similarity_threshold: float = DEDUP_SIMILARITY) -> List[str]:
+        """
+        Adds a batch of memories with one embedding request and one index write.
 
-        if results:
-            _, score = results[0]
+        A candidate is dropped if it is too similar to a stored memory or to an
+        earlier candidate kept from the same batch, which gives the same result
+        as adding the candidates one by one. Returns the memories that were saved.
+        """
+        contents = [content for content in contents if content]
+        if not contents:
+            return []
+
+        vectors = self.vectordb.embed(contents)
+        store_scores = self.vectordb.max_similarity(vectors)
+        batch_scores = vectors @ vectors.T
+
+        kept = []
+        for i, content in enumerate(contents):
+            score = max([store_scores[i]] + [batch_scores[i, j] for j in kept])
             if score >= similarity_threshold:
                 logger.info(f"The new memory is too similar ({score}>={similarity_threshold}) to an existing memory and will not be saved.")
-                return
+                continue
+            kept.append(i)
+
+        if not kept:
+            return []
 
-        mem_id = str(uuid.uuid4())
-        self.vectordb.add_texts(
-            texts=[content],
-            ids=[mem_id],
-            metadatas=[{"id": mem_id}],
+        mem_ids = [str(uuid.uuid4()) for _ in kept]
+        saved = [contents[i] for i in kept]
+        self.vectordb.add_vectors(
+            vectors[kept],
+            texts=saved,
+            ids=mem_ids,
+            metadatas=[{"id": mem_id} for mem_id in mem_ids],
         )
-        self.add("long_term_memory", content)
+        for content in saved:
+            self.add("long_term_memory", content)
+        return saved
 
-    def retrieve_long_term_memory(self, query: str, save_to_file: bool = False, similarity_threshold: float = 0.8) -> str:
-        k = min(self.vectordb._collection.count(), self.retrieval_top_k)
+    def retrieve_long_term_memory(self, query: str, save_to_file: bool = False, similarity_threshold: float = RETRIEVAL_SIMILARITY) -> str:
+        k = min(self.vectordb.count(), self.retrieval_top_k)
         if k == 0 or not query:
             return None
         docs_and_scores = self.vectordb.similarity_search_with_score(query, k=k)
-        # Filter documents with similarity score >= 0.8
+        # Filter documents with cosine similarity >= similarity_threshold
         filtered_docs = [(doc, score) for doc, score in docs_and_scores if score >= similarity_threshold]
         retrieved_contents = "\n".join([f"{i+1}: {doc.page_content}" for i, (doc, _) in enumerate(filtered_docs)])
         if retrieved_contents == "":
@@ -0,0 +1,111 @@
+import importlib
+import logging
+import pkgutil
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RenderedPrompt(str):
+    """A rendered prompt that keeps the static prefix of its template, for provider-side prompt caching."""
+
+    def __new__(cls, text: str, static_prefix: str = ""):
+        prompt = super().__new__(cls, text)
+        prompt.static_prefix = static_prefix
+        return prompt
+
+
+class PromptTemplate:
+    """
+    A `str.format` template split once into its static prefix and dynamic slots.
+
+    Rendering only formats the slots and joins them with the pre-split literal
+    text, instead of re-parsing the whole (mostly static) template every step.
+    `static_prefix` is the text before the first slot; it is identical across
+    steps and can be marked for provider-side prompt caching.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+
+        # [(literal_text, field_name, field_template)], where field_template is
+        # None for plain "{name}" slots and a small format string otherwise
+        self.segments: List[Tuple[str, Optional[str], Optional[str]]] = []
+        for literal_text, field_name, format_spec, conversion in Formatter().parse(template):
+            if field_name is None:
+                self.segments.append((literal_text, None, None))
+            elif field_name.isidentifier() and not format_spec and not conversion:
+                self.segments.append((literal_text, field_name, None))
+            else:
+                field_template = "{" + field_name
+                if conversion:
+                    field_template += "!" + conversion
+                if format_spec:
+                    field_template += ":" + format_spec
+                field_template += "}"
+                self.segments.append((literal_text, field_name, field_template))
+
+        if self.segments and self.segments[0][1] is not None:
+            self.static_prefix = self.segments[0][0]
+        else:
+            self.static_prefix = "".join(literal_text for literal_text, _, _ in self.segments)
+
+    def render(self, **kwargs) -> RenderedPrompt:
+        parts = []
+        for literal_text, field_name, field_template in self.segments:
+            parts.append(literal_text)
+            if field_name is None:
+                continue
+            if field_template is None:
+                parts.append(format(kwargs[field_name], ""))
+            else:
+                parts.append(field_template.format(**kwargs))
+        return RenderedPrompt("".join(parts), self.static_prefix)
+
+
+class PromptRegistry:
+    """Loads and precompiles every prompt module under a prompt path once."""
+
+    def __init__(self, prompt_path: str):
+        self.prompt_path = prompt_path
+        self.templates: Dict[str, PromptTemplate] = {}
+
+        package = importlib.import_module(prompt_path)
+        for module_info in pkgutil.iter_modules(package.__path__):
+            try:
+                self._load(module_info.name)
+            except Exception as e:
+                # leave it to `get` so that the error surfaces where the prompt is used
+                logger.warning(f"Failed to preload prompt {prompt_path}.{module_info.name}: {e}")
+
+    def _load(self, name: str) -> Optional[PromptTemplate]:
+        _module = importlib.import_module(f"{self.prompt_path}.{name}")
+        prompt = getattr(_module, "PROMPT", None)
+        if prompt is None:
+            return None
+        self.templates[name] = PromptTemplate(prompt)
+        return self.templates[name]
+
+    def get(self, name: str) -> PromptTemplate:
+        if name not in self.templates:
+            # modules added after loading (or outside the package listing) are compiled on demand
+            if self._load(name) is None:
+                raise AttributeError(f"Prompt module {self.prompt_path}.{name} has no PROMPT")
+        return self.templates[name]
+
+    def render(self, name: str, **kwargs) -> RenderedPrompt:
+        return self.get(name).render(**kwargs)
+
+    def static_prefix(self, name: str) -> str:
+        return self.get(name).static_prefix
+
+
+_REGISTRIES: Dict[str, PromptRegistry] = {}
+
+
+def get_prompt_registry(prompt_path: str) -> PromptRegistry:
+    if prompt_path not in _REGISTRIES:
+        _REGISTRIES[prompt_path] = PromptRegistry(prompt_path)
+        logger.info(f"Loaded {len(_REGISTRIES[prompt_path].templates)} prompts from {prompt_path}")
+    return _REGISTRIES[prompt_path]
@@ -1,19 +1,15 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import json
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
-from mcp_agent_servers.setup_openai import setup_openai
-
-setup_openai()
+from mcp_agent_servers.embeddings import EmbeddingProvider, VectorIndex, get_embedding_provider
 
 class SkillManager:
-    def __init__(self, path):
+    def __init__(self, path, embedding_provider: Optional[EmbeddingProvider] = None):
         self.save_path = f"data/skills/{path.replace('logs/', '', 1)}/"
         self.skills: Dict[str, List[Any]] = {}
-        self.vectordb = Chroma(
-            collection_name="skill_vectordb",
-            embedding_function=OpenAIEmbeddings(),
-            persist_directory=self.save_path,
+        self.vectordb = VectorIndex(
+            "skill_vectordb",
+            embedding_provider or get_embedding_provider(),
+            path=self.save_path,
         )
         self.retrieval_top_k = 5
     
@@ -28,12 +24,12 @@ class SkillManager:
                 ids=[skill_name],
                 metadatas=[{"name": skill_name}],
             )
-            assert self.vectordb._collection.count() == len(
+            assert self.vectordb.count() == len(
                 self.skills
             ), "vectordb is not synced with skills dictionary"
     
     def retrieve_skills(self, query: str) -> str:
-        k = min(self.vectordb._collection.count(), self.retrieval_top_k)
+        k = min(self.vectordb.count(), self.retrieval_top_k)
         if k == 0 or query is None:
             return ""
         docs_and_scores = self.vectordb.similarity_search_with_score(query, k=k)
@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Optional
 
 import gymnasium as gym
 
@@ -26,3 +26,20 @@ class BaseEnv(gym.Env, Configurable):
 
     def get_game_info(self) -> dict:
         pass
+
+    def policy_action(self, obs: Obs) -> Optional[str]:
+        """
+        Cheap rule for trivial states, consulted before the agent when the
+        runner's `policy_tier` is on. Returns the action text to execute for
+        `obs`, or None to let the agent decide. Observations handled here never
+        reach the agent.
+        """
+        return None
+
+    def action_validity(self, text: str) -> Optional[float]:
+        """
+        Score between 0 and 1 of how much of the action text the env can
+        execute as legal moves, used to vote between sampled action candidates.
+        Must not change the state of the env. None if the env cannot tell.
+        """
+        return None
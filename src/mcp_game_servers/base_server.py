@@ -2,14 +2,15 @@ import sys
 import os
 import json
 from datetime import datetime
-from typing import Tuple
+from typing import Optional, Tuple
 import omegaconf
 import logging
-import base64
-from io import BytesIO
 
 from mcp.server.fastmcp import FastMCP
 from mcp_game_servers.utils.module_creator import EnvCreator
+from mcp_game_servers.utils.tracing import enable_tracing, span
+from mcp_game_servers.utils.types.encoded_image import EncodedImage
+from mcp_game_servers.utils.types.frame_channel import FrameChannel
 
 logger = logging.getLogger(__name__)
 
@@ -48,10 +49,18 @@ class MCPGameServer:
         logger.info(f"config_path: {config_path}")
         self.mcp = mcp_server
         self.register_tools()
+        if self.cfg.get("trace", False):
+            enable_tracing(os.path.join(self.cfg.log_path, "trace_game_server.json"), "game_server")
 
         # set env
         self.env = EnvCreator(self.cfg).create()
 
+        # frames are passed by handle through a memory-mapped ring buffer instead of as base64
+        self.frame_channel = None
+        if self.cfg.get("obs_transport", "json") == "shared_memory":
+            self.frame_channel = FrameChannel.create()
+            logger.info(f"Sharing observation frames through {self.frame_channel.path}")
+
         # set temp var
         self.obs = None
         self.first_loading = True
@@ -61,54 +70,80 @@ class MCPGameServer:
         cfg = set_log_path(cfg, expand_log_path)
         return cfg
 
-    def image2str(self, image):
-        buffered = BytesIO()
-        image.save(buffered, format="JPEG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        return img_str
-
-    def load_current_obs(self) -> Tuple[str, dict]:
+    def load_current_obs(self) -> Tuple[str, Optional[EncodedImage], dict]:
         if self.first_loading:
             self.obs = self.env.initial_obs()
             self.first_loading = False
         obs_str, obs_image = self.obs.to_text(), getattr(self.obs, 'image', None)
         game_info = self.env.get_game_info()
 
-        # encode image to base64
+        # encode image once; the encoded bytes are carried as-is up to the LLM request
         if obs_image is not None:
-            obs_image_str = self.image2str(obs_image)
-        else:
-            obs_image_str = ""
-        return obs_str, obs_image_str, game_info
+            obs_image = EncodedImage.from_pil(obs_image, format="JPEG")
+        return obs_str, obs_image, game_info
 
     def dispatch_action_and_get_score(self, action_str: str) -> Tuple[int, bool]:
         score = -1
-        action = self.env.text2action(action_str)
+        with span("env.text2action", "env"):
+            action = self.env.text2action(action_str)
         logger.info(f"executing actions: {action}")
-        self.obs, reward, terminated, truncated, info = self.env.step(action)
-        score, done = self.env.evaluate(self.obs)
+        with span("env.step", "env"):
+            self.obs, reward, terminated, truncated, info = self.env.step(action)
+        with span("env.evaluate", "env"):
+            score, done = self.env.evaluate(self.obs)
         is_finished = terminated or truncated or done
         return score, is_finished
 
+    def policy_action(self) -> Optional[str]:
+        if not self.cfg.get("policy_tier", False):
+            return None
+        with span("env.policy_action", "env"):
+            return self.env.policy_action(self.obs)
+
+    def load_obs_payload(self) -> dict:
+        with span("env.load_obs", "env"):
+            obs_str, obs_image, game_info = self.load_current_obs()
+        logger.info(f"load_obs result: {obs_str}, \n{game_info}")
+        obs_image_handle = None
+        if obs_image is not None and self.frame_channel is not None:
+            # falls back to base64 if the frame does not fit in a slot
+            obs_image_handle = self.frame_channel.write(obs_image.data)
+        return {
+            "obs_str": obs_str,
+            "obs_image_str": obs_image.to_base64() if obs_image is not None and obs_image_handle is None else "",
+            "obs_image_mime_type": obs_image.mime_type if obs_image is not None else "",
+            "obs_image_sha256": obs_image.sha256 if obs_image is not None else "",
+            "obs_image_handle": obs_image_handle,
+            "game_info": game_info,
+            "policy_action": self.policy_action(),
+        }
+
     def register_tools(self):
         @self.mcp.tool(name="load-obs", description="Load observation and game info from the server.")
         def load_obs() -> str:
-            obs_str, obs_image_str, game_info = self.load_current_obs()
-            logger.info(f"load_obs result: {obs_str}, \n{game_info}")
-            return json.dumps({
-                "obs_str": obs_str,
-                "obs_image_str": obs_image_str,
-                "game_info": game_info
-            })
+            with span("tool.load-obs", "mcp"):
+                return json.dumps(self.load_obs_payload())
 
         @self.mcp.tool(name="dispatch-final-action", description="Dispatch a client final action to the server and return score and termination flag")
         def dispatch_final_action(action_str: str) -> str:
-            score, is_finished = self.dispatch_action_and_get_score(action_str)
+            with span("tool.dispatch-final-action", "mcp"):
+                score, is_finished = self.dispatch_action_and_get_score(action_str)
             logger.info(f"dispatch_final_action result: {score}, {is_finished}")
             return json.dumps({
                 "score": score,
                 "is_finished": is_finished
             })
 
+        @self.mcp.tool(name="dispatch-and-observe", description="Dispatch a client final action, then return score, termination flag and the next observation unless the game is finished")
+        def dispatch_and_observe(action_str: str) -> str:
+            with span("tool.dispatch-and-observe", "mcp"):
+                score, is_finished = self.dispatch_action_and_get_score(action_str)
+                logger.info(f"dispatch_and_observe result: {score}, {is_finished}")
+                return json.dumps({
+                    "score": score,
+                    "is_finished": is_finished,
+                    "obs": None if is_finished else self.load_obs_payload(),
+                })
+
     async def run(self):
         await self.mcp.run_stdio_async()
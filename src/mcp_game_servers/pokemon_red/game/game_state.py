@@ -0,0 +1,215 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# work RAM, which holds every address the state is decoded from
+WRAM_START = 0xC000
+WRAM_END = 0xE000
+
+STATUS_NAMES = {
+    0: "Normal state",
+    1: "Sleep", 2: "Sleep", 3: "Sleep", 4: "Sleep", 5: "Sleep", 6: "Sleep", 7: "Sleep",
+    8: "Poisoned",
+    16: "Burned",
+    32: "Frozen",
+    64: "Paralyzed"
+}
+
+
+class WramSnapshot:
+    """Copy of the work RAM, indexed by Game Boy address like `pyboy.memory`."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def __getitem__(self, addr):
+        if isinstance(addr, slice):
+            return self.data[addr.start - WRAM_START:addr.stop - WRAM_START]
+        return self.data[addr - WRAM_START]
+
+
+@dataclass
+class PartyPokemon:
+    nickname: str
+    species: str
+    level: int
+    status: str
+    type1: str
+    type2: str
+    hp: int
+    max_hp: int
+    moves: List[Tuple[str, int]]  # (move name, pp)
+    in_battle: bool = False
+
+    def to_text(self) -> str:
+        prefix = "[In-battle] Name:" if self.in_battle else "Name: "
+        if self.type1 != self.type2:
+            text = f"{prefix}{self.nickname}, Species: {self.species}, Level: {self.level}, Status: {self.status}, Type: {self.type1}/{self.type2}, HP: {self.hp}/{self.max_hp}"
+        else:
+            text = f"{prefix}{self.nickname}, Species: {self.species}, Level: {self.level}, Status: {self.status}, Type: {self.type1}, HP: {self.hp}/{self.max_hp}, Moves: "
+        return text + ", ".join(f"{name}(pp={pp})" for name, pp in self.moves)
+
+
+@dataclass
+class MapInfo:
+    map_id: int
+    map_name: str
+    x_max: int
+    y_max: int
+    player_x: int
+    player_y: int
+    facing: str
+    tile_type: Optional[str] = None
+    map_connection: Optional[str] = None
+    # cells of the 9x9 window around the player (clipped to the map), None outside the Field state
+    window: Optional[np.ndarray] = None
+    window_origin: Tuple[int, int] = (0, 0)  # map (x, y) of window[0, 0]
+
+    def window_cells(self):
+        """Yields (x, y, cell) for every cell of the window, row by row."""
+        if self.window is None:
+            return
+        x0, y0 = self.window_origin
+        for dy, row in enumerate(self.window):
+            for dx, cell in enumerate(row):
+                yield x0 + dx, y0 + dy, str(cell)
+
+    def screen_text(self) -> str:
+        if self.window is None:
+            return "Not in Field State"
+        x0, y0 = self.window_origin
+        text = ""
+        for dy, row in enumerate(self.window):
+            for dx, cell in enumerate(row):
+                text += f"({x0 + dx:2d}, {y0 + dy:2d}): {cell}\t"
+            text += "\n"
+        return text
+
+    def to_text(self) -> str:
+        text = "[Map Info]\n"
+        text += f"Map Name: {self.map_name}, (x_max , y_max): ({self.x_max}, {self.y_max})\n"
+        text += f"Map type: {self.tile_type or 'UNKNOWN'}\n"
+        text += f"Expansion direction: {self.map_connection or 'None'}\n"
+        text += f"Your position (x, y): ({self.player_x}, {self.player_y})\n"
+        text += f"Your facing direction: {self.facing}\n"
+        text += "Action instruction\n"
+        text += " - up: (x, y) -> (x, y-1)\n"
+        text += " - down: (x, y) -> (x, y+1)\n"
+        text += " - left: (x, y) -> (x-1, y)\n"
+        text += " - right: (x, y) -> (x+1, y)\n"
+        text += "\nMap on Screen:\n"
+        return text + self.screen_text()
+
+    def to_dict(self) -> dict:
+        return {
+            "map_name": self.map_name,
+            "map_type": str(self.tile_type or 'UNKNOWN'),
+            "expansion_direction": str(self.map_connection or 'None'),
+            "x_max": self.x_max,
+            "y_max": self.y_max,
+            "player_pos_x": self.player_x,
+            "player_pos_y": self.player_y,
+            "facing": self.facing,
+            "map_screen_raw": None if self.window is not None and len(self.window) == 0 else self.screen_text().strip(),
+            "map_window": self.window,
+            "map_window_origin": self.window_origin,
+        }
+
+
+@dataclass
+class PokemonRedState:
+    """
+    Snapshot of the game state decoded from one read of the work RAM.
+
+    Text is only rendered at the prompt boundary: `to_text` gives the state text
+    shown to the agent, and `to_dict` the same fields as
+    `PokemonRedEnv.parse_game_state` returns for that text, plus the map window
+    as an array, without the round-trip through the text.
+    """
+    state: str  # Title, Field, Dialog, WildBattle, TrainerBattle or LinkBattle
+    filtered_screen_text: str  # "N/A" if the screen shows no text
+    selection_box: Optional[List[str]]  # lines of the open selection box
+    enemy_pokemon: Dict[str, str]  # empty outside battles
+    party: List[PartyPokemon]
+    badges: List[str]
+    item_count: int
+    items: List[Tuple[str, int]]  # (item name, quantity)
+    money: int
+    map_info: MapInfo
+
+    def dialog_text(self) -> str:
+        text = "[Filtered Screen Text]\n"
+        text += self.filtered_screen_text + "\n"
+        text += "\n[Selection Box Text]\n"
+        if self.selection_box is not None:
+            text += "----------------\n"
+            for line in self.selection_box:
+                text += line + "\n"
+            text += "----------------\n"
+        else:
+            text += "N/A\n"
+        return text
+
+    def selection_box_text(self) -> str:
+        if self.selection_box is None:
+            return "N/A"
+        return "\n".join(["----------------", *self.selection_box, "----------------"])
+
+    def enemy_text(self) -> str:
+        text = "\n[Enemy Pokemon]\n"
+        if self.enemy_pokemon:
+            for key, value in self.enemy_pokemon.items():
+                text += f"{key}: {value}\n"
+        else:
+            text += "- Not in battle\n"
+        return text
+
+    def _party_lines(self) -> str:
+        text = ""
+        for pokemon in self.party:
+            text += pokemon.to_text() + "\n"
+        if len(self.party) < 6:
+            text += "No more Pokemons\n"
+        return text
+
+    def party_text(self) -> str:
+        return "\n[Current Party]\n" + self._party_lines()
+
+    def badge_text(self) -> str:
+        return "\n[Badge List]\n" + (", ".join(self.badges) if self.badges else "N/A") + "\n"
+
+    def inventory_text(self) -> str:
+        text = "[Bag]\n"
+        text += f"({self.item_count} items):\n" if self.item_count > 0 else "N/A\n"
+        for name, quantity in self.items:
+            text += f"- {name} × {quantity}\n"
+        return text
+
+    def money_text(self) -> str:
+        return f"\n[Current Money]: ¥{self.money}\n"
+
+    def to_text(self) -> str:
+        return "\n".join([
+            "State: " + self.state + "\n",
+            self.dialog_text(),
+            self.enemy_text(),
+            self.party_text(),
+            self.badge_text(),
+            self.inventory_text(),
+            self.money_text(),
+            self.map_info.to_text(),
+        ])
+
+    def to_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "filtered_screen_text": self.filtered_screen_text,
+            "selection_box_text": self.selection_box_text(),
+            "enemy_pokemon": dict(self.enemy_pokemon),
+            "your_party": self._party_lines().strip(),
+            "badge_list": ", ".join(self.badges) if self.badges else "N/A",
+            "inventory": self.inventory_text()[len("[Bag]\n"):].strip(),
+            "money": self.money,
+            "map_info": self.map_info.to_dict(),
+        }
@@ -0,0 +1,185 @@
+import importlib.util
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+MAP_DIR = "./src/mcp_game_servers/pokemon_red/game/processed_map"
+ASM_DIR = "./src/mcp_game_servers/pokemon_red/game/pokered/data/maps/objects/"
+
+# compiled map database written by utils/map_preprocess.py
+INDEX_NAME = "map_db.json"
+TILE_MAPS_NAME = "tile_maps.npy"
+COLL_MAPS_NAME = "coll_maps.npy"
+
+
+@dataclass
+class MapData:
+    tile_type: Optional[str] = None
+    map_connection: Optional[str] = None
+    tile_map: Optional[np.ndarray] = None  # tile ids, (height * 4, width * 4)
+    coll_map: Optional[np.ndarray] = None  # cell strings as an object array, (height * 2, width * 2)
+    sprites: List[str] = field(default_factory=list)  # sprite of each map object, in object order
+
+    def cells(self, xs: range, ys: range) -> np.ndarray:
+        """Cells of the collision map in `xs` x `ys`, "?" outside of it."""
+        window = np.full((len(ys), len(xs)), "?", dtype=object)
+        if self.coll_map is None:
+            return window
+        h, w = self.coll_map.shape
+        x0, x1 = max(xs.start, 0), min(xs.stop, w)
+        y0, y1 = max(ys.start, 0), min(ys.stop, h)
+        if x0 < x1 and y0 < y1:
+            window[y0 - ys.start:y1 - ys.start, x0 - xs.start:x1 - xs.start] = self.coll_map[y0:y1, x0:x1]
+        return window
+
+
+def write_map_database(maps: Dict[str, dict], output_dir: str = MAP_DIR) -> None:
+    """
+    Compiles preprocessed maps into the map database.
+
+    `maps` maps a map name to its `tile_type`, `map_connection`, `tile_map`,
+    `coll_map` (lists of rows) and `sprites`. Tile and collision maps of all maps
+    are concatenated into two flat arrays, collision cells encoded as indices
+    into a shared vocabulary of cell strings; `map_db.json` holds the vocabulary
+    and the offset and shape of every map.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    vocabulary: Dict[str, int] = {}
+    index = {}
+    tile_chunks, coll_chunks = [], []
+    tile_offset = coll_offset = 0
+
+    for map_name, data in sorted(maps.items()):
+        tile_map = np.asarray(data["tile_map"], dtype=np.uint8).reshape(len(data["tile_map"]), -1)
+        coll_map = np.array(
+            [[vocabulary.setdefault(cell, len(vocabulary)) for cell in row] for row in data["coll_map"]],
+            dtype=np.uint16,
+        ).reshape(len(data["coll_map"]), -1)
+
+        index[map_name] = {
+            "tile_type": data["tile_type"],
+            "map_connection": data["map_connection"],
+            "tile_offset": tile_offset,
+            "tile_shape": list(tile_map.shape),
+            "coll_offset": coll_offset,
+            "coll_shape": list(coll_map.shape),
+            "sprites": list(data.get("sprites", [])),
+        }
+        tile_chunks.append(tile_map.ravel())
+        coll_chunks.append(coll_map.ravel())
+        tile_offset += tile_map.size
+        coll_offset += coll_map.size
+
+    np.save(os.path.join(output_dir, TILE_MAPS_NAME), np.concatenate(tile_chunks or [np.zeros(0, np.uint8)]))
+    np.save(os.path.join(output_dir, COLL_MAPS_NAME), np.concatenate(coll_chunks or [np.zeros(0, np.uint16)]))
+    with open(os.path.join(output_dir, INDEX_NAME), "w", encoding="utf-8") as f:
+        json.dump({"cells": list(vocabulary), "maps": index}, f)
+
+
+def load_map_module(map_name, map_dir=MAP_DIR):
+    path = os.path.join(map_dir, f"{map_name}.py")
+    if not os.path.exists(path):
+        print(f"[WARN] Map module not found: {path}")
+        return None, None, None, None
+
+    spec = importlib.util.spec_from_file_location(map_name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod.tile_type, mod.map_connection, mod.tile_map, mod.coll_map
+
+
+def parse_object_sprites(asm_path):
+    if not os.path.exists(asm_path):
+        print(f"[WARN] asm not found: {asm_path}")
+        return []
+
+    sprite_names = []
+    pattern = re.compile(r"object_event\s+\d+,\s*\d+,\s*([A-Z0-9_]+)")
+
+    with open(asm_path, encoding="utf-8") as f:
+        for line in f:
+            match = pattern.search(line)
+            if match:
+                sprite = match.group(1)
+                sprite_names.append(sprite)
+    return sprite_names
+
+
+class MapDatabase:
+    """
+    Map data of Pokemon Red, decoded at most once per map.
+
+    Reads the compiled database of `map_dir` with its arrays memory-mapped, so a
+    map costs no file I/O after its first lookup. Trees preprocessed before the
+    database existed still have one `<map>.py` module per map; those are
+    executed once per map instead, with the object sprites parsed from the
+    pokered sources.
+    """
+
+    def __init__(self, map_dir: str = MAP_DIR, asm_dir: str = ASM_DIR):
+        self.map_dir = map_dir
+        self.asm_dir = asm_dir
+        self._maps: Dict[str, MapData] = {}
+        self._lock = threading.Lock()
+
+        self.index = None
+        index_path = os.path.join(map_dir, INDEX_NAME)
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as f:
+                self.index = json.load(f)
+            self.cells = np.array(self.index["cells"] + ["?"], dtype=object)
+            self.tile_maps = np.load(os.path.join(map_dir, TILE_MAPS_NAME), mmap_mode="r")
+            self.coll_maps = np.load(os.path.join(map_dir, COLL_MAPS_NAME), mmap_mode="r")
+        else:
+            print(f"[WARN] Map database not found in {map_dir}, run utils/map_preprocess.py to build it")
+
+    def get(self, map_name: str) -> MapData:
+        with self._lock:
+            if map_name not in self._maps:
+                self._maps[map_name] = self._load(map_name)
+            return self._maps[map_name]
+
+    def _load(self, map_name: str) -> MapData:
+        if self.index is None:
+            return self._load_module(map_name)
+
+        entry = self.index["maps"].get(map_name)
+        if entry is None:
+            print(f"[WARN] Map not in the map database: {map_name}")
+            return MapData()
+
+        th, tw = entry["tile_shape"]
+        ch, cw = entry["coll_shape"]
+        tile_offset, coll_offset = entry["tile_offset"], entry["coll_offset"]
+        codes = self.coll_maps[coll_offset:coll_offset + ch * cw].reshape(ch, cw)
+        return MapData(
+            tile_type=entry["tile_type"],
+            map_connection=entry["map_connection"],
+            tile_map=self.tile_maps[tile_offset:tile_offset + th * tw].reshape(th, tw),
+            coll_map=self.cells[codes],
+            sprites=entry["sprites"],
+        )
+
+    def _load_module(self, map_name: str) -> MapData:
+        tile_type, map_connection, tile_map, coll_map = load_map_module(map_name, self.map_dir)
+        sprites = parse_object_sprites(os.path.join(self.asm_dir, f"{map_name}.asm"))
+        if coll_map is None:
+            return MapData(sprites=sprites)
+
+        # rows may differ in length; cells past the end of a row read as "?"
+        width = max((len(row) for row in coll_map), default=0)
+        cells = np.full((len(coll_map), width), "?", dtype=object)
+        for y, row in enumerate(coll_map):
+            cells[y, :len(row)] = row
+        return MapData(
+            tile_type=tile_type,
+            map_connection=map_connection,
+            tile_map=np.asarray(tile_map, dtype=np.uint8),
+            coll_map=cells,
+            sprites=sprites,
+        )
@@ -23,6 +23,8 @@ class PokemonRedObs(Obs):
     state_text: str
     terminated: bool = False
     image: Image.Image = None
+    state_dict: dict = None  # fields of the state, as returned by parse_game_state
+    dialog_buffer: list = None  # screen text of the dialog the policy tier advanced since the agent's last turn
 
     def to_text(self) -> str:
         return self.state_text
@@ -46,6 +48,8 @@ class PokemonRedEnv(BaseEnv):
         success_condition: str
         exp_name: str
         input_modality: str = "text"
+        # headless lock-step emulation: no tick thread, settle on RAM instead of sleeping
+        lockstep: bool = False
 
     cfg: Config
 
@@ -59,8 +63,10 @@ class PokemonRedEnv(BaseEnv):
 
         self.running = True
         self.pending_action = None
+        self.skipped_dialog = []
 
-        self.runner = PyBoyRunner(self.rom_path)
+        self.lockstep = self.cfg.lockstep
+        self.runner = PyBoyRunner(self.rom_path, lockstep=self.lockstep)
 
         self.exp_name = self.cfg.exp_name
 
@@ -76,12 +82,22 @@ class PokemonRedEnv(BaseEnv):
     def _start_game(self):
         # === Execute mGBA (with Lua script) ===
         print("[Python] Launching PyBoy...")
-        
+
+        if self.lockstep:
+            # boot for at least the 5 s the threaded mode waits, then until idle
+            self.runner.settle(min_frames=300, max_frames=1200)
+            return
+
         # PyBoy game loop in SubThread
-        game_thread = threading.Thread(target=self.runner.tick_loop, daemon=True)
-        game_thread.start()
+        self.tick_thread = threading.Thread(target=self.runner.tick_loop, daemon=True)
+        self.tick_thread.start()
         
         time.sleep(5)
+
+    def wait(self, seconds):
+        """Waits for the game to progress; a no-op in lock-step mode, where inputs return once the game settled."""
+        if not self.lockstep:
+            time.sleep(seconds)
         
     def _send_action(self, action):
         # self.sock.sendall((action + "\n").encode())
@@ -92,6 +108,10 @@ class PokemonRedEnv(BaseEnv):
         data = self.runner.get_state()
 
         return data
+
+    def _receive_state_dict(self):
+        # decoded straight from RAM, without rendering and re-parsing the state text
+        return self.runner.get_state_snapshot().to_dict()
     
     def parse_game_state(self, text):
         result = {}
@@ -172,14 +192,15 @@ class PokemonRedEnv(BaseEnv):
         return result
     
     def initial_obs(self) -> Obs:
-        state_text = self._receive_state()
+        snapshot = self.runner.get_state_snapshot()
+        state_text = snapshot.to_text()
         self.state_text = state_text
-        self.state_dict = self.parse_game_state(self.state_text)
+        self.state_dict = snapshot.to_dict()
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
         
         image = self.runner.take_screenshot(dir_name=os.path.join(self.log_path, 'screenshots'), img_name=f'screenshot_{timestamp}.png')
-        return PokemonRedObs(state_text=state_text, image=image)
+        return PokemonRedObs(state_text=state_text, image=image, state_dict=self.state_dict)
 
     def obs2text(self, obs: Obs) -> str:
         return obs.to_text()
@@ -187,19 +208,30 @@ class PokemonRedEnv(BaseEnv):
     def text2action(self, text: str) -> Action:
         return PokemonRedAction(action=text.strip())
     
+    def policy_action(self, obs: Obs):
+        # plain dialog with nothing to choose only needs to be advanced
+        state_dict = obs.state_dict or self.parse_game_state(obs.to_text())
+        if state_dict['state'] == 'Dialog' and state_dict['selection_box_text'] == "N/A":
+            # the agent never sees this screen; hand its text over on the agent's next turn
+            self.skipped_dialog.append(state_dict['filtered_screen_text'])
+            return 'a'
+        if self.skipped_dialog:
+            obs.dialog_buffer, self.skipped_dialog = self.skipped_dialog, []
+        return None
+
     def send_action_set(self, commands):
         if commands == [] or commands == None:
             self._send_action('pass')
-            time.sleep(0.1)
+            self.wait(0.1)
             return
         
         for action in commands:
             if action not in ['up', 'down', 'left', 'right', 'a', 'b', 'start', 'select', 'none', 'quit']:
                 self._send_action('pass')
-                time.sleep(0.1)
+                self.wait(0.1)
                 return
             self._send_action(action)
-            time.sleep(0.1)
+            self.wait(0.1)
         
     def step(self, action: Action):
         actions = action.action.strip("'\"").lower()
@@ -207,18 +239,19 @@ class PokemonRedEnv(BaseEnv):
 
         self.send_action_set(commands)
 
-        time.sleep(3)
-        state_text = self._receive_state()
+        self.wait(3)
+        snapshot = self.runner.get_state_snapshot()
+        state_text = snapshot.to_text()
 
         self.prev_state_text = self.state_text
         self.prev_state_dict = self.state_dict
         self.state_text = state_text
-        self.state_dict = self.parse_game_state(self.state_text)
+        self.state_dict = snapshot.to_dict()
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
         
         image = self.runner.take_screenshot(dir_name=os.path.join(self.log_path, 'screenshots'), img_name=f'screenshot_{timestamp}.png')
-        obs = PokemonRedObs(state_text=state_text, image=image)
+        obs = PokemonRedObs(state_text=state_text, image=image, state_dict=self.state_dict)
         reward, terminated, truncated, info = 0, False, False, {}
         return obs, reward, terminated, truncated, info
     
@@ -275,6 +308,6 @@ class PokemonRedEnv(BaseEnv):
 
     def close(self):
         self.running = False
-        self.pyboy.stop()
+        self.runner.stop()
         if hasattr(self, "tick_thread") and self.tick_thread.is_alive():
             self.tick_thread.join(timeout=1)
@@ -7,47 +7,46 @@ import os
 import re
 import glob
 import json
-import importlib.util
+
+import numpy as np
+
+from mcp_game_servers.pokemon_red.game.game_state import (
+    WRAM_END,
+    WRAM_START,
+    STATUS_NAMES,
+    MapInfo,
+    PartyPokemon,
+    PokemonRedState,
+    WramSnapshot,
+)
+from mcp_game_servers.pokemon_red.game.map_database import MapDatabase
 
 frame_time = 0.01
 
+# RAM read by the lock-step settle condition
+WALK_COUNTER_ADDR = 0xCFC5  # wWalkCounter, non-zero while the player steps between tiles
+TILEMAP_ADDR = 0xC3A0  # wTileMap, 20x18 tiles of the screen
+TILEMAP_SIZE = 20 * 18
+PLAYER_POS_ADDRS = (0xD35E, 0xD361, 0xD362)  # wCurMap, wYCoord, wXCoord
+BGP_ADDR = 0xFF47  # rBGP, background palette, stepped every few frames while the screen fades
+FADED_PALETTES = (0x00, 0xFF)  # all white / all black: screen blanked for a warp or a battle transition
+
 def load_json(path):
     with open(path, encoding='utf-8') as f:
         return json.load(f)
 
-def load_map_module(map_name):
-    path = os.path.join("./src/mcp_game_servers/pokemon_red/game/processed_map", f"{map_name}.py")
-    if not os.path.exists(path):
-        print(f"[WARN] Map module not found: {path}")
-        return None, None, None, None
-
-    spec = importlib.util.spec_from_file_location(map_name, path)
-    mod = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(mod)
-    return mod.tile_type, mod.map_connection, mod.tile_map, mod.coll_map
-
-def parse_object_sprites(asm_path):
-    if not os.path.exists(asm_path):
-        print(f"[WARN] asm not found: {asm_path}")
-        return []
-
-    sprite_names = []
-    pattern = re.compile(r"object_event\s+\d+,\s*\d+,\s*([A-Z0-9_]+)")
-
-    with open(asm_path, encoding="utf-8") as f:
-        for line in f:
-            match = pattern.search(line)
-            if match:
-                sprite = match.group(1)
-                sprite_names.append(sprite)
-    return sprite_names
-
 class PyBoyRunner:
-    def __init__(self, rom_path):
+    def __init__(self, rom_path, lockstep=False):
         self.pyboy = PyBoy(rom_path, window="null")  # Run without GUI
         self.running = True
         self.lock = threading.Lock()
 
+        # Lock-step mode: no free-running tick thread, inputs advance the emulator
+        # unthrottled until the game settles instead of sleeping per frame.
+        self.lockstep = lockstep
+        if self.lockstep:
+            self.pyboy.set_emulation_speed(0)
+
         self.json_dir = "./src/mcp_game_servers/pokemon_red/game/mapping_json/"
         self.asm_dir = "./src/mcp_game_servers/pokemon_red/game/pokered/data/maps/objects/"
         self.species_names = load_json(os.path.join(self.json_dir, "species_names.json"))
@@ -56,6 +55,7 @@ class PyBoyRunner:
         self.charmap = load_json(os.path.join(self.json_dir, "charmap.json"))
         self.item_names = load_json(os.path.join(self.json_dir, "item_names.json"))
         self.move_names = load_json(os.path.join(self.json_dir, "move_names.json"))
+        self.map_db = MapDatabase(asm_dir=self.asm_dir)
 
         self.quit_flag = False
 
@@ -68,15 +68,59 @@ class PyBoyRunner:
             frame_counter += 1
         self.pyboy.stop()
 
+    def stop(self):
+        self.running = False
+        if self.lockstep:
+            self.pyboy.stop()
+
+    def _tick(self, frames=1):
+        for _ in range(frames):
+            self.pyboy.tick()
+            if not self.lockstep:
+                time.sleep(frame_time)
+
+    def _settle_key(self):
+        mem = self.pyboy.memory
+        return (
+            bytes(mem[TILEMAP_ADDR:TILEMAP_ADDR + TILEMAP_SIZE]),
+            tuple(mem[addr] for addr in PLAYER_POS_ADDRS),
+            mem[BGP_ADDR],
+        )
+
+    def _is_idle(self):
+        mem = self.pyboy.memory
+        return mem[WALK_COUNTER_ADDR] == 0 and mem[BGP_ADDR] not in FADED_PALETTES
+
+    def settle(self, min_frames=0, stable_frames=12, max_frames=600):
+        """
+        Advances the emulator until the game is idle, for lock-step mode.
+
+        The game counts as settled once the player is not walking between tiles,
+        the screen is not faded out, and the screen tiles, position, map and
+        background palette have not changed for `stable_frames` frames, i.e.
+        text has finished printing and no animation, fade or warp is running.
+        Fades step the palette every 8 frames, so `stable_frames` should stay
+        above that. Runs at least `min_frames` and at most `max_frames` frames.
+        Returns the number of frames advanced.
+        """
+        frames, stable, key = 0, 0, None
+        while frames < max_frames:
+            # skip rendering until the last frame, only RAM is checked meanwhile
+            self.pyboy.tick(1, False)
+            frames += 1
+            new_key = self._settle_key()
+            stable = stable + 1 if new_key == key else 0
+            key = new_key
+            if frames >= min_frames and stable >= stable_frames and self._is_idle():
+                break
+        self.pyboy.tick(1, True)
+        return frames + 1
+
     def press_and_release(self, event_down, event_up, hold_frames=10):
         self.pyboy.send_input(event_down)
-        for _ in range(hold_frames):
-            self.pyboy.tick()
-            time.sleep(frame_time)
+        self._tick(hold_frames)
         self.pyboy.send_input(event_up)
-        for _ in range(2):
-            self.pyboy.tick()
-            time.sleep(frame_time)
+        self._tick(2)
 
     def send_input(self, action):
         action = action.lower()
@@ -106,9 +150,10 @@ class PyBoyRunner:
                 print(f"[WARN] Unknown action: '{action}'")
 
             # Time to progress the game
-            for _ in range(100):
-                self.pyboy.tick()
-                time.sleep(frame_time)
+            if self.lockstep:
+                self.settle()
+            else:
+                self._tick(100)
 
     def take_screenshot(self, dir_name, img_name):
 
@@ -123,8 +168,8 @@ class PyBoyRunner:
         img.save(os.path.join(dir_name, img_name))
         return img
     
-    def decode_tilemap(self):
-        mem = self.pyboy.memory
+    def decode_tilemap(self, mem=None):
+        mem = mem if mem is not None else self.pyboy.memory
         TILEMAP_ADDR = 0xC3A0
         SCREEN_WIDTH = 20
         SCREEN_HEIGHT = 18
@@ -262,37 +307,23 @@ class PyBoyRunner:
                 lines.append(line_str)
         return lines
 
-    def get_dialog(self):
-        tile_lines = self.decode_tilemap()
+    def read_wram(self) -> WramSnapshot:
+        # one bulk copy instead of a memory access per field
+        return WramSnapshot(bytes(self.pyboy.memory[WRAM_START:WRAM_END]))
 
-        # [Filtered Screen Text]
-        text = "[Filtered Screen Text]\n"
-        text += self.get_filtered_screen_text(tile_lines) + "\n"
-
-        # [Selection Box Text]
-        text += "\n[Selection Box Text]\n"
+    def read_selection_box(self, tile_lines):
         box = self.find_selection_box(tile_lines)
-        if box:
-            lines = self.extract_selection_box_text(tile_lines, box)
-            text += "----------------\n"
-            for line in lines:
-                text += line + "\n"
-            text += "----------------\n"
-        else:
-            text += "N/A\n"
-
-        return text
+        if box is None:
+            return None
+        return self.extract_selection_box_text(tile_lines, box)
 
-    def get_inventory(self):
-        mem = self.pyboy.memory
+    def read_items(self, mem):
         item_names = self.item_names
 
         item_count = mem[0xD31D]
         base = 0xD31E
 
-        text = "[Bag]\n"
-        text += f"({item_count} items):\n" if item_count > 0 else "N/A\n"
-
+        items = []
         for i in range(item_count):
             addr = base + i * 2
             item_id = mem[addr]
@@ -302,34 +333,18 @@ class PyBoyRunner:
                 continue  # Empty slot
 
             name = item_names.get(str(item_id), f"Unknown Item (ID:{item_id:02X})")
-            text += f"- {name} × {quantity}\n"
+            items.append((name, quantity))
 
-        return text
-    
-    def get_map_visual(self, coll_map, player_x, player_y, object_coords):
-        lines = []
-        for sy in range(max(0, player_y - 4), player_y + 5):
-            line = ""
-            for sx in range(max(0, player_x - 4), player_x + 5):
-                if (sx, sy) in object_coords:
-                    cell = object_coords[(sx, sy)]
-                elif coll_map and sy < len(coll_map) and sx < len(coll_map[sy]):
-                    cell = coll_map[sy][sx]
-                else:
-                    cell = "?"
-                line += f"({sx:2d},{sy:2d}): {cell}\t"
-            lines.append(line)
-        return "\n".join(lines)
-
-    def get_object_coords(self, player_x, player_y):
-        mem = self.pyboy.memory
+        return item_count, items
+
+    def get_object_coords(self, player_x, player_y, mem=None):
+        mem = mem if mem is not None else self.pyboy.memory
         object_coords = {}
 
         map_id = mem[0xD35E]
         map_name = self.map_names.get(str(map_id), f"UNKNOWN_{map_id}")
 
-        asm_path = os.path.join(self.asm_dir, f"{map_name}.asm")
-        sprite_list = parse_object_sprites(asm_path)
+        sprite_list = self.map_db.get(map_name).sprites
 
         for i in range(1, 16):
             base = 0xC100 + i * 16
@@ -355,9 +370,7 @@ class PyBoyRunner:
         player_y = mem[0xD361]
         return (player_x, player_y, map_name)
 
-
-    def get_map_info(self):
-        mem = self.pyboy.memory
+    def read_map_info(self, mem, battle_state) -> MapInfo:
         map_id = mem[0xD35E]
         map_name = self.map_names.get(str(map_id), f"UNKNOWN_{map_id}")
 
@@ -370,62 +383,36 @@ class PyBoyRunner:
         direction_map = {0: "down", 4: "up", 8: "left", 12: "right"}
         facing = direction_map.get(direction_code, "None")
 
-        # Load map module
-        tile_type, map_connection, tile_map, coll_map = load_map_module(map_name)
+        map_data = self.map_db.get(map_name)
+
+        map_info = MapInfo(
+            map_id=map_id,
+            map_name=map_name,
+            x_max=max_width,
+            y_max=max_height,
+            player_x=player_x,
+            player_y=player_y,
+            facing=facing,
+            tile_type=map_data.tile_type,
+            map_connection=map_data.map_connection,
+        )
+        if battle_state != 'Field':
+            return map_info
 
         # Extract object's location
-        object_coords = self.get_object_coords(player_x, player_y)
-
-        text = "[Map Info]\n"
-        text += f"Map Name: {map_name}, (x_max , y_max): ({max_width}, {max_height})\n"
-        text += f"Map type: {tile_type or 'UNKNOWN'}\n"
-        text += f"Expansion direction: {map_connection or 'None'}\n"
-        text += f"Your position (x, y): ({player_x}, {player_y})\n"
-        text += f"Your facing direction: {facing}\n"
-        text += "Action instruction\n"
-        text += " - up: (x, y) -> (x, y-1)\n"
-        text += " - down: (x, y) -> (x, y+1)\n"
-        text += " - left: (x, y) -> (x-1, y)\n"
-        text += " - right: (x, y) -> (x+1, y)\n"
-
-        text += "\nMap on Screen:\n"
-        if self.get_battle_state() != 'Field':
-            text += "Not in Field State"
-            return text
-        for sy in range(max(0, player_y - 4), min(player_y + 5, max_height + 1)):
-            for sx in range(max(0, player_x - 4), min(player_x + 5, max_width + 1)):
-                key = (sx, sy)
-                if key in object_coords:
-                    cell = object_coords[key]
-                elif coll_map and sy < len(coll_map) and sx < len(coll_map[sy]):
-                    cell = coll_map[sy][sx]
-                else:
-                    cell = "?"
-                text += f"({sx:2d}, {sy:2d}): {cell}\t"
-            text += "\n"
-
-        return text
-    
-    # def get_battle_state(self):
-    #     mem = self.pyboy.memory
-    #     wIsInBattle = mem[0xD057]
-    #     wLinkState = mem[0xD72E]
-    #     title_check = mem[0xC0EF]
-    #     map_id = mem[0xD35C]
-
-    #     if (title_check == 0x1F and map_id == 0x00) or title_check is None:
-    #         return "Title"
-    #     elif wLinkState == 0x05:
-    #         return "LinkBattle"
-    #     elif wIsInBattle == 0x01:
-    #         return "WildBattle"
-    #     elif wIsInBattle == 0x02:
-    #         return "TrainerBattle"
-    #     else:
-    #         return "Field"
-        
-    def get_battle_state(self):
-        mem = self.pyboy.memory
+        object_coords = self.get_object_coords(player_x, player_y, mem)
+
+        xs = range(max(0, player_x - 4), min(player_x + 5, max_width + 1))
+        ys = range(max(0, player_y - 4), min(player_y + 5, max_height + 1))
+        window = map_data.cells(xs, ys)
+        for (sx, sy), sprite in object_coords.items():
+            if sx in xs and sy in ys:
+                window[sy - ys.start, sx - xs.start] = sprite
+        map_info.window = window
+        map_info.window_origin = (xs.start, ys.start)
+        return map_info
+
+    def read_battle_state(self, mem, filtered_screen_text):
         wIsInBattle = mem[0xD057]
         wLinkState = mem[0xD72E]
         title_check = mem[0xC0EF]
@@ -441,167 +428,122 @@ class PyBoyRunner:
             battle_state = "TrainerBattle"
         else:
             battle_state = "Field"
-        
-        dialog_text = self.get_dialog()
-        has_dialog = "[Filtered Screen Text]\nN/A" not in dialog_text
+
+        has_dialog = filtered_screen_text != "N/A"
 
         if has_dialog and battle_state == "Field":
-            if 'CONTINUE' in dialog_text and 'NEW GAME' in dialog_text:
+            if 'CONTINUE' in filtered_screen_text and 'NEW GAME' in filtered_screen_text:
                 battle_state = "Title"
             else:
                 battle_state = "Dialog"
-        
+
         return battle_state
 
-    def get_enemy_info(self):
-        mem = self.pyboy.memory
+    def get_battle_state(self):
+        mem = self.read_wram()
+        return self.read_battle_state(mem, self.get_filtered_screen_text(self.decode_tilemap(mem)))
+
+    def read_enemy_pokemon(self, mem, battle_state):
+        if battle_state not in ["WildBattle", "TrainerBattle", "LinkBattle"]:
+            return {}
+
         species_id = mem[0xCFE5]
         level = mem[0xCFF3]
         hp = (mem[0xCFE6] << 8) + (mem[0xCFE7])
         max_hp = (mem[0xCFF4] << 8) + (mem[0xCFF5])
         status = mem[0xCFE9]
 
-        battle_state = self.get_battle_state()
-        text = "\n[Enemy Pokemon]\n"
+        return {
+            "Name": self.species_names.get(str(species_id), f"UNKNOWN_{species_id}"),
+            "Level": str(level),
+            "HP_percentage": f"{int((hp / max_hp) * 100)}%" if max_hp > 0 else "Unknown",
+            "Status": STATUS_NAMES.get(status, "Normal state"),
+        }
 
-        if battle_state in ["WildBattle", "TrainerBattle", "LinkBattle"]:
-            name = self.species_names.get(str(species_id), f"UNKNOWN_{species_id}")
-            text += f"Name: {name}\n"
-            text += f"Level: {level}\n"
-
-            if max_hp > 0:
-                hp_pct = int((hp / max_hp) * 100)
-                text += f"HP_percentage: {hp_pct}%\n"
-            else:
-                text += f"HP_percentage: Unknown\n"
-
-            status_text = {
-                0: "Normal state",
-                1: "Sleep", 2: "Sleep", 3: "Sleep", 4: "Sleep", 5: "Sleep", 6: "Sleep", 7: "Sleep",
-                8: "Poisoned",
-                16: "Burned",
-                32: "Frozen",
-                64: "Paralyzed"
-            }.get(status, "Normal state")
-            text += f"Status: {status_text}\n"
-
-        else:
-            text += "- Not in battle\n"
-
-        return text
-    
-    def get_active_pokemon_name(self):
-        mem = self.pyboy.memory
-        active_name = ""
-        for i in range(11):
-            b = mem[0xD009 + i]
+    def read_name(self, mem, addr, length=11):
+        name = ""
+        for b in mem[addr:addr + length]:
             ch = self.charmap.get(str(b), "")
             if ch in ["<NULL>", "@"]:
                 break
-            active_name += ch
-        return active_name
+            name += ch
+        return name
 
-    def get_party_info(self):
-        mem = self.pyboy.memory
-        active_name = self.get_active_pokemon_name()
-        text = "\n[Current Party]\n"
+    def read_party(self, mem, battle_state):
+        active_name = self.read_name(mem, 0xD009)
+        party = []
 
         for i in range(6):
             base = 0xD16B + i * 0x2C
             species_id = mem[base]
             if species_id == 0:
-                text += "No more Pokemons\n"
                 break
 
-            level = mem[base + 0x21]
-            hp = (mem[base + 1] << 8) + mem[base + 2]
-            max_hp = (mem[base + 0x22] << 8) + mem[base + 0x23]
-
-            # nickname
-            name_bytes = mem[0xD2B5 + i * 11 : 0xD2B5 + (i + 1) * 11]
-            nickname = ""
-            for b in name_bytes:
-                ch = self.charmap.get(str(b), "")
-                if ch in ["<NULL>", "@"]:
-                    break
-                nickname += ch
-
-            species_name = self.species_names.get(str(species_id), f"UNKNOWN_{species_id}")
-            type1 = self.type_names.get(str(mem[base + 0x05]), f"UNKNOWN_{mem[base + 0x05]}")
-            type2 = self.type_names.get(str(mem[base + 0x06]), f"UNKNOWN_{mem[base + 0x06]}")
+            nickname = self.read_name(mem, 0xD2B5 + i * 11)
 
             # moves and PP
             moves = []
             for j in range(4):
                 move_id = mem[0xD173 + i * 0x2C + j]
                 pp = mem[0xD188 + i * 0x2C + j]
-                move_name = self.move_names.get(str(move_id), "Not Learned")
-                moves.append(f"{move_name}(pp={pp})")
-            
-            status = mem[base + 4]
-            status_text = {
-                0: "Normal state",
-                1: "Sleep", 2: "Sleep", 3: "Sleep", 4: "Sleep", 5: "Sleep", 6: "Sleep", 7: "Sleep",
-                8: "Poisoned",
-                16: "Burned",
-                32: "Frozen",
-                64: "Paralyzed"
-            }.get(status, "Normal state")
-
-            prefix = "[In-battle] Name:" if nickname == active_name and 'Battle' in self.get_battle_state() else "Name: "
-            if type1 != type2:
-                text += f"{prefix}{nickname}, Species: {species_name}, Level: {level}, Status: {status_text}, Type: {type1}/{type2}, HP: {hp}/{max_hp}"
-            else:
-                text += f"{prefix}{nickname}, Species: {species_name}, Level: {level}, Status: {status_text}, Type: {type1}, HP: {hp}/{max_hp}, Moves: "
-            text += ", ".join(moves) + "\n"
-
-        return text
-
-    def get_badge_info(self):
-        mem = self.pyboy.memory
+                moves.append((self.move_names.get(str(move_id), "Not Learned"), pp))
+
+            party.append(PartyPokemon(
+                nickname=nickname,
+                species=self.species_names.get(str(species_id), f"UNKNOWN_{species_id}"),
+                level=mem[base + 0x21],
+                status=STATUS_NAMES.get(mem[base + 4], "Normal state"),
+                type1=self.type_names.get(str(mem[base + 0x05]), f"UNKNOWN_{mem[base + 0x05]}"),
+                type2=self.type_names.get(str(mem[base + 0x06]), f"UNKNOWN_{mem[base + 0x06]}"),
+                hp=(mem[base + 1] << 8) + mem[base + 2],
+                max_hp=(mem[base + 0x22] << 8) + mem[base + 0x23],
+                moves=moves,
+                in_battle=nickname == active_name and 'Battle' in battle_state,
+            ))
+
+        return party
+
+    def read_badges(self, mem):
         badge_mask = mem[0xD356]
         badge_names = [
             "Boulder", "Cascade", "Thunder", "Rainbow",
             "Soul", "Marsh", "Volcano", "Earth"
         ]
-        badges = [badge_names[i] for i in range(8) if badge_mask & (1 << i)]
-
-        text = "\n[Badge List]\n"
-        text += ", ".join(badges) if badges else "N/A"
-        text += "\n"
-        return text
+        return [badge_names[i] for i in range(8) if badge_mask & (1 << i)]
 
-    def get_money_info(self):
-        mem = self.pyboy.memory
+    def read_money(self, mem):
         def bcd_to_int(bcd):
             return (bcd >> 4) * 10 + (bcd & 0xF)
-        money = (
+        return (
             bcd_to_int(mem[0xD347]) * 10000 +
             bcd_to_int(mem[0xD348]) * 100 +
             bcd_to_int(mem[0xD349])
         )
-        return f"\n[Current Money]: ¥{money}\n"
+
+    def get_state_snapshot(self) -> PokemonRedState:
+        """Decodes the whole game state from a single copy of the work RAM."""
+        mem = self.read_wram()
+        tile_lines = self.decode_tilemap(mem)
+        filtered_screen_text = self.get_filtered_screen_text(tile_lines)
+        battle_state = self.read_battle_state(mem, filtered_screen_text)
+        item_count, items = self.read_items(mem)
+
+        return PokemonRedState(
+            state=battle_state,
+            filtered_screen_text=filtered_screen_text,
+            selection_box=self.read_selection_box(tile_lines),
+            enemy_pokemon=self.read_enemy_pokemon(mem, battle_state),
+            party=self.read_party(mem, battle_state),
+            badges=self.read_badges(mem),
+            item_count=item_count,
+            items=items,
+            money=self.read_money(mem),
+            map_info=self.read_map_info(mem, battle_state),
+        )
 
     def get_state(self):
-        dialog_text = self.get_dialog()
-        has_dialog = "[Filtered Screen Text]\nN/A" not in dialog_text
+        return self.get_state_snapshot().to_text()
 
-        battle_state = self.get_battle_state()
-        if has_dialog and battle_state == "Field":
-            battle_state = "Dialog"
-        
-        parts = []
-        parts.append("State: " + battle_state + "\n")
-        parts.append(self.get_dialog())
-        parts.append(self.get_enemy_info())
-        parts.append(self.get_party_info())
-        parts.append(self.get_badge_info())
-        parts.append(self.get_inventory())
-        parts.append(self.get_money_info())
-        parts.append(self.get_map_info())
-
-        return "\n".join(parts)
-    
     def save_sav_file(self, path):
         with open(path, "wb") as f:
             f.write(self.pyboy.cartridge.savefile)
@@ -5,6 +5,8 @@ import re
 import glob
 from collections import defaultdict
 
+from mcp_game_servers.pokemon_red.game.map_database import parse_object_sprites, write_map_database
+
 def parse_collision_tile_ids_asm(collision_asm_path):
     """
     Parses the file `data/tilesets/collision_tile_ids.asm` to extract
@@ -345,7 +347,7 @@ def main():
     header_files = glob.glob(os.path.join(root_dir, "data", "maps", "headers", "*.asm"))
 
     output_dir = os.path.join(os.path.join(os.getcwd(), "src", "mcp_game_servers", "pokemon_red", "game"), "processed_map")
-    os.makedirs(output_dir, exist_ok=True)
+    maps = {}
 
     for header_file in header_files:
         map_name = os.path.splitext(os.path.basename(header_file))[0]
@@ -533,26 +535,19 @@ def main():
                                 if coll_map[ny][nx] in (' ', 'Cut'):
                                     coll_map[ny][nx] = arrow_char
 
-        py_path = os.path.join(output_dir, f"{map_name}.py")
-        with open(py_path, "w", encoding="utf-8") as f:
-            f.write(f'tile_type = "{tile_type}"\n')
-            f.write(f'map_connection = "{connect_direction}"\n\n')
-
-            # tile_map
-            f.write("tile_map = [\n")
-            for row in tile_id_map:
-                row_str = ", ".join(str(x) for x in row)
-                f.write(f"    [{row_str}],\n")
-            f.write("]\n\n")
-
-            # coll_map
-            f.write("coll_map = [\n")
-            for row in coll_map:
-                row_str = ", ".join(f'"{c}"' for c in row)
-                f.write(f"    [{row_str}],\n")
-            f.write("]\n")
-
-        print(f"[{map_name}] -> Successfully Saved: {py_path}")
+        objects_asm_path = os.path.join(root_dir, "data", "maps", "objects", f"{map_name}.asm")
+        maps[map_name] = {
+            "tile_type": tile_type,
+            "map_connection": connect_direction,
+            "tile_map": tile_id_map,
+            "coll_map": coll_map,
+            "sprites": parse_object_sprites(objects_asm_path),
+        }
+        print(f"[{map_name}] -> Successfully Processed")
+
+    # one compiled database instead of a module per map, read memory-mapped by PyBoyRunner
+    write_map_database(maps, output_dir)
+    print(f"Map database of {len(maps)} maps saved to {output_dir}")
 
 if __name__ == "__main__":
     main()
@@ -1,57 +1,287 @@
 import re
 
-def construct_init_map(x_max, y_max, map_screen_raw):
-    width, height = x_max + 1, y_max + 1
+import numpy as np
 
-    # 1. Initialize empty map
-    maps = [['?' for _ in range(width)] for _ in range(height)]
+def get_screen_cells(map_info):
+    """
+    (x, y, tile) of every cell of the map on screen. Uses the map window of a
+    state snapshot when available, and parses `map_screen_raw` otherwise.
+    """
+    window = map_info.get('map_window')
+    if window is not None:
+        x0, y0 = map_info['map_window_origin']
+        return [(x0 + dx, y0 + dy, str(cell)) for dy, row in enumerate(window) for dx, cell in enumerate(row)]
 
-    # 2. Extract coordinates and symbols from map_screen_raw
+    cells = []
+    map_screen_raw = map_info.get('map_screen_raw')
     if map_screen_raw:
         map_lines = map_screen_raw.strip().split('\n')
         for line in map_lines:
             tile_matches = re.findall(r"\(\s*(\d+),\s*(\d+)\):\s*([^\s]+)", line)
             for x_str, y_str, val in tile_matches:
-                x, y = int(x_str), int(y_str)
-                if 0 <= x < width and 0 <= y < height:
-                    maps[y][x] = val
+                cells.append((int(x_str), int(y_str), val))
+    return cells
 
-    return maps
+UNKNOWN_CELL = '?'
 
-def refine_current_map(maps, x_max, y_max, map_screen_raw):
-    width, height = x_max + 1, y_max + 1
 
-    if map_screen_raw:
-        map_lines = map_screen_raw.strip().split('\n')
-        sprite_positions = []
+def _cell_char(val):
+    """Character of a cell on the full map, and its full name if it is a notable object."""
+    if val and isinstance(val, str):
+        if len(val) == 1:
+            return val, None
+        return val[0].upper(), f"{val}"
+    elif val is None or val == "":
+        return '?', None
+    return 'E', f"E: Invalid_Data_Type({type(val).__name__})"
 
-        for line in map_lines:
-            tile_matches = re.findall(r"\(\s*(\d+),\s*(\d+)\):\s*([^\s]+)", line)
-            for x_str, y_str, val in tile_matches:
-                x, y = int(x_str), int(y_str)
-                if 0 <= x < width and 0 <= y < height:
-                    if val.startswith("SPRITE_"):
-                        sprite_positions.append((x, y, val))
-                    else:
-                        maps[y][x] = val
+
+def _full_map_frame(num_rows, num_cols):
+    """Header lines, y-axis label width and footer line of the full map of a num_rows x num_cols map."""
+    map_grid_lines = []
+    actual_x_max = num_cols - 1
+    actual_y_max = num_rows - 1
+
+    # --- Calculate paddings and dimensions ---
+    # Width of the y-axis number (e.g., '7' is 1, '10' is 2)
+    y_label_num_width = len(str(actual_y_max)) if actual_y_max >= 0 else 1
+    # String for the longest y-axis label, e.g., " 7 | " or "10 | "
+    # This defines the left padding for header lines.
+    max_y_label_str = f"{actual_y_max:<{y_label_num_width}} | "
+    header_left_padding = " " * len(max_y_label_str)
+
+    x_axis_markers_prefix = "(x=0) "
+    x_axis_markers_suffix = f" (x={actual_x_max})"
+
+    # Total width of the content part of the column number line (markers + digits)
+    # This width is used for centering (y=0) and (y=Y_MAX) labels.
+    column_line_content_width = len(x_axis_markers_prefix) + num_cols + len(x_axis_markers_suffix)
+
+    # --- Map Header Construction ---
+    # (y=0) label
+    y0_label_text = "(y=0)"
+    y0_padding_count = (column_line_content_width - len(y0_label_text)) // 2
+    y0_padding = " " * max(0, y0_padding_count)
+    map_grid_lines.append(f"{header_left_padding}{y0_padding}{y0_label_text}")
+
+    # Column number headers (units, tens, hundreds)
+    col_headers_digits_only_list = [] # Stores just the digit strings, each num_cols long
+    if num_cols > 0:
+        if num_cols >= 100:
+            col_headers_digits_only_list.append("".join([str(i // 100 % 10) if i >= 100 else ' ' for i in range(num_cols)]))
+        if num_cols >= 10:
+            col_headers_digits_only_list.append("".join([str(i // 10 % 10) if i >= 10 else ' ' for i in range(num_cols)]))
+        col_headers_digits_only_list.append("".join([str(i % 10) for i in range(num_cols)])) # Units
+
+    for i, digits_str in enumerate(col_headers_digits_only_list):
+        if i == len(col_headers_digits_only_list) - 1: # Unit digits line (last in list) gets x-axis markers
+            line_content = f"{x_axis_markers_prefix}{digits_str}{x_axis_markers_suffix}"
+        else: # Tens, Hundreds lines: pad to align digits under markers
+            line_content = f"{' ' * len(x_axis_markers_prefix)}{digits_str}{' ' * len(x_axis_markers_suffix)}"
+        map_grid_lines.append(f"{header_left_padding}{line_content}")
+
+    # Separator line: +--------+
+    # Aligns with the num_cols part of the header
+    separator_padding = " " * (len(header_left_padding) + len(x_axis_markers_prefix))
+    map_grid_lines.append(f"{separator_padding}+{'-' * num_cols}+")
+
+    # --- Map Footer Construction ---
+    # (y=y_max) label, centered like (y=0)
+    y_max_label_text = f"(y={actual_y_max})"
+    y_max_padding_count = (column_line_content_width - len(y_max_label_text)) // 2
+    y_max_padding = " " * max(0, y_max_padding_count)
+    footer = f"{header_left_padding}{y_max_padding}{y_max_label_text}"
+
+    return map_grid_lines, y_label_num_width, footer
+
+
+def _render_row(y_coord, row, y_label_num_width):
+    """Line of row y_coord on the full map, and the notable objects of the row sorted by x."""
+    # Map content directly follows y-axis label for compactness, e.g., "0 | ", "10| "
+    line_content_chars = []
+    notables = []
+    for x_coord, val_at_cell in enumerate(row):
+        char, notable = _cell_char(val_at_cell)
+        line_content_chars.append(char)
+        if notable is not None:
+            notables.append(f"({x_coord:2}, {y_coord:2}) {notable}")
+    return f"{y_coord:<{y_label_num_width}} | " + "".join(line_content_chars), notables
+
+
+def _assemble_full_map(header_lines, row_lines, footer, notables):
+    full_map_text_block = "[Full Map]\n" + "\n".join(header_lines + row_lines + [footer])
+    if notables:
+        full_map_text_block += "\n\n[Notable Objects]\n" + "\n".join(notables)
+    return full_map_text_block
+
+
+def render_full_map(map_current):
+    """[Full Map] and [Notable Objects] block of a map given as a list of rows."""
+    if not map_current or not map_current[0]:
+        return "[Full Map]\n(Map data is empty or malformed)\n"
+    header_lines, y_label_num_width, footer = _full_map_frame(len(map_current), len(map_current[0]))
+    row_lines, notables = [], []
+    for y_coord, row in enumerate(map_current):
+        line, row_notables = _render_row(y_coord, row, y_label_num_width)
+        row_lines.append(line)
+        notables.extend(row_notables)
+    return _assemble_full_map(header_lines, row_lines, footer, notables)
+
+
+class _ExploredRow:
+    """Row view of an ExploredMap, indexed by x like the list rows it replaces."""
+    __slots__ = ("codes", "vocabulary")
+
+    def __init__(self, codes, vocabulary):
+        self.codes = codes
+        self.vocabulary = vocabulary
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, x):
+        if isinstance(x, slice):
+            return [self.vocabulary[code] for code in self.codes[x]]
+        return self.vocabulary[self.codes[x]]
+
+    def __iter__(self):
+        return (self.vocabulary[code] for code in self.codes.tolist())
+
+
+class ExploredMap:
+    """
+    Explored cells of one map, stored as a NumPy array of codes into a
+    vocabulary of cell strings.
+
+    Reads like the nested lists it replaces (`explored_map[y][x]`, `len`,
+    iterating over rows). `update` only writes the cells on screen, and the
+    position of every sprite is indexed, so a sprite that moved clears its
+    previous cell without scanning the map. Rendered rows of the full map are
+    cached and only re-rendered after one of their cells changed; `version`
+    counts the changes, and `changes` lists the cells they were made at.
+    """
+
+    def __init__(self, width, height):
+        self.width = max(0, width)
+        self.height = max(0, height)
+        self.codes = np.zeros((self.height, self.width), dtype=np.uint16)
+        self.vocabulary = [UNKNOWN_CELL]
+        self._code_of = {UNKNOWN_CELL: 0}
+        self.sprites = {}  # sprite -> (x, y) of the cell showing it
+        self.version = 0
+        self.changes = []  # (x, y) of every change, in order
+
+        self._frame = None
+        self._rows = [None] * self.height  # (line, notables) of each rendered row
+        self._rendered = None  # (version, text)
+
+    def code(self, val):
+        if val not in self._code_of:
+            self._code_of[val] = len(self.vocabulary)
+            self.vocabulary.append(val)
+        return self._code_of[val]
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, y):
+        return _ExploredRow(self.codes[y], self.vocabulary)
+
+    def __iter__(self):
+        return (self[y] for y in range(self.height))
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def set(self, x, y, val):
+        code = self.code(val)
+        if self.codes[y, x] != code:
+            self.codes[y, x] = code
+            self._rows[y] = None
+            self.version += 1
+            self.changes.append((x, y))
+
+    def update(self, screen_cells):
+        """Writes the cells on screen; a sprite is moved from the cell it was last seen at."""
+        sprite_positions = []
+        for x, y, val in screen_cells:
+            if self.in_bounds(x, y):
+                if val.startswith("SPRITE_"):
+                    sprite_positions.append((x, y, val))
+                else:
+                    self.set(x, y, val)
 
         # Seperately process SPRITEs
         for x, y, sprite_val in sprite_positions:
-            for row in range(height):
-                for col in range(width):
-                    if maps[row][col] == sprite_val and (col != x or row != y):
-                        maps[row][col] = '?'
-            maps[y][x] = sprite_val
+            prev = self.sprites.get(sprite_val)
+            if prev is not None and prev != (x, y) and self.codes[prev[1], prev[0]] == self._code_of[sprite_val]:
+                self.set(prev[0], prev[1], UNKNOWN_CELL)
+            self.set(x, y, sprite_val)
+            self.sprites[sprite_val] = (x, y)
+
+    def find(self, val):
+        """(x, y) of the first cell showing `val` in row-major order, or None."""
+        code = self._code_of.get(val)
+        if code is None:
+            return None
+        if val in self.sprites:
+            x, y = self.sprites[val]
+            if self.codes[y, x] == code:
+                return (x, y)
+        positions = np.argwhere(self.codes == code)
+        if len(positions) == 0:
+            return None
+        y, x = positions[0]
+        return (int(x), int(y))
+
+    def to_list(self):
+        return [list(row) for row in self]
+
+    def render(self):
+        """[Full Map] and [Notable Objects] block, re-rendering only the rows that changed."""
+        if self._rendered is not None and self._rendered[0] == self.version:
+            return self._rendered[1]
+        if self.width == 0 or self.height == 0:
+            return render_full_map([])
+
+        if self._frame is None:
+            self._frame = _full_map_frame(self.height, self.width)
+        header_lines, y_label_num_width, footer = self._frame
+        row_lines, notables = [], []
+        for y in range(self.height):
+            if self._rows[y] is None:
+                self._rows[y] = _render_row(y, self[y], y_label_num_width)
+            line, row_notables = self._rows[y]
+            row_lines.append(line)
+            notables.extend(row_notables)
+
+        text = _assemble_full_map(header_lines, row_lines, footer, notables)
+        self._rendered = (self.version, text)
+        return text
+
 
-    return maps
+def construct_init_map(x_max, y_max, screen_cells):
+    explored_map = ExploredMap(x_max + 1, y_max + 1)
+    for x, y, val in screen_cells:
+        if explored_map.in_bounds(x, y):
+            explored_map.set(x, y, val)
+            if val.startswith("SPRITE_"):
+                explored_map.sprites[val] = (x, y)
+    return explored_map
 
-def replace_map_on_screen_with_full_map(state_text: str, map_current: list[list[str]]) -> str:
+def refine_current_map(explored_map, x_max, y_max, screen_cells):
+    if screen_cells:
+        explored_map.update(screen_cells)
+    return explored_map
+
+def replace_map_on_screen_with_full_map(state_text: str, map_current) -> str:
     # Return original text if map_current is empty or invalid
-    if not map_current or not isinstance(map_current, list) or \
+    if isinstance(map_current, ExploredMap):
+        if len(map_current) == 0:
+            return state_text
+    elif not map_current or not isinstance(map_current, list) or \
         not (all(isinstance(row, list) for row in map_current) if map_current else True):
         return state_text
-    if map_current and not map_current[0]: # handles case like [[]]
-            map_current = [] # Treat as empty map
 
     # --- 0. Remove "Map on Screen" section first ---
     # Uses the format "Map on Screen:" as per typical game state text
@@ -77,122 +307,13 @@ def replace_map_on_screen_with_full_map(state_text: str, map_current: list[list[
     # Clean up potentially multiple blank lines left by removals/changes
     processed_state_text = re.sub(r"\n\s*\n", "\n\n", processed_state_text).strip()
 
-    # --- 1. Extract player position ---
-    player_x, player_y = -1, -1  # Default if not found
-    player_pos_match = re.search(r"Your position \(x, y\): \((\d+), (\d+)\)", processed_state_text)
-    if player_pos_match:
-        player_x = int(player_pos_match.group(1))
-        player_y = int(player_pos_match.group(2))
-
-    # --- 2. Generate the compact full map text ---
-    map_grid_lines = []
-    notable_objects = {} # Stores {(x, y): "char_representation: full_name"}
-
-    if not map_current: # If map_current became empty (e.g. was [[]] or initially empty)
-        full_map_text_block = "[Full Map]\n(Map data is empty or malformed)\n"
+    # --- 1. The compact full map text, cached per version of an explored map ---
+    if isinstance(map_current, ExploredMap):
+        full_map_text_block = map_current.render()
     else:
-        num_rows = len(map_current)
-        num_cols = len(map_current[0])
-        if num_cols == 0: # Handle case where rows exist but are empty
-                full_map_text_block = "[Full Map]\n(Map data has rows but no columns)\n"
-                map_current = [] # Treat as empty for subsequent logic
-        else:
-            actual_x_max = num_cols - 1
-            actual_y_max = num_rows - 1
-
-            # --- Calculate paddings and dimensions ---
-            # Width of the y-axis number (e.g., '7' is 1, '10' is 2)
-            y_label_num_width = len(str(actual_y_max)) if actual_y_max >= 0 else 1
-            # String for the longest y-axis label, e.g., " 7 | " or "10 | "
-            # This defines the left padding for header lines.
-            max_y_label_str = f"{actual_y_max:<{y_label_num_width}} | "
-            header_left_padding = " " * len(max_y_label_str)
-
-            x_axis_markers_prefix = "(x=0) "
-            x_axis_markers_suffix = f" (x={actual_x_max})"
-            
-            # Total width of the content part of the column number line (markers + digits)
-            # This width is used for centering (y=0) and (y=Y_MAX) labels.
-            column_line_content_width = len(x_axis_markers_prefix) + num_cols + len(x_axis_markers_suffix)
-
-            # --- Map Header Construction ---
-            # (y=0) label
-            y0_label_text = "(y=0)"
-            y0_padding_count = (column_line_content_width - len(y0_label_text)) // 2
-            y0_padding = " " * max(0, y0_padding_count)
-            map_grid_lines.append(f"{header_left_padding}{y0_padding}{y0_label_text}")
-
-            # Column number headers (units, tens, hundreds)
-            col_headers_digits_only_list = [] # Stores just the digit strings, each num_cols long
-            if num_cols > 0:
-                if num_cols >= 100:
-                    col_headers_digits_only_list.append("".join([str(i // 100 % 10) if i >= 100 else ' ' for i in range(num_cols)]))
-                if num_cols >= 10:
-                    col_headers_digits_only_list.append("".join([str(i // 10 % 10) if i >= 10 else ' ' for i in range(num_cols)]))
-                col_headers_digits_only_list.append("".join([str(i % 10) for i in range(num_cols)])) # Units
-
-            for i, digits_str in enumerate(col_headers_digits_only_list):
-                if i == len(col_headers_digits_only_list) - 1: # Unit digits line (last in list) gets x-axis markers
-                    line_content = f"{x_axis_markers_prefix}{digits_str}{x_axis_markers_suffix}"
-                else: # Tens, Hundreds lines: pad to align digits under markers
-                    line_content = f"{' ' * len(x_axis_markers_prefix)}{digits_str}{' ' * len(x_axis_markers_suffix)}"
-                map_grid_lines.append(f"{header_left_padding}{line_content}")
-            
-            # Separator line: +--------+
-            # Aligns with the num_cols part of the header
-            separator_padding = " " * (len(header_left_padding) + len(x_axis_markers_prefix))
-            map_grid_lines.append(f"{separator_padding}+{'-' * num_cols}+")
-
-            # --- Map Rows Construction ---
-            for y_coord in range(num_rows):
-                current_y_label_str = f"{y_coord:<{y_label_num_width}} | " # e.g., "0 | ", "10| "
-                line_content_chars = []
-                for x_coord in range(num_cols):
-                    val_at_cell = map_current[y_coord][x_coord]
-                    original_char_code = '?' # Default representation
-
-                    if val_at_cell and isinstance(val_at_cell, str):
-                        if len(val_at_cell) == 1:
-                            original_char_code = val_at_cell
-                        else:
-                            original_char_code = val_at_cell[0].upper()
-                            notable_objects[(x_coord, y_coord)] = f"{val_at_cell}"
-                    elif val_at_cell is None or val_at_cell == "":
-                        original_char_code = '?'
-                    else:
-                        original_char_code = 'E' # Error for unexpected type
-                        notable_objects[(x_coord, y_coord)] = f"E: Invalid_Data_Type({type(val_at_cell).__name__})"
-                    
-                    # Player position overrides other characters on the grid
-                    # if x_coord == player_x and y_coord == player_y:
-                    #     char_for_grid = 'P'
-                    # else:
-                    #     char_for_grid = original_char_code
-                    # line_content_chars.append(char_for_grid)
-                    line_content_chars.append(original_char_code)
-                
-                map_row_content_str = "".join(line_content_chars)
-                # Map content directly follows y-axis label for compactness
-                map_grid_lines.append(f"{current_y_label_str}{map_row_content_str}")
-
-            # --- Map Footer Construction ---
-            # (y=y_max) label, centered like (y=0)
-            y_max_label_text = f"(y={actual_y_max})"
-            y_max_padding_count = (column_line_content_width - len(y_max_label_text)) // 2
-            y_max_padding = " " * max(0, y_max_padding_count)
-            map_grid_lines.append(f"{header_left_padding}{y_max_padding}{y_max_label_text}")
-
-            # --- Assemble the [Full Map] and [Notable Objects] blocks ---
-            full_map_text_block = "[Full Map]\n" + "\n".join(map_grid_lines)
-            if notable_objects:
-                notable_list_str = "\n\n[Notable Objects]"
-                sorted_notables_coords = sorted(notable_objects.keys(), key=lambda k: (k[1], k[0])) # Sort by y, then x
-                for coord_key in sorted_notables_coords:
-                    x_obj, y_obj = coord_key
-                    notable_list_str += f"\n({x_obj:2}, {y_obj:2}) {notable_objects[coord_key]}"
-                full_map_text_block += notable_list_str
-    
-    # --- 3. Append the full map text block to the end of processed_state_text ---
+        full_map_text_block = render_full_map(map_current)
+
+    # --- 2. Append the full map text block to the end of processed_state_text ---
     if processed_state_text: # If there's other content before the map
         final_state_text = processed_state_text + "\n\n" + full_map_text_block
     else: # If processed_state_text was empty (e.g., original only had removable sections)
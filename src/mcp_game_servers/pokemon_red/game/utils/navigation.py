@@ -0,0 +1,122 @@
+from collections import deque
+
+# moves in the order paths are expanded, (dx, dy) -> command
+MOVES = [((1, 0), 'right'), ((-1, 0), 'left'), ((0, 1), 'down'), ((0, -1), 'up')]
+
+# ledge tile -> the only move that jumps over it, landing on the tile behind
+LEDGES = {'D': (0, 1), 'L': (-1, 0), 'R': (1, 0)}
+
+# cells whose outgoing moves read a changed cell: moves go one tile, ledge jumps two
+_AFFECTED = [(0, 0), (1, 0), (-1, 0), (2, 0), (-2, 0), (0, 1), (0, -1), (0, 2), (0, -2)]
+
+
+class NavigationGraph:
+    """
+    Movement graph of an `ExploredMap`, answering the path queries of `PokemonToolset`.
+
+    'O' and 'G' tiles are walkable, '~' only when surfing, a ledge ('D', 'L',
+    'R') can only be jumped over in its direction (one move), and a
+    'WarpPoint' can only end a path. The moves out of each cell are built on
+    first use and dropped again when a tile they depend on changes in the
+    explored map, so the graph follows the map incrementally. All moves cost
+    one step, so one breadth-first sweep (Dijkstra with unit costs) from a
+    source gives the shortest path to every target. Sweeps and paths are
+    cached by source, target and surf until the explored map changes.
+    """
+
+    def __init__(self, explored_map):
+        self.explored_map = explored_map
+        self._moves = {False: {}, True: {}}  # surf -> (x, y) -> [(x2, y2, command, ends_path)]
+        self._synced = len(explored_map.changes)
+        self._sweeps = {}  # (source, surf) -> (distances, parents)
+        self._paths = {}  # (source, target, surf) -> path or None
+
+    def _sync(self):
+        changes = self.explored_map.changes
+        if self._synced == len(changes):
+            return
+        for x, y in changes[self._synced:]:
+            for dx, dy in _AFFECTED:
+                for moves in self._moves.values():
+                    moves.pop((x - dx, y - dy), None)
+        self._synced = len(changes)
+        self._sweeps.clear()
+        self._paths.clear()
+
+    def tile(self, x, y):
+        return self.explored_map.vocabulary[self.explored_map.codes[y, x]]
+
+    def can_land(self, x, y, surf=False, is_destination=False):
+        """
+        - 'WarpPoint' is only allowed when it is the destination
+        - '~' is only accessible if surf=True
+        - 'C' is not walkable
+        """
+        if not self.explored_map.in_bounds(x, y):
+            return False
+        tile = self.tile(x, y)
+        if tile in {'O', 'G'}:
+            return True
+        if tile == '~' and surf:
+            return True
+        if tile == 'WarpPoint' and is_destination:
+            return True
+        return False
+
+    def moves(self, x, y, surf=False):
+        """Moves out of (x, y) as (x2, y2, command, ends_path); moving onto a warp point ends the path."""
+        moves = self._moves[surf].get((x, y))
+        if moves is None:
+            moves = []
+            for (dx, dy), command in MOVES:
+                nx, ny = x + dx, y + dy
+                if not self.explored_map.in_bounds(nx, ny):
+                    continue
+                tile = self.tile(nx, ny)
+                if tile in LEDGES:
+                    # Jumping over a ledge is also treated as a one-tile movement
+                    if LEDGES[tile] == (dx, dy) and self.can_land(nx + dx, ny + dy, surf):
+                        moves.append((nx + dx, ny + dy, command, False))
+                elif tile == 'WarpPoint':
+                    moves.append((nx, ny, command, True))
+                elif self.can_land(nx, ny, surf):
+                    moves.append((nx, ny, command, False))
+            self._moves[surf][(x, y)] = moves
+        return moves
+
+    def sweep(self, source, surf=False):
+        """Step counts and parent moves of every cell reachable from `source`."""
+        self._sync()
+        key = (source, surf)
+        if key not in self._sweeps:
+            distances = {source: 0}
+            parents = {}
+            queue = deque([source])
+            while queue:
+                cell = queue.popleft()
+                for x2, y2, command, ends_path in self.moves(*cell, surf):
+                    if (x2, y2) in distances:
+                        continue
+                    distances[(x2, y2)] = distances[cell] + 1
+                    parents[(x2, y2)] = (cell, command)
+                    if not ends_path:
+                        queue.append((x2, y2))
+            self._sweeps[key] = (distances, parents)
+        return self._sweeps[key]
+
+    def path(self, source, target, surf=False):
+        """Commands from `source` to `target` joined like "up | right | ...", or None if unreachable."""
+        self._sync()
+        key = (source, target, surf)
+        if key not in self._paths:
+            distances, parents = self.sweep(source, surf)
+            if target not in distances:
+                self._paths[key] = None
+            else:
+                commands = []
+                cell = target
+                while cell != source:
+                    cell, command = parents[cell]
+                    commands.append(command)
+                self._paths[key] = " | ".join(reversed(commands))
+        return self._paths[key]
@@ -1,7 +1,6 @@
-import time
 import re
-import heapq
 from mcp_game_servers.pokemon_red.game.utils.map_utils import *
+from mcp_game_servers.pokemon_red.game.utils.navigation import NavigationGraph
 
 def execute_action_response(toolset, action_response: str):
     try:
@@ -21,8 +20,9 @@ def execute_action_response(toolset, action_response: str):
     
 
 # Pokemon specific
-def process_state_tool(env, toolset, map_memory_dict, step_count, dialog_buffer, text_obs):
-    state_dict = env.parse_game_state(text_obs)
+def process_state_tool(env, toolset, map_memory_dict, step_count, dialog_buffer, text_obs, state_dict=None):
+    if state_dict is None:
+        state_dict = env.parse_game_state(text_obs)
     map_memory_dict = toolset.get_map_memory_dict(state_dict, map_memory_dict)
     current_map = state_dict['map_info']['map_name']
 
@@ -45,6 +45,7 @@ class PokemonToolset:
         You can access map_memory_dict, state_dict, etc. via self.agent.
         """
         self.agent = agent
+        self.navigation_graphs = {}  # map name -> NavigationGraph
 
     def get_map_memory_dict(self, state_dict, map_memory_dict):
         current_map = state_dict['map_info']['map_name']
@@ -54,7 +55,7 @@ class PokemonToolset:
                     "explored_map": construct_init_map(
                         state_dict['map_info']['x_max'],
                         state_dict['map_info']['y_max'],
-                        state_dict['map_info']['map_screen_raw']
+                        get_screen_cells(state_dict['map_info'])
                         ),
                     "history": [],
                 }
@@ -63,154 +64,41 @@ class PokemonToolset:
                     map_memory_dict[current_map]["explored_map"],
                     state_dict['map_info']['x_max'],
                     state_dict['map_info']['y_max'],
-                    state_dict['map_info']['map_screen_raw']
+                    get_screen_cells(state_dict['map_info'])
                     )
         return map_memory_dict
         
     def _get_current_state(self):
-        current_state = self.agent.env._receive_state()
-        self.agent.memory.state_dict = self.agent.env.parse_game_state(current_state)
+        self.agent.memory.state_dict = self.agent.env._receive_state_dict()
         self.agent.memory.map_memory_dict = self.get_map_memory_dict(self.agent.memory.state_dict, self.agent.memory.map_memory_dict)
         return self.agent.memory.state_dict
 
-    def _reconstruct_directions(self, parent, x_start, y_start, x_dest, y_dest):
-        """
-        Trace back the path from (x_start, y_start) to (x_dest, y_dest) and return as a string like "up | right | ..."
-        """
-        path = []
-        cur = (x_dest, y_dest)
-
-        while cur != (x_start, y_start):
-            prev = parent[cur]
-            dx = cur[0] - prev[0]
-            dy = cur[1] - prev[1]
-
-            # Jumping over a ledge is also treated as a one-tile movement
-            if dx > 0:
-                path.append("right")
-            elif dx < 0:
-                path.append("left")
-            elif dy > 0:
-                path.append("down")
-            elif dy < 0:
-                path.append("up")
-
-            cur = prev
-
-        path.reverse()
-        return " | ".join(path)
+    def _navigation_graph(self):
+        """Navigation graph of the current map, kept in sync with its explored map."""
+        current_map_id = self.agent.memory.state_dict['map_info']['map_name']
+        explored_map = self.agent.memory.map_memory_dict[current_map_id]["explored_map"]
+        graph = self.navigation_graphs.get(current_map_id)
+        if graph is None or graph.explored_map is not explored_map:
+            graph = NavigationGraph(explored_map)
+            self.navigation_graphs[current_map_id] = graph
+        return graph
 
     def _find_path_inner(self, x_dest, y_dest, isSurf=False):
         """
         Find a path to the target coordinate and return direction sequence.
         """
-        # agent state, map access
-        current_map_id = self.agent.memory.state_dict['map_info']['map_name']
-        explored_map = self.agent.memory.map_memory_dict[current_map_id]["explored_map"]
+        graph = self._navigation_graph()
         x_player = self.agent.memory.state_dict['map_info']["player_pos_x"]
         y_player = self.agent.memory.state_dict['map_info']["player_pos_y"]
-        
-        max_y = len(explored_map)
-        max_x = len(explored_map[0])
-
-        def in_bounds(x, y):
-            return (0 <= x < max_x) and (0 <= y < max_y)
-
-        def can_land(x, y, is_destination=False):
-            """
-            - 'WarpPoint' is only allowed when it is the destination
-            - '~' is only accessible if isSurf=True
-            - 'C' is not walkable
-            """
-            if not in_bounds(x, y):
-                return False
-            tile = explored_map[y][x]
 
-            if tile in {'O', 'G'}:
-                return True
-            if tile == '~' and isSurf:
-                return True
-            if tile == 'WarpPoint' and is_destination:
-                return True
-            
-            return False
-        
-        if not can_land(x_dest, y_dest, is_destination=True):
-            return (False, f"Destination coordinate is not walkable ('{explored_map[y_dest][x_dest]}'). Please reset the destination.")
+        if not graph.can_land(x_dest, y_dest, isSurf, is_destination=True):
+            return (False, f"Destination coordinate is not walkable ('{graph.explored_map[y_dest][x_dest]}'). Please reset the destination.")
 
-        def can_jump_ledge(x_ledge, y_ledge, dx, dy, is_destination=False):
-            """
-            If it's possible to jump over ledge (D/L/R), return the landing coordinate (x2, y2)
-            """
-            tile = explored_map[y_ledge][x_ledge]
-            if tile == 'D':
-                # 'D' is only passable when jumping from top to bottom (dy=1, dx=0)
-                if dx == 0 and dy == 1:
-                    x2, y2 = x_ledge, y_ledge + 1
-                    if can_land(x2, y2, is_destination):
-                        return (x2, y2)
-            elif tile == 'L':
-                # 'L' is only passable when jumping from right to left (dx=-1, dy=0)
-                if dx == -1 and dy == 0:
-                    x2, y2 = x_ledge - 1, y_ledge
-                    if can_land(x2, y2, is_destination):
-                        return (x2, y2)
-            elif tile == 'R':
-                # 'R' is only passable when jumping from left to right (dx=1, dy=0)
-                if dx == 1 and dy == 0:
-                    x2, y2 = x_ledge + 1, y_ledge
-                    if can_land(x2, y2, is_destination):
-                        return (x2, y2)
-            return None
-
-        def heuristic(cx, cy):
-            # Manhattan distance
-            return abs(cx - x_dest) + abs(cy - y_dest)
-
-        heap = []
-        heapq.heappush(heap, (heuristic(x_player, y_player), 0, x_player, y_player))
-
-        came_from = {} 
-        g_score = {(x_player, y_player): 0}
-
-        while heap:
-            _, cost_g, cx, cy = heapq.heappop(heap)
-
-            # Destination reached
-            if (cx, cy) == (x_dest, y_dest):
-                return (True, self._reconstruct_directions(came_from, x_player, y_player, x_dest, y_dest))
-
-            # 4 directions
-            for dx, dy in [(1,0), (-1,0), (0,1), (0,-1)]:
-                nx, ny = cx + dx, cy + dy
-                is_dest = ((nx, ny) == (x_dest, y_dest))
-
-                if in_bounds(nx, ny):
-                    tile_next = explored_map[ny][nx]
-                    # Check if the next tile is walkable
-                    if tile_next in {'O', 'G', '~', 'WarpPoint', 'D', 'L', 'R'}:
-                        if tile_next in {'D','L','R'}:
-                            # Jumping over ledge
-                            jump = can_jump_ledge(nx, ny, dx, dy, is_dest)
-                            if jump is not None:
-                                nx2, ny2 = jump
-                                new_g = cost_g + 1
-                                if (nx2, ny2) not in g_score or new_g < g_score[(nx2, ny2)]:
-                                    g_score[(nx2, ny2)] = new_g
-                                    f_score = new_g + heuristic(nx2, ny2)
-                                    heapq.heappush(heap, (f_score, new_g, nx2, ny2))
-                                    came_from[(nx2, ny2)] = (cx, cy)
-                        else:
-                            # Normal tile
-                            if can_land(nx, ny, is_dest):
-                                new_g = cost_g + 1
-                                if (nx, ny) not in g_score or new_g < g_score[(nx, ny)]:
-                                    g_score[(nx, ny)] = new_g
-                                    f_score = new_g + heuristic(nx, ny)
-                                    heapq.heappush(heap, (f_score, new_g, nx, ny))
-                                    came_from[(nx, ny)] = (cx, cy)
-
-        return (False, "No valid path to the destination currently. Reveal other '?' tiles first, then find a possible route.")
+        # paths from one position share a single sweep, so retries and multiple candidates are cache hits
+        path = graph.path((x_player, y_player), (x_dest, y_dest), isSurf)
+        if path is None:
+            return (False, "No valid path to the destination currently. Reveal other '?' tiles first, then find a possible route.")
+        return (True, path)
     
     def _nudge_around_and_return(self, x, y, delay=0.3):
         """
@@ -235,10 +123,10 @@ class PokemonToolset:
             nx, ny = x + dx, y + dy
             if in_bounds(nx, ny) and explored_map[ny][nx] in {'O', 'G', '~'}:
                 self.agent.env.send_action_set([move_cmd])
-                time.sleep(delay)
+                self.agent.env.wait(delay)
                 reverse_cmd = {'up': 'down', 'down': 'up', 'left': 'right', 'right': 'left'}[move_cmd]
                 self.agent.env.send_action_set([reverse_cmd])
-                time.sleep(delay)
+                self.agent.env.wait(delay)
                 return True
         return False
 
@@ -252,13 +140,6 @@ class PokemonToolset:
         max_y = len(explored_map)
         max_x = len(explored_map[0])
         
-        def find_object_coordinates(explored_map, object_name):
-            for y, row in enumerate(explored_map):
-                for x, cell in enumerate(row):
-                    if cell == object_name:
-                        return (x, y)
-            return None
-
         def in_bounds(x, y):
             return (0 <= x < max_x) and (0 <= y < max_y)
 
@@ -279,7 +160,7 @@ class PokemonToolset:
                 return True
             return False
 
-        coord_obj = find_object_coordinates(explored_map, object_name)
+        coord_obj = explored_map.find(object_name)
         if coord_obj is None:
             return (False, f"{object_name} is not found. Try exploring the map first, or refer to the full map data to identify the correct object name.")
         x_obj, y_obj = coord_obj
@@ -379,7 +260,7 @@ class PokemonToolset:
             else:
                 for action in commands1:
                     self.agent.env.send_action_set([action])
-                    time.sleep(0.3)
+                    self.agent.env.wait(0.3)
                     state_dict = self._get_current_state()
                     if state_dict['state'] != 'Field':
                         return (False, f"Interrupted! Current state: '{state_dict['state']}' state, not 'Field' state")
@@ -389,14 +270,14 @@ class PokemonToolset:
                 return (False, f"Interrupted! Current state: '{state_dict['state']}' state, not 'Field' state")
                 
             self.agent.env.send_action_set(commands2)
-            time.sleep(0.1)
+            self.agent.env.wait(0.1)
 
             state_dict = self._get_current_state()
             x_player = state_dict['map_info']["player_pos_x"]
             y_player = state_dict['map_info']["player_pos_y"]
             if state_dict["state"] == 'Dialog' and (x_player, y_player) == target_coord:
                 self.agent.memory.dialog_buffer.append(self.agent.memory.state_dict['filtered_screen_text'])
-                time.sleep(1.0)
+                self.agent.env.wait(1.0)
                 success, _ = self.continue_dialog()
                 if success:
                     return (True, f"Successfully Interact with {object_name}.")
@@ -431,11 +312,11 @@ class PokemonToolset:
                 return (False, f"The destination is already your position")
             for action in commands:
                 self.agent.env._send_action(action)
-                time.sleep(0.3)
+                self.agent.env.wait(0.3)
                 self._get_current_state()
                 if self.agent.memory.state_dict['state'] != 'Field':
                     return (False, f"Interrupted! Current state: '{self.agent.memory.state_dict['state']}' state, not 'Field' state")
-            time.sleep(0.1)
+            self.agent.env.wait(0.1)
 
             state_dict = self.agent.memory.state_dict
             if state_dict['state'] != 'Field':
@@ -479,12 +360,12 @@ class PokemonToolset:
 
                 self.agent.env.send_action_set(commands[:-1])
                 x1, y1, map1 = self.agent.env.runner.get_player_pos()
-                time.sleep(0.1)
+                self.agent.env.wait(0.1)
                 
                 self.agent.env.send_action_set(commands[-1:])
                 x2, y2, map2 = self.agent.env.runner.get_player_pos()
 
-                time.sleep(0.1)
+                self.agent.env.wait(0.1)
 
             warp_cond1 = abs(x1 - x2) > 1 or abs(y1 - y2) > 1
             warp_cond2 = (map1 != map2)
@@ -519,7 +400,7 @@ class PokemonToolset:
                 if direction:
                     # Try moving one more step
                     self.agent.env.send_action_set([direction])
-                    time.sleep(0.5)
+                    self.agent.env.wait(0.5)
 
                     # Check the state again
                     state_dict = self._get_current_state()
@@ -592,7 +473,7 @@ class PokemonToolset:
                 commands = re.split(r'[|/;, \t\n]+', actions)
 
             self.agent.env.send_action_set(commands)
-            time.sleep(0.1)
+            self.agent.env.wait(0.1)
 
             state_dict = self._get_current_state()
             current_map = self.agent.memory.state_dict['map_info']['map_name']
@@ -609,10 +490,9 @@ class PokemonToolset:
         "Continuing dialog until selectable options appear or the dialog is over (go to Field or Battle state)"        
         for _ in range(30):
             self.agent.env.send_action_set(['a'])
-            time.sleep(0.5)
+            self.agent.env.wait(0.5)
 
-            text_obs = self.agent.env._receive_state()
-            self.agent.memory.state_dict = self.agent.env.parse_game_state(text_obs)
+            self.agent.memory.state_dict = self.agent.env._receive_state_dict()
             self.agent.memory.dialog_buffer.append(self.agent.memory.state_dict['filtered_screen_text'])
 
             if self.agent.memory.state_dict['state'] == 'Field':
@@ -630,7 +510,7 @@ class PokemonToolset:
             if 'FIGHT' not in self.agent.memory.state_dict['selection_box_text']:
                 action_sequence = ['b'] * 4
                 self.agent.env.send_action_set(action_sequence)
-                time.sleep(0.1)
+                self.agent.env.wait(0.1)
                 self._get_current_state()
                 if i==2:
                     return (False, "Something went wrong")
@@ -640,7 +520,7 @@ class PokemonToolset:
 
         action_sequence = ['up', 'left', 'a']
         self.agent.env.send_action_set(action_sequence)
-        time.sleep(0.1)
+        self.agent.env.wait(0.1)
 
         # select [move_name] option
         for _ in range(30):
@@ -667,11 +547,11 @@ class PokemonToolset:
                 action = 'up'
             self.agent.memory.dialog_buffer.append(self.agent.memory.state_dict['filtered_screen_text'])
             self.agent.env.send_action_set([action])
-            time.sleep(0.1)
+            self.agent.env.wait(0.1)
         
         self.agent.memory.dialog_buffer.append(self.agent.memory.state_dict['filtered_screen_text'])
         self.agent.env.send_action_set([action])
-        time.sleep(1.0)
+        self.agent.env.wait(1.0)
 
         # continue dialog
         self._get_current_state()
@@ -688,7 +568,7 @@ class PokemonToolset:
             if 'FIGHT' not in self.agent.memory.state_dict['selection_box_text']:
                 action_sequence = ['b'] * 4
                 self.agent.env.send_action_set(action_sequence)
-                time.sleep(0.1)
+                self.agent.env.wait(0.1)
                 self._get_current_state()
                 if i==2:
                     return (False, "Something went wrong")
@@ -698,7 +578,7 @@ class PokemonToolset:
 
         action_sequence = ['up', 'right', 'a']
         self.agent.env.send_action_set(action_sequence)
-        time.sleep(0.1)
+        self.agent.env.wait(0.1)
         
         # select [pokemon_name] option
         for _ in range(30):
@@ -725,17 +605,17 @@ class PokemonToolset:
                 action = 'up'
             self.agent.memory.dialog_buffer.append(self.agent.memory.state_dict['filtered_screen_text'])
             self.agent.env.send_action_set([action])
-            time.sleep(0.1)
+            self.agent.env.wait(0.1)
         
         self.agent.memory.dialog_buffer.append(self.agent.memory.state_dict['filtered_screen_text'])
         self.agent.env.send_action_set([action])
-        time.sleep(0.1)
+        self.agent.env.wait(0.1)
 
         # select [SWITCH] option
         self._get_current_state()
         self.agent.memory.dialog_buffer.append(self.agent.memory.state_dict['filtered_screen_text'])
         self.agent.env.send_action_set(['a'])
-        time.sleep(1.0)
+        self.agent.env.wait(1.0)
 
         # continue dialog
         self._get_current_state()
@@ -749,7 +629,7 @@ class PokemonToolset:
             if 'FIGHT' not in self.agent.memory.state_dict['selection_box_text']:
                 action_sequence = ['b'] * 4
                 self.agent.env.send_action_set(action_sequence)
-                time.sleep(0.1)
+                self.agent.env.wait(0.1)
 
                 self._get_current_state()
                 if i==2:
@@ -760,7 +640,7 @@ class PokemonToolset:
 
         action_sequence = ['down', 'right', 'a']
         self.agent.env.send_action_set(action_sequence)
-        time.sleep(1.0)
+        self.agent.env.wait(1.0)
         
         # continue dialog
         self._get_current_state()
@@ -781,7 +661,7 @@ class PokemonToolset:
             if 'FIGHT' not in self.agent.memory.state_dict['selection_box_text']:
                 action_sequence = ['b'] * 4
                 self.agent.env.send_action_set(action_sequence)
-                time.sleep(0.1)
+                self.agent.env.wait(0.1)
                 
                 self._get_current_state()
                 if i==2:
@@ -792,7 +672,7 @@ class PokemonToolset:
 
         action_sequence = ['down', 'left', 'a']
         self.agent.env.send_action_set(action_sequence)
-        time.sleep(0.1)
+        self.agent.env.wait(0.1)
         
         bag_state = self.agent.memory.state_dict['inventory'].split('\n')
         for i, item_info in enumerate(bag_state):
@@ -825,12 +705,12 @@ class PokemonToolset:
             self.agent.memory.dialog_buffer.append(self.agent.memory.state_dict['filtered_screen_text'])
             
             self.agent.env.send_action_set([action])
-            time.sleep(0.1)
+            self.agent.env.wait(0.1)
         
         self.agent.memory.dialog_buffer.append(self.agent.memory.state_dict['filtered_screen_text'])
 
         self.agent.env.send_action_set([action])
-        time.sleep(0.1)
+        self.agent.env.wait(0.1)
         
         # If 'Use item on which' detected, select [pokemon_name]
         if 'Use item on which' in self.state_dict['filtered_screen_text'] and pokemon_name is None:
@@ -861,12 +741,12 @@ class PokemonToolset:
                 self.agent.memory.dialog_buffer.append(self.agent.memory.state_dict['filtered_screen_text'])
                 
                 self.agent.env.send_action_set([action])
-                time.sleep(0.1)
+                self.agent.env.wait(0.1)
             
             self.agent.memory.dialog_buffer.append(self.agent.memory.state_dict['filtered_screen_text'])
             
             self.agent.env.send_action_set([action])
-            time.sleep(1.0)
+            self.agent.env.wait(1.0)
         
         self._get_current_state()
         success, _ = self.continue_dialog()
@@ -225,8 +225,7 @@ class StarCraftEnv(BaseEnv):
         else:
             return obs.to_text()
 
-    def text2action(self, text: str) -> Action:
-
+    def parse_actions(self, text: str) -> tuple[list, list]:
         individual_actions_pattern = r"\d+: <?([^>\n]+)>?"
         actions = re.findall(individual_actions_pattern, text)
 
@@ -236,6 +235,16 @@ class StarCraftEnv(BaseEnv):
             action = action.upper()
             if action in self.action_dict:
                 valid_actions.append(action)
+        return actions, valid_actions
+
+    def action_validity(self, text: str) -> float:
+        # share of the action slots of a step that would be filled with a legal action
+        _, valid_actions = self.parse_actions(text)
+        return min(len(valid_actions), self.num_actions) / self.num_actions
+
+    def text2action(self, text: str) -> Action:
+
+        _, valid_actions = self.parse_actions(text)
 
         if len(valid_actions) > self.num_actions:
             valid_actions = valid_actions[:self.num_actions]
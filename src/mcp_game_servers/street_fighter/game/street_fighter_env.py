@@ -495,7 +495,7 @@ class StreetFighterEnv(BaseEnv):
         else:
             return ""
         
-    def text2action(self, text: str) -> Action:
+    def parse_moves(self, text: str) -> tuple[list, list]:
         matches = re.findall(r"-?\s*\**([\w ]+)\**", text)
 
         moves = ["".join(match) for match in matches]
@@ -507,6 +507,15 @@ class StreetFighterEnv(BaseEnv):
                 valid_moves.append(cleaned_move_name)
             else:
                 invalid_moves.append(move)
+        return valid_moves, invalid_moves
+
+    def action_validity(self, text: str) -> float:
+        valid_moves, invalid_moves = self.parse_moves(text)
+        num_moves = len(valid_moves) + len(invalid_moves)
+        return len(valid_moves) / num_moves if num_moves else 0.0
+
+    def text2action(self, text: str) -> Action:
+        valid_moves, invalid_moves = self.parse_moves(text)
         if len(invalid_moves) > 1:
             print(f"Many invalid moves: {invalid_moves}")
 
@@ -0,0 +1,140 @@
+import atexit
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_NULL_SPAN = nullcontext()
+
+
+class Tracer:
+    """
+    Records timed spans of the current process.
+
+    Spans are streamed to `path` in the Chrome trace JSON array format
+    (open it in `chrome://tracing` or https://ui.perfetto.dev; the closing
+    bracket is optional, so a killed process still leaves a readable trace).
+    `save` also writes `{path stem}_summary.json` with latency statistics and a
+    power-of-two histogram per span name. A disabled tracer hands out a shared
+    no-op context, so instrumented code costs next to nothing when tracing is off.
+    """
+
+    def __init__(self, path: Optional[str] = None, process_name: str = "", flush_every: int = 256):
+        self.path = path
+        self.enabled = path is not None
+        self.pid = os.getpid()
+        self.flush_every = flush_every
+        self.durations: Dict[str, List[float]] = {}
+        self._pending: List[dict] = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._file = None
+
+        if self.enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "w", encoding="utf-8")
+            self._file.write("[\n")
+            self._write([{
+                "name": "process_name",
+                "ph": "M",
+                "pid": self.pid,
+                "args": {"name": process_name or os.path.basename(path)},
+            }])
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def _write(self, events: List[dict]) -> None:
+        self._file.write("".join(json.dumps(event) + ",\n" for event in events))
+        self._file.flush()
+
+    @contextmanager
+    def _span(self, name: str, category: str, args: dict):
+        start = self._now_us()
+        try:
+            yield
+        finally:
+            duration = self._now_us() - start
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round(start, 1),
+                "dur": round(duration, 1),
+                "pid": self.pid,
+                "tid": threading.get_ident(),
+            }
+            if args:
+                event["args"] = {k: str(v) for k, v in args.items()}
+            with self._lock:
+                self.durations.setdefault(name, []).append(duration / 1000)
+                self._pending.append(event)
+                if len(self._pending) >= self.flush_every:
+                    self._write(self._pending)
+                    self._pending = []
+
+    def span(self, name: str, category: str = "", **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name, category, args)
+
+    def summary(self) -> Dict[str, dict]:
+        summary = {}
+        with self._lock:
+            durations = {name: sorted(values) for name, values in self.durations.items()}
+        for name, values in sorted(durations.items()):
+            # bucket upper bounds in milliseconds: 1, 2, 4, ...
+            histogram: Dict[str, int] = {}
+            for value in values:
+                bucket = f"<={2 ** max(0, math.ceil(math.log2(max(value, 1e-9))))}ms"
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+            summary[name] = {
+                "count": len(values),
+                "total_ms": round(sum(values), 3),
+                "mean_ms": round(sum(values) / len(values), 3),
+                "p50_ms": round(values[int(0.5 * (len(values) - 1))], 3),
+                "p90_ms": round(values[int(0.9 * (len(values) - 1))], 3),
+                "p99_ms": round(values[int(0.99 * (len(values) - 1))], 3),
+                "max_ms": round(values[-1], 3),
+                "histogram": histogram,
+            }
+        return summary
+
+    def save(self) -> None:
+        if not self.enabled or self._file.closed:
+            return
+        with self._lock:
+            self._write(self._pending)
+            self._pending = []
+            self._file.close()
+
+        summary_path = f"{os.path.splitext(self.path)[0]}_summary.json"
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=4)
+        logger.info(f"Trace saved to {self.path}")
+
+
+_tracer = Tracer()
+
+
+def enable_tracing(path: str, process_name: str = "") -> Tracer:
+    """Starts recording spans of this process to `path`; the trace is finalized at exit."""
+    global _tracer
+    _tracer = Tracer(path, process_name)
+    atexit.register(_tracer.save)
+    return _tracer
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def span(name: str, category: str = "", **args):
+    """`with span("env.step", "env"):` times the block if tracing is enabled."""
+    return _tracer.span(name, category, **args)
@@ -0,0 +1,108 @@
+import base64
+import hashlib
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image
+
+from mcp_game_servers.utils.types.frame_channel import is_frame_valid, read_frame
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+}
+
+
+class EncodedImage:
+    """
+    An image that is compressed exactly once and then carried as-is.
+
+    The encoded bytes travel with their MIME type and content hash from the
+    game server, through the agent server and client, into the LLM request,
+    so a frame is never decoded and re-encoded along the way. The base64 form
+    is computed at most once and reused for every hop. Frames published on a
+    shared-memory `FrameChannel` keep their `handle` and are passed by handle
+    for as long as the slot still holds them.
+    """
+
+    def __init__(
+        self,
+        data: Optional[bytes] = None,
+        mime_type: str = "image/jpeg",
+        sha256: str = "",
+        b64: Optional[str] = None,
+        handle: Optional[dict] = None,
+    ):
+        assert data is not None or b64 is not None, "Either data or b64 must be given."
+        self._data = data
+        self._b64 = b64
+        self.mime_type = mime_type
+        self._sha256 = sha256
+        self.handle = handle
+
+    @classmethod
+    def from_pil(cls, image: Image.Image, format: str = "JPEG") -> "EncodedImage":
+        buffered = BytesIO()
+        image.save(buffered, format=format)
+        return cls(data=buffered.getvalue(), mime_type=MIME_TYPES[format])
+
+    @classmethod
+    def from_base64(cls, b64: str, mime_type: str = "image/jpeg", sha256: str = "") -> "EncodedImage":
+        return cls(b64=b64, mime_type=mime_type, sha256=sha256)
+
+    @classmethod
+    def from_handle(cls, handle: dict, mime_type: str = "image/jpeg", sha256: str = "") -> "EncodedImage":
+        # copy the bytes out right away, the slot is reused once the ring wraps around
+        return cls(data=read_frame(handle), mime_type=mime_type, sha256=sha256, handle=handle)
+
+    @classmethod
+    def from_dict(cls, payload: dict) -> "EncodedImage":
+        if payload.get("handle") is not None:
+            return cls.from_handle(payload["handle"], payload["mime_type"], payload.get("sha256", ""))
+        return cls.from_base64(payload["data"], payload["mime_type"], payload.get("sha256", ""))
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            self._data = base64.b64decode(self._b64)
+        return self._data
+
+    @property
+    def sha256(self) -> str:
+        if not self._sha256:
+            self._sha256 = hashlib.sha256(self.data).hexdigest()
+        return self._sha256
+
+    def to_base64(self) -> str:
+        if self._b64 is None:
+            self._b64 = base64.b64encode(self._data).decode()
+        return self._b64
+
+    def to_data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.to_base64()}"
+
+    def to_dict(self) -> dict:
+        if self.handle is not None and is_frame_valid(self.handle):
+            return {
+                "handle": self.handle,
+                "mime_type": self.mime_type,
+                "sha256": self.sha256,
+            }
+        return {
+            "data": self.to_base64(),
+            "mime_type": self.mime_type,
+            "sha256": self.sha256,
+        }
+
+    def to_pil(self) -> Image.Image:
+        loaded_image = Image.open(BytesIO(self.data))
+        image = loaded_image.copy()
+        loaded_image.close()
+        return image
+
+
+def parse_data_url(url: str):
+    """Splits a `data:{mime_type};base64,{data}` URL into (mime_type, base64 data)."""
+    header, b64 = url.split(",", 1)
+    mime_type = header[len("data:"):].split(";", 1)[0]
+    return mime_type, b64
@@ -0,0 +1,117 @@
+import atexit
+import mmap
+import os
+import struct
+import tempfile
+import uuid
+from typing import Dict, Optional
+
+# seq (0 while the slot is being written) and payload length
+SLOT_HEADER = struct.Struct("<QQ")
+DEFAULT_NUM_SLOTS = 8
+DEFAULT_SLOT_SIZE = 4 * 1024 * 1024
+
+
+class FrameChannel:
+    """
+    Memory-mapped ring buffer for passing encoded frames between local processes.
+
+    The game server writes each frame into the next slot of a file-backed mmap
+    and sends only a small handle (`path`, `slot`, `seq`, `length`) inside the
+    MCP message, so the frame crosses the stdio pipes neither as base64 nor as
+    JSON. Readers map the same file and copy the bytes out, checking `seq` to
+    detect a slot that has since been overwritten.
+    """
+
+    def __init__(self, path: str, num_slots: int, slot_size: int, writable: bool):
+        self.path = path
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+        self.writable = writable
+        self.seq = 0
+
+        if writable:
+            self._file = open(path, "w+b")
+            self._file.truncate(num_slots * (SLOT_HEADER.size + slot_size))
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_WRITE)
+        else:
+            self._file = open(path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def create(
+        cls,
+        num_slots: int = DEFAULT_NUM_SLOTS,
+        slot_size: int = DEFAULT_SLOT_SIZE,
+        directory: Optional[str] = None,
+    ) -> "FrameChannel":
+        path = os.path.join(directory or tempfile.gettempdir(), f"orak_frames_{os.getpid()}_{uuid.uuid4().hex[:8]}.bin")
+        channel = cls(path, num_slots, slot_size, writable=True)
+        atexit.register(channel.close, remove=True)
+        return channel
+
+    def _offset(self, slot: int) -> int:
+        return slot * (SLOT_HEADER.size + self.slot_size)
+
+    def write(self, data: bytes) -> Optional[dict]:
+        """Writes a frame and returns its handle, or None if it does not fit in a slot."""
+        if len(data) > self.slot_size:
+            return None
+        self.seq += 1
+        slot = self.seq % self.num_slots
+        offset = self._offset(slot)
+
+        # invalidate the slot first so that concurrent readers never accept a partial frame
+        SLOT_HEADER.pack_into(self._mmap, offset, 0, 0)
+        self._mmap[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + len(data)] = data
+        SLOT_HEADER.pack_into(self._mmap, offset, self.seq, len(data))
+        return {
+            "path": self.path,
+            "num_slots": self.num_slots,
+            "slot_size": self.slot_size,
+            "slot": slot,
+            "seq": self.seq,
+            "length": len(data),
+        }
+
+    def is_valid(self, handle: dict) -> bool:
+        seq, _ = SLOT_HEADER.unpack_from(self._mmap, self._offset(handle["slot"]))
+        return seq == handle["seq"]
+
+    def read(self, handle: dict) -> bytes:
+        offset = self._offset(handle["slot"])
+        seq, length = SLOT_HEADER.unpack_from(self._mmap, offset)
+        if seq != handle["seq"]:
+            raise ValueError(f"Frame {handle['seq']} in {self.path} was overwritten (slot holds {seq})")
+        data = self._mmap[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + length]
+        if SLOT_HEADER.unpack_from(self._mmap, offset)[0] != handle["seq"]:
+            raise ValueError(f"Frame {handle['seq']} in {self.path} was overwritten while reading")
+        return data
+
+    def close(self, remove: bool = False) -> None:
+        try:
+            self._mmap.close()
+            self._file.close()
+            if remove:
+                os.remove(self.path)
+        except (OSError, ValueError):
+            pass
+
+
+_READERS: Dict[str, FrameChannel] = {}
+
+
+def open_frame_channel(handle: dict) -> FrameChannel:
+    """Returns a cached read-only mapping of the channel a handle points into."""
+    path = handle["path"]
+    if path not in _READERS:
+        _READERS[path] = FrameChannel(path, handle["num_slots"], handle["slot_size"], writable=False)
+    return _READERS[path]
+
+
+def read_frame(handle: dict) -> bytes:
+    return open_frame_channel(handle).read(handle)
+
+
+def is_frame_valid(handle: dict) -> bool:
+    return open_frame_channel(handle).is_valid(handle)
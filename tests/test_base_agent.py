@@ -0,0 +1,183 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("omegaconf")
+pytest.importorskip("openai")
+pytest.importorskip("mcp")
+
+from mcp_agent_client.base_agent import BaseAgent  # noqa: E402
+from mcp_agent_client.llms.cache import CompletionCache  # noqa: E402
+from mcp_agent_servers.prompt_registry import PromptTemplate  # noqa: E402
+
+
+def response(text):
+    return {"response": SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])}
+
+
+class ScriptedLLM:
+    """Backend without `n` or streaming that returns the given completions in order."""
+
+    def __init__(self, completions):
+        self.completions = list(completions)
+        self.requests = []
+
+    def __call__(self, messages, **kwargs):
+        self.requests.append(kwargs)
+        return response(self.completions.pop(0))
+
+    async def acall(self, messages, **kwargs):
+        return self(messages, **kwargs)
+
+
+class RecordingLog:
+    def __init__(self):
+        self.records = []
+
+    def log(self, messages, **fields):
+        self.records.append((messages, fields))
+
+
+class ValidityEnv:
+    def __init__(self, validities):
+        self.validities = validities
+
+    def action_validity(self, text):
+        return self.validities.get(text.strip().lower())
+
+
+def make_agent(llm=None, env=None, **cfg):
+    agent = BaseAgent.__new__(BaseAgent)
+    agent.cfg = BaseAgent.Config(llm_name="fake-model", **cfg)
+    agent.temperature = agent.cfg.temperature
+    agent.repetition_penalty = agent.cfg.repetition_penalty
+    agent.debug_mode = False
+    agent.model_name = "fake-model"
+    agent.llm = llm
+    agent.env = env
+    agent.cache = None
+    agent.rate_limiter = None
+    agent.step = 0
+    agent.conversation_log = RecordingLog()
+    agent.ctx_manager = SimpleNamespace(
+        total_cost=0.0, cache_hits=0, cache_misses=0, prompt_cache_read_tokens=0, prompt_cache_write_tokens=0,
+        record_cache=lambda hit: None,
+    )
+    return agent
+
+
+def actions(*texts):
+    return [f"### Actions\n{text}" if text is not None else "no sections at all" for text in texts]
+
+
+def test_most_valid_action_beats_the_majority():
+    agent = make_agent(env=ValidityEnv({"up": 0.5, "a": 1.0}))
+    candidates = actions("up", "up", "a")
+    assert agent._vote(candidates, "action_inference", {}) == candidates[2]
+
+
+def test_equally_valid_actions_are_decided_by_majority_of_normalized_text():
+    agent = make_agent(env=ValidityEnv({"up": 1.0, "left": 1.0}))
+    candidates = actions("left", "Up", "up ")
+    assert agent._vote(candidates, "action_inference", {}) == candidates[1]
+
+
+def test_without_env_unparsable_candidates_lose_and_ties_go_to_the_earliest():
+    agent = make_agent()
+    candidates = actions(None, "left", "right")
+    assert agent._vote(candidates, "action_inference", {}) == candidates[1]
+
+
+def test_action_inference_samples_candidates_and_logs_them():
+    candidates = actions("up", "a", "a")
+    llm = ScriptedLLM(candidates)
+    agent = make_agent(llm, action_candidates=3)
+
+    completion = agent.chat_completion("system", "user", module_type="action_inference")
+
+    assert completion == candidates[1]
+    assert len(llm.requests) == 3
+    _, fields = agent.conversation_log.records[-1]
+    assert fields["candidates"] == candidates
+
+
+def test_other_modules_are_sampled_once():
+    llm = ScriptedLLM(["### Self_reflection\nfine"])
+    agent = make_agent(llm, action_candidates=3)
+    assert agent.chat_completion("system", "user", module_type="self_reflection") == "### Self_reflection\nfine"
+    assert len(llm.requests) == 1
+    assert "candidates" not in agent.conversation_log.records[-1][1]
+
+
+def test_async_action_inference_votes_too():
+    candidates = actions("b", "up", "up")
+    agent = make_agent(ScriptedLLM(candidates), env=ValidityEnv({"up": 1.0, "b": 1.0}), action_candidates=3)
+    completion = asyncio.run(agent.achat_completion("system", "user", module_type="action_inference"))
+    assert completion == candidates[1]
+
+
+class StreamingLLM(ScriptedLLM):
+    """Backend that streams its completions in small deltas and stops when `on_delta` says so."""
+
+    def stream(self, messages, on_delta, **kwargs):
+        self.requests.append(kwargs)
+        text = self.completions.pop(0)
+        for i in range(0, len(text), 4):
+            if on_delta(text[i:i + 4]):
+                break
+        return text
+
+    async def astream(self, messages, on_delta, **kwargs):
+        return self.stream(messages, on_delta, **kwargs)
+
+
+class StreamFlagLLM(ScriptedLLM):
+    """Like DeepseekBase: `stream` is a request flag, not a streaming method."""
+
+    def __init__(self, completions):
+        super().__init__(completions)
+        self.stream = False
+
+
+def test_streaming_stops_after_the_required_sections():
+    agent = make_agent(StreamingLLM(["### Actions\nup\n\n### Lessons_learned\nlong text"]), streaming=True)
+    assert agent.chat_completion("system", "user", module_type="action_inference") == "### Actions\nup\n"
+
+
+def test_streaming_falls_back_for_backends_without_a_stream_method():
+    completion = "### Actions\nup\n\n### Lessons_learned\nlong text"
+    agent = make_agent(StreamFlagLLM([completion, completion]), streaming=True)
+
+    assert agent.chat_completion("system", "user", module_type="action_inference") == completion
+    assert asyncio.run(agent.achat_completion("system", "user", module_type="action_inference")) == completion
+
+
+def test_explicit_zero_temperature_is_replayed_from_the_cache(tmp_path):
+    llm = ScriptedLLM(["### Actions\nup"])
+    agent = make_agent(llm, temperature=0.7)
+    agent.cache = CompletionCache(str(tmp_path))
+
+    for _ in range(2):
+        completion = agent.chat_completion("system", "user", module_type="action_inference", temperature=0)
+        assert completion == "### Actions\nup"
+    assert len(llm.requests) == 1
+    assert agent._cache_key("system", "user", {}, {"temperature": 0.5}) is None
+
+
+def test_prompt_caching_marks_only_the_static_prefix_of_the_system_prompt():
+    agent = make_agent(SimpleNamespace(prompt_caching=True))
+    system_prompt = PromptTemplate("You play Pokemon.\n{game_info}").render(game_info="Step 3")
+
+    [system, _] = agent._build_messages(system_prompt, "user")
+    assert system["content"] == [
+        {"type": "text", "text": "You play Pokemon.\n", "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": "Step 3"},
+    ]
+
+    # nothing static to cache, or caching off
+    [system, _] = agent._build_messages(PromptTemplate("{game_info}").render(game_info="Step 3"), "user")
+    assert system["content"] == "Step 3"
+    agent.llm.prompt_caching = False
+    [system, _] = agent._build_messages(system_prompt, "user")
+    assert system["content"] == "You play Pokemon.\nStep 3"
@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("tenacity")
+
+from openai.types import CompletionUsage  # noqa: E402
+
+from mcp_agent_client.llms.batching import CompletionBatcher, _apportion  # noqa: E402
+from mcp_agent_servers.context_budget import TokenCounter  # noqa: E402
+
+
+def make_batcher(token_counter=None):
+    return CompletionBatcher(client=None, token_counter=token_counter)
+
+
+def test_apportion_adds_up_to_the_total():
+    assert _apportion(10, [1, 1, 1]) == [4, 3, 3]
+    assert _apportion(100, [30, 10, 0]) == [75, 25, 0]
+    assert _apportion(7, [0, 0]) == [4, 3]
+    assert sum(_apportion(1001, [17, 5, 123, 9])) == 1001
+
+
+def test_usage_is_split_by_prompt_and_completion_length():
+    batcher = make_batcher(TokenCounter(str.split))
+    usage = CompletionUsage(prompt_tokens=400, completion_tokens=30, total_tokens=430)
+    long_prompt, short_prompt = "word " * 300, "word " * 100
+
+    first, second = batcher._split_usage(usage, [long_prompt, short_prompt], [["a b"], ["a b c d"]])
+
+    assert (first.prompt_tokens, first.completion_tokens, first.total_tokens) == (300, 10, 310)
+    assert (second.prompt_tokens, second.completion_tokens, second.total_tokens) == (100, 20, 120)
+
+
+def test_usage_is_split_evenly_without_a_token_counter():
+    usage = CompletionUsage(prompt_tokens=9, completion_tokens=3, total_tokens=12)
+    usages = make_batcher()._split_usage(usage, ["a", "b b b"], [["x"], ["y"]])
+    assert [u.total_tokens for u in usages] == [7, 5]
+    assert sum(u.prompt_tokens for u in usages) == 9
+
+
+def test_missing_usage_stays_missing():
+    assert make_batcher()._split_usage(None, ["a", "b"], [[], []]) == [None, None]
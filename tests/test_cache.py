@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from mcp_agent_client.llms import cache as cache_module  # noqa: E402
+from mcp_agent_client.llms.cache import CompletionCache  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        self.now += 1.0
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # access times decide the eviction order, so make them strictly increasing
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+def make_key(cache, user_prompt="Where is the ball?", **params):
+    return cache.make_key("gpt-4o", "You play Pokemon Red.", user_prompt, image_hashes={"cur_image": "ab12"}, **params)
+
+
+def test_completion_round_trip(tmp_path):
+    cache = CompletionCache(str(tmp_path))
+    key = make_key(cache, temperature=0.0)
+    assert cache.get(key) is None
+
+    cache.put(key, "### Action\nup", model="gpt-4o")
+    assert cache.get(key) == "### Action\nup"
+
+
+def test_entries_persist_across_instances(tmp_path):
+    key = make_key(CompletionCache(str(tmp_path)))
+    CompletionCache(str(tmp_path)).put(key, "### Action\na")
+
+    cache = CompletionCache(str(tmp_path))
+    assert cache.get(key) == "### Action\na"
+    assert cache._total_size == os.path.getsize(cache._entry_path(key))
+
+
+def test_key_covers_the_whole_request(tmp_path):
+    cache = CompletionCache(str(tmp_path))
+    key = make_key(cache, temperature=0.0)
+
+    assert make_key(cache, temperature=0.0) == key
+    assert make_key(cache, "Where is Oak?", temperature=0.0) != key
+    assert make_key(cache, temperature=0.0, max_tokens=16) != key
+    assert cache.make_key("gpt-4o", "You play Pokemon Red.", "Where is the ball?", image_hashes={"cur_image": "cd34"},
+                          temperature=0.0) != key
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    completion = "x" * 1000
+    cache = CompletionCache(str(tmp_path), max_size_bytes=3500)
+    keys = [make_key(cache, f"prompt {i}") for i in range(4)]
+    for key in keys[:3]:
+        cache.put(key, completion)
+    # reading the oldest entry makes the second one the least recently used
+    assert cache.get(keys[0]) == completion
+
+    cache.put(keys[3], completion)
+
+    assert cache.get(keys[1]) is None
+    assert not os.path.exists(cache._entry_path(keys[1]))
+    assert all(cache.get(key) == completion for key in (keys[0], keys[2], keys[3]))
+    assert cache._total_size <= cache.max_size_bytes
@@ -0,0 +1,48 @@
+import pytest
+
+from mcp_agent_servers.context_budget import ContextBudget, TokenCounter
+from mcp_agent_servers.prompt_registry import PromptTemplate
+
+
+def word_counter():
+    return TokenCounter(str.split, name="words")
+
+
+def test_fields_are_trimmed_in_priority_order():
+    budget = ContextBudget(word_counter(), max_prompt_tokens=10)
+    history = "".join(f"step {i}\n" for i in range(5))
+    [prompt] = budget.render(
+        [PromptTemplate("Act now.\n{short_term_history}{retrieved_skills}")],
+        {"short_term_history": history, "retrieved_skills": "skill a\nskill b\n"},
+    )
+    # the skills go first, then the oldest steps
+    assert prompt == "Act now.\nstep 1\nstep 2\nstep 3\nstep 4\n"
+
+
+@pytest.mark.parametrize("value, empty", [("skill a\nskill b\n", ""), (["skill a", "skill b"], [])])
+def test_fully_trimmed_field_keeps_its_type(value, empty):
+    budget = ContextBudget(word_counter(), max_prompt_tokens=3)
+    template = PromptTemplate("Act now.\n{retrieved_skills}")
+    assert budget.fit({"retrieved_skills": 1}, 2, {"retrieved_skills": value}) == {"retrieved_skills": empty}
+    assert "None" not in budget.render([template], {"retrieved_skills": value})[0]
+
+
+def test_chatgpt_guard_truncates_only_past_the_prompt_budget():
+    pytest.importorskip("openai")
+    pytest.importorskip("anthropic")
+    pytest.importorskip("transformers")
+    from mcp_agent_client.llms.llm import ChatGPTBase, MoneyManager
+
+    llm = ChatGPTBase(model="gpt-4o", ctx_manager=MoneyManager(model="gpt-4o"))
+    llm.token_counter = word_counter()
+    llm.cutoff = lambda message, budget: " ".join(message.split()[:budget])
+    llm.max_prompt_tokens = 6
+    system = {"role": "system", "content": [{"type": "text", "text": "You play.\n"}, {"type": "text", "text": "Step 3"}]}
+
+    messages = [system, {"role": "user", "content": "a b"}]
+    llm.manage_length(messages)
+    assert messages[-1]["content"] == "a b"
+
+    messages = [system, {"role": "user", "content": "a b c d e"}]
+    llm.manage_length(messages)
+    assert messages[-1]["content"] == "a b"
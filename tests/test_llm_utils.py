@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("openai")
+
+from mcp_agent_client.llms import openai_utils  # noqa: E402
+from mcp_agent_client.llms.openai_utils import _build_chat_json_data  # noqa: E402
+from mcp_agent_client.llms.batching import get_completion_batcher  # noqa: E402
+from mcp_agent_client.llms.utils import aclose_async_http_client, get_async_http_client  # noqa: E402
+
+
+async def get_clients():
+    return get_async_http_client(), get_async_http_client()
+
+
+def test_async_http_client_is_shared_within_an_event_loop():
+    first, second = asyncio.run(get_clients())
+    assert first is second
+
+
+def test_each_event_loop_gets_its_own_async_http_client():
+    # a client used by a previous `asyncio.run` is bound to its closed loop
+    first, _ = asyncio.run(get_clients())
+    second, _ = asyncio.run(get_clients())
+    assert second is not first
+
+
+def test_aclose_async_http_client_closes_the_pool_of_the_loop():
+    async def run():
+        client = get_async_http_client()
+        await aclose_async_http_client()
+        return client, get_async_http_client()
+
+    closed, reopened = asyncio.run(run())
+    assert closed.is_closed
+    assert reopened is not closed and not reopened.is_closed
+
+
+def test_aclose_async_http_client_drops_the_clients_using_the_pool(monkeypatch):
+    monkeypatch.setattr(openai_utils, "setup_openai", lambda: {"api_key": "sk-test"})
+
+    async def run():
+        client = openai_utils.get_async_client()
+        batcher = get_completion_batcher(client, "http://localhost:8000/v1")
+        await aclose_async_http_client()
+        reopened = openai_utils.get_async_client()
+        return client, batcher, reopened, get_completion_batcher(reopened, "http://localhost:8000/v1")
+
+    client, batcher, reopened, rebatcher = asyncio.run(run())
+    assert reopened is not None and reopened is not client
+    assert rebatcher is not batcher
+
+
+def system_message(dynamic_text):
+    return {"role": "system", "content": [
+        {"type": "text", "text": "You play Pokemon.\n", "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": dynamic_text},
+    ]}
+
+
+def test_openai_requests_drop_cache_breakpoints_and_route_on_the_static_prefix():
+    first = _build_chat_json_data([system_message("Step 1")], model="gpt-4o", prompt_caching=True)
+    second = _build_chat_json_data([system_message("Step 2")], model="gpt-4o", prompt_caching=True)
+
+    assert first["messages"][0]["content"] == [
+        {"type": "text", "text": "You play Pokemon.\n"},
+        {"type": "text", "text": "Step 1"},
+    ]
+    assert first["extra_body"]["prompt_cache_key"] == second["extra_body"]["prompt_cache_key"]
+
+
+def test_anthropic_requests_keep_the_cache_breakpoint_on_the_static_prefix():
+    pytest.importorskip("anthropic")
+    from mcp_agent_client.llms.anthropic_utils import _build_json_data
+
+    json_data = _build_json_data(
+        [system_message("Step 1"), {"role": "user", "content": "user"}], model="claude-sonnet-4-5", prompt_caching=True)
+    assert json_data["system"] == system_message("Step 1")["content"]
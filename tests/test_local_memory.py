@@ -0,0 +1,66 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("mcp")
+
+from mcp_agent_servers.base_server import agent_get_local_memory  # noqa: E402
+from mcp_agent_servers.embeddings import HashingEmbeddingProvider  # noqa: E402
+from mcp_agent_servers.memory import GenericMemory  # noqa: E402
+
+KEYS = ["observation", "image", "reasoning", "analysis", "subtask", "critique", "retrieved_memory", "long_term_memory"]
+
+
+def make_agent(tmp_path, monkeypatch):
+    # the long-term memory index is saved relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    memory = GenericMemory(
+        path="logs/test",
+        capacities={"observation": 2, "image": 1},
+        embedding_provider=HashingEmbeddingProvider(),
+    )
+    return SimpleNamespace(memory=memory, long_term_memory_len=3)
+
+
+def rebuilt_local_memory(agent, game_info):
+    # a fresh view derives every entry from scratch
+    return agent_get_local_memory(SimpleNamespace(memory=agent.memory, long_term_memory_len=agent.long_term_memory_len), game_info)
+
+
+def test_incremental_view_matches_a_full_rebuild(tmp_path, monkeypatch):
+    agent = make_agent(tmp_path, monkeypatch)
+    rng = random.Random(0)
+    for step in range(80):
+        if step == 50:
+            agent.memory.clear()
+        for key in rng.sample(KEYS, rng.randint(0, 3)):
+            agent.memory.add(key, f"{key} {step}")
+
+        game_info = {"subtask": "Leave the house", "step": step}
+        assert agent_get_local_memory(agent, dict(game_info)) == rebuilt_local_memory(agent, dict(game_info))
+
+
+def test_unchanged_memory_is_not_read_again(tmp_path, monkeypatch):
+    agent = make_agent(tmp_path, monkeypatch)
+    agent.memory.add("observation", "obs 0")
+    agent.memory.add("observation", "obs 1")
+    first = agent_get_local_memory(agent, {})
+
+    def fail(*args, **kwargs):
+        raise AssertionError("memory read without a write")
+
+    for name in ("get_last", "get_recent", "count"):
+        monkeypatch.setattr(agent.memory, name, fail)
+    assert agent_get_local_memory(agent, {}) == first
+    assert first["cur_state_str"] == "obs 1"
+    assert first["prev_state_str"] == "obs 0"
+
+
+def test_game_info_keeps_prefix_keys_missing_from_memory(tmp_path, monkeypatch):
+    agent = make_agent(tmp_path, monkeypatch)
+    agent.memory.add("observation", "obs 0")
+    assert agent_get_local_memory(agent, {"subtask": "Leave the house"})["subtask"] == "Leave the house"
+
+    agent.memory.add("subtask", "Talk to Oak")
+    assert agent_get_local_memory(agent, {"subtask": "Leave the house"})["subtask"] == "Talk to Oak"
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pyboy")
+
+from mcp_game_servers.pokemon_red.game.map_database import MapDatabase, write_map_database  # noqa: E402
+
+MAPS = {
+    "PALLET_TOWN": {
+        "tile_type": "overworld",
+        "map_connection": "north: ROUTE_1",
+        "tile_map": [[(x + y) % 256 for x in range(8)] for y in range(4)],
+        "coll_map": [["O", "X", "WarpPoint", "O"], ["G", "O", "SIGN_PALLET", "~"]],
+        "sprites": ["SPRITE_OAK", "SPRITE_GIRL"],
+    },
+    "REDS_HOUSE_1F": {
+        "tile_type": "reds_house",
+        "map_connection": None,
+        "tile_map": [[7, 7, 7, 7]],
+        "coll_map": [["X", "O"]],
+        "sprites": ["SPRITE_MOM"],
+    },
+}
+
+
+@pytest.fixture
+def database(tmp_path):
+    write_map_database(MAPS, str(tmp_path))
+    return MapDatabase(map_dir=str(tmp_path), asm_dir=str(tmp_path))
+
+
+def test_maps_round_trip_through_the_database(database):
+    for name, data in MAPS.items():
+        map_data = database.get(name)
+        assert map_data.tile_type == data["tile_type"]
+        assert map_data.map_connection == data["map_connection"]
+        assert map_data.sprites == data["sprites"]
+        assert map_data.tile_map.tolist() == data["tile_map"]
+        assert map_data.coll_map.tolist() == data["coll_map"]
+
+
+def test_maps_are_decoded_once(database):
+    assert database.get("PALLET_TOWN") is database.get("PALLET_TOWN")
+    assert isinstance(database.tile_maps, np.memmap)
+
+
+def test_cells_outside_the_map_read_as_unknown(database):
+    window = database.get("PALLET_TOWN").cells(range(-1, 2), range(1, 3))
+    assert window.tolist() == [["?", "G", "O"], ["?", "?", "?"]]
+    assert database.get("NOT_A_MAP").cells(range(2), range(1)).tolist() == [["?", "?"]]
+
+
+def test_falls_back_to_map_modules_without_a_database(tmp_path):
+    (tmp_path / "VIRIDIAN_CITY.py").write_text(
+        "tile_type = 'overworld'\n"
+        "map_connection = 'south: ROUTE_1'\n"
+        "tile_map = [[1, 2], [3, 4]]\n"
+        "coll_map = [['O', 'X', 'O'], ['G']]\n"
+    )
+    (tmp_path / "VIRIDIAN_CITY.asm").write_text(
+        "\tdef_object_events\n"
+        "\tobject_event 17, 5, SPRITE_YOUNGSTER, WALK, ANY_DIR, TEXT_VIRIDIANCITY_YOUNGSTER1\n"
+        "\tobject_event 30, 25, SPRITE_GAMBLER, STAY, UP, TEXT_VIRIDIANCITY_GAMBLER1\n"
+    )
+    database = MapDatabase(map_dir=str(tmp_path), asm_dir=str(tmp_path))
+
+    map_data = database.get("VIRIDIAN_CITY")
+    assert database.index is None
+    assert map_data.map_connection == "south: ROUTE_1"
+    assert map_data.sprites == ["SPRITE_YOUNGSTER", "SPRITE_GAMBLER"]
+    assert map_data.coll_map.tolist() == [["O", "X", "O"], ["G", "?", "?"]]
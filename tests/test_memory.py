@@ -0,0 +1,128 @@
+import os
+
+import numpy as np
+
+from mcp_agent_servers.embeddings import EmbeddingProvider, HashingEmbeddingProvider, normalize
+from mcp_agent_servers.memory import GenericMemory, MemoryBuffer, SpillFile
+
+
+class AnisotropicEmbeddingProvider(EmbeddingProvider):
+    """Hashing embeddings plus a shared direction, so that unrelated texts have a
+    cosine similarity around 0.7 like ada-002 embeddings."""
+
+    def __init__(self, dim: int = 1024):
+        self.name = "anisotropic"
+        self.hashing = HashingEmbeddingProvider(dim)
+        self.common = normalize(np.ones((1, dim), dtype=np.float32))
+
+    def embed(self, texts):
+        return normalize(self.hashing.embed(texts) + 1.5 * self.common)
+
+
+def make_memory(tmp_path, monkeypatch):
+    # the long-term memory index is saved relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return GenericMemory(path="logs/test", embedding_provider=AnisotropicEmbeddingProvider())
+
+
+def make_buffer(tmp_path, capacity=3, name="spill.bin"):
+    return MemoryBuffer(capacity, SpillFile(str(tmp_path / name)))
+
+
+def test_ring_keeps_the_latest_entries_and_spills_the_rest(tmp_path):
+    buffer = make_buffer(tmp_path)
+    for i in range(10):
+        buffer.append({"step": i, "text": f"observation {i}"})
+
+    assert len(buffer) == 10
+    assert [entry["step"] for entry in buffer.ring] == [7, 8, 9]
+    assert len(buffer.spilled) == 7
+    assert buffer.last()["step"] == 9
+    assert [entry["step"] for entry in buffer.recent()] == list(range(10))
+
+
+def test_recent_reads_only_the_spilled_entries_it_needs(tmp_path, monkeypatch):
+    buffer = make_buffer(tmp_path)
+    for i in range(10):
+        buffer.append(i)
+
+    reads = []
+    read = buffer.spill_file.read
+    monkeypatch.setattr(buffer.spill_file, "read", lambda *loc: reads.append(loc) or read(*loc))
+
+    assert buffer.recent(2) == [8, 9]
+    assert buffer.recent(0) == []
+    assert reads == []
+    assert buffer.recent(5) == [5, 6, 7, 8, 9]
+    assert len(reads) == 2
+    assert buffer.recent(50) == list(range(10))
+
+
+def test_buffers_sharing_a_spill_file_keep_their_own_entries(tmp_path):
+    spill_file = SpillFile(str(tmp_path / "spill.bin"))
+    observations, reasonings = MemoryBuffer(2, spill_file), MemoryBuffer(1, spill_file)
+    for i in range(6):
+        observations.append(f"observation {i}")
+        reasonings.append(f"reasoning {i}")
+
+    assert observations.recent() == [f"observation {i}" for i in range(6)]
+    assert reasonings.recent() == [f"reasoning {i}" for i in range(6)]
+
+
+def test_reset_removes_the_spill_file(tmp_path):
+    buffer = make_buffer(tmp_path, capacity=1)
+    buffer.append("a")
+    buffer.append("b")
+    assert os.path.exists(buffer.spill_file.path)
+
+    buffer.spill_file.reset()
+    assert not os.path.exists(buffer.spill_file.path)
+
+
+def test_memories_on_one_path_spill_to_their_own_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first, second = (
+        GenericMemory(path="logs/test", capacities={"observation": 1}, embedding_provider=HashingEmbeddingProvider())
+        for _ in range(2)
+    )
+    for i in range(4):
+        first.add("observation", f"first {i}")
+        second.add("observation", f"second {i}")
+    assert first.spill_file.path != second.spill_file.path
+
+    first.clear()
+    assert not os.path.exists(first.spill_file.path)
+    assert first.get_all("observation") == []
+    assert second.get_all("observation") == [f"second {i}" for i in range(4)]
+
+
+def test_unrelated_memories_are_both_stored(tmp_path, monkeypatch):
+    memory = make_memory(tmp_path, monkeypatch)
+    first = "Pick up the Poke Ball from the table in Oak's lab before leaving."
+    second = "Build a supply depot whenever the supply cap is within four units."
+
+    memory.add_long_term_memory(first)
+    memory.add_long_term_memory(second)
+
+    assert memory.get_all("long_term_memory") == [first, second]
+    assert memory.vectordb.count() == 2
+
+
+def test_duplicate_memory_is_not_stored(tmp_path, monkeypatch):
+    memory = make_memory(tmp_path, monkeypatch)
+    content = "Talk to the nurse in the Pokemon Center to heal the party."
+
+    saved = memory.add_long_term_memories([content, content])
+    memory.add_long_term_memory(content)
+
+    assert saved == [content]
+    assert memory.get_all("long_term_memory") == [content]
+
+
+def test_retrieval_keeps_only_relevant_memories(tmp_path, monkeypatch):
+    memory = make_memory(tmp_path, monkeypatch)
+    relevant = "Talk to the nurse in the Pokemon Center to heal the party."
+    unrelated = "Build a supply depot whenever the supply cap is within four units."
+    memory.add_long_term_memories([relevant, unrelated])
+
+    assert memory.retrieve_long_term_memory(relevant) == f"1: {relevant}"
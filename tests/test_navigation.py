@@ -0,0 +1,127 @@
+import random
+from collections import deque
+
+import pytest
+
+pytest.importorskip("pyboy")
+
+from mcp_game_servers.pokemon_red.game.utils.map_utils import ExploredMap  # noqa: E402
+from mcp_game_servers.pokemon_red.game.utils.navigation import NavigationGraph  # noqa: E402
+
+STEPS = {"right": (1, 0), "left": (-1, 0), "down": (0, 1), "up": (0, -1)}
+LEDGES = {"D": (0, 1), "L": (-1, 0), "R": (1, 0)}
+
+
+def make_map(rows):
+    explored_map = ExploredMap(len(rows[0]), len(rows))
+    for y, row in enumerate(rows):
+        for x, cell in enumerate(row):
+            explored_map.set(x, y, cell)
+    return explored_map
+
+
+def walk(explored_map, source, path, surf=False):
+    """Follows `path` under the movement rules, returning the cells visited or None on an illegal move."""
+    cells = [source]
+    commands = path.split(" | ") if path else []
+    for i, command in enumerate(commands):
+        dx, dy = STEPS[command]
+        x, y = cells[-1][0] + dx, cells[-1][1] + dy
+        if not explored_map.in_bounds(x, y):
+            return None
+        tile = explored_map[y][x]
+        if tile in LEDGES:
+            if LEDGES[tile] != (dx, dy):
+                return None
+            x, y = x + dx, y + dy
+            if not explored_map.in_bounds(x, y):
+                return None
+            tile = explored_map[y][x]
+        if tile == "WarpPoint" and i == len(commands) - 1:
+            pass
+        elif not (tile in ("O", "G") or (tile == "~" and surf)):
+            return None
+        cells.append((x, y))
+    return cells
+
+
+def distances(explored_map, source, surf=False):
+    """Plain breadth-first search over `walk`, the reference for path lengths."""
+    dist = {source: 0}
+    queue = deque([source])
+    while queue:
+        cell = queue.popleft()
+        for command in STEPS:
+            cells = walk(explored_map, cell, command, surf)
+            if cells is None or cells[-1] in dist:
+                continue
+            dist[cells[-1]] = dist[cell] + 1
+            if explored_map[cells[-1][1]][cells[-1][0]] != "WarpPoint":
+                queue.append(cells[-1])
+    return dist
+
+
+def test_path_around_walls():
+    explored_map = make_map([
+        "OOXO",
+        "OXXO",
+        "OOOO",
+    ])
+    assert NavigationGraph(explored_map).path((0, 0), (3, 0)) == "down | down | right | right | right | up | up"
+
+
+def test_ledges_are_jumped_in_their_direction_only():
+    explored_map = make_map([
+        ["O", "X"],
+        ["D", "X"],
+        ["O", "X"],
+    ])
+    graph = NavigationGraph(explored_map)
+    assert graph.path((0, 0), (0, 2)) == "down"
+    assert graph.path((0, 2), (0, 0)) is None
+
+
+def test_warp_points_only_end_paths_and_water_needs_surf():
+    explored_map = make_map([
+        ["O", "WarpPoint", "O"],
+        ["O", "~", "O"],
+    ])
+    graph = NavigationGraph(explored_map)
+    assert graph.path((0, 0), (1, 0)) == "right"
+    assert graph.path((0, 0), (2, 0)) is None
+    assert graph.path((0, 0), (2, 0), surf=True) == "down | right | right | up"
+
+
+def test_paths_follow_changes_of_the_explored_map():
+    explored_map = make_map(["OOO"])
+    graph = NavigationGraph(explored_map)
+    assert graph.path((0, 0), (2, 0)) == "right | right"
+
+    explored_map.set(1, 0, "SPRITE_OAK")
+    assert graph.path((0, 0), (2, 0)) is None
+    explored_map.set(1, 0, "O")
+    assert graph.path((0, 0), (2, 0)) == "right | right"
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_paths_are_shortest_on_random_maps(seed):
+    rng = random.Random(seed)
+    width, height = rng.randint(1, 12), rng.randint(1, 12)
+    tiles = ["O"] * 8 + ["G", "X", "X", "~", "D", "L", "R", "WarpPoint", "?"]
+    explored_map = ExploredMap(width, height)
+    graph = NavigationGraph(explored_map)
+    for _ in range(5):
+        for _ in range(width * height // 2 + 1):
+            explored_map.set(rng.randrange(width), rng.randrange(height), rng.choice(tiles))
+        for _ in range(10):
+            source = (rng.randrange(width), rng.randrange(height))
+            target = (rng.randrange(width), rng.randrange(height))
+            surf = rng.random() < 0.3
+            reference = distances(explored_map, source, surf)
+            path = graph.path(source, target, surf)
+            if target not in reference:
+                assert path is None
+                continue
+            cells = walk(explored_map, source, path, surf)
+            assert cells is not None and cells[-1] == target
+            assert len(cells) - 1 == reference[target]
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pyboy")
+pytest.importorskip("PIL")
+
+from mcp_game_servers.pokemon_red.game.pokemon_red_env import PokemonRedEnv, PokemonRedObs  # noqa: E402
+from mcp_game_servers.pokemon_red.game.utils.pokemon_tools import process_state_tool  # noqa: E402
+
+FIELD_TEXT = "State: Field\n[Filtered Screen Text]\nN/A\n[Selection Box Text]\nN/A\n"
+
+
+def make_env():
+    env = PokemonRedEnv.__new__(PokemonRedEnv)
+    env.skipped_dialog = []
+    return env
+
+
+def make_obs(state, screen_text="N/A", selection_box_text="N/A"):
+    state_dict = {
+        "state": state,
+        "filtered_screen_text": screen_text,
+        "selection_box_text": selection_box_text,
+        "map_info": {"map_name": "PalletTown"},
+    }
+    return PokemonRedObs(state_text=FIELD_TEXT, state_dict=state_dict)
+
+
+def test_advanced_dialog_is_handed_to_the_agent():
+    env = make_env()
+    assert env.policy_action(make_obs("Dialog", "OAK: Hey! Wait!")) == "a"
+    assert env.policy_action(make_obs("Dialog", "Don't go out!")) == "a"
+
+    # a choice is the agent's turn, and it gets the dialog that led up to it
+    obs = make_obs("Dialog", "Which one?", selection_box_text="YES NO")
+    assert env.policy_action(obs) is None
+    assert obs.dialog_buffer == ["OAK: Hey! Wait!", "Don't go out!"]
+
+    later = make_obs("Field")
+    assert env.policy_action(later) is None
+    assert later.dialog_buffer is None
+
+
+def test_advanced_dialog_reaches_the_interacted_dialog_buffer():
+    env = make_env()
+    env.policy_action(make_obs("Dialog", "OAK: Hey! Wait!"))
+    obs = make_obs("Field")
+    env.policy_action(obs)
+
+    toolset = SimpleNamespace(get_map_memory_dict=lambda state_dict, map_memory_dict: map_memory_dict)
+    dialog_buffer = ["MOM: Right. All boys leave home"] + obs.dialog_buffer
+    text_obs, _, _, _, dialog_buffer = process_state_tool(
+        env, toolset, {}, 0, dialog_buffer, obs.to_text(), state_dict=obs.state_dict,
+    )
+
+    assert "[Interacted Dialog Buffer]\nMOM: Right. All boys leave home\nOAK: Hey! Wait!\n" in text_obs
+    assert dialog_buffer == []
@@ -0,0 +1,73 @@
+import os
+import pkgutil
+from string import Formatter
+
+import pytest
+
+from mcp_agent_servers.prompt_registry import PromptRegistry, PromptTemplate, get_prompt_registry
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+
+
+def prompt_paths():
+    paths = []
+    for root, _, files in os.walk(os.path.join(SRC_DIR, "mcp_agent_servers")):
+        package = os.path.relpath(root, SRC_DIR).split(os.sep)
+        if "prompts" in package and any(name.endswith(".py") and name != "__init__.py" for name in files):
+            paths.append(".".join(package))
+    return sorted(paths)
+
+
+def field_values(template):
+    names = {field_name.split(".")[0].split("[")[0] for _, field_name, _, _ in Formatter().parse(template) if field_name}
+    return {name: f"<{name} value>" for name in names}
+
+
+@pytest.mark.parametrize("template", [
+    "plain text without slots",
+    "{a} then {b} and {a} again",
+    "escaped {{braces}} around {a}",
+    "spec {a:>12} conversion {b!r} both {a!s:^9}",
+    "number {n:05d} and {n}",
+    "",
+])
+def test_render_matches_str_format(template):
+    kwargs = {"a": "alpha", "b": "beta", "n": 42}
+    assert PromptTemplate(template).render(**kwargs) == template.format(**kwargs)
+
+
+def test_missing_slot_raises_like_str_format():
+    with pytest.raises(KeyError):
+        PromptTemplate("Hello {name}").render()
+
+
+def test_static_prefix_is_the_text_before_the_first_slot():
+    assert PromptTemplate("You play {game}. Act.").static_prefix == "You play "
+    assert PromptTemplate("{game} first").static_prefix == ""
+    assert PromptTemplate("No {{slots}} here").static_prefix == "No {slots} here"
+
+
+def test_rendered_prompt_keeps_the_static_prefix():
+    prompt = PromptTemplate("You play {game}. Act.").render(game="Pokemon")
+    assert prompt == "You play Pokemon. Act."
+    assert prompt.static_prefix == "You play "
+
+
+@pytest.mark.parametrize("prompt_path", prompt_paths())
+def test_every_shipped_prompt_renders_like_str_format(prompt_path):
+    registry = PromptRegistry(prompt_path)
+    for name, template in registry.templates.items():
+        kwargs = field_values(template.template)
+        assert registry.render(name, **kwargs) == template.template.format(**kwargs), name
+        assert template.template.format(**kwargs).startswith(template.static_prefix), name
+
+
+def test_registry_is_shared_per_prompt_path():
+    path = prompt_paths()[0]
+    assert get_prompt_registry(path) is get_prompt_registry(path)
+
+
+def test_unknown_prompt_raises():
+    registry = PromptRegistry(prompt_paths()[0])
+    with pytest.raises(ModuleNotFoundError):
+        registry.get("no_such_prompt")
@@ -0,0 +1,74 @@
+import pytest
+
+pytest.importorskip("pyboy")
+
+from mcp_game_servers.pokemon_red.game.pyboy_runner import (  # noqa: E402
+    BGP_ADDR,
+    PLAYER_POS_ADDRS,
+    TILEMAP_ADDR,
+    TILEMAP_SIZE,
+    WALK_COUNTER_ADDR,
+    PyBoyRunner,
+)
+
+MAP_ADDR, Y_ADDR, X_ADDR = PLAYER_POS_ADDRS
+NORMAL_PALETTE = 0xE4
+FADE_OUT = [(21, 0xF9), (29, 0xFE), (37, 0xFF)]  # (first frame, palette), one step every 8 frames
+FADE_IN = [(77, 0xFE), (85, 0xF9), (93, NORMAL_PALETTE)]
+WARP_FRAME = 60  # the new map is loaded while the screen is black
+
+
+class DoorPyBoy:
+    """Stands in for PyBoy and replays the RAM of the player walking up into a door:
+    a 16-frame step onto the door tile, a fade to black, the warp, and a fade in."""
+
+    def __init__(self):
+        self.memory = bytearray(0x10000)
+        self.frame = 0
+        self.rendered = []
+        self.memory[BGP_ADDR] = NORMAL_PALETTE
+        self.memory[MAP_ADDR], self.memory[Y_ADDR], self.memory[X_ADDR] = 0, 6, 5
+        self.memory[WALK_COUNTER_ADDR] = 8
+
+    def tick(self, count=1, render=True):
+        for _ in range(count):
+            self.frame += 1
+            self.rendered.append(render)
+            mem = self.memory
+            if self.frame <= 16:
+                mem[WALK_COUNTER_ADDR] = 8 - self.frame // 2
+                if self.frame == 16:
+                    mem[Y_ADDR] = 5
+            for first, palette in FADE_OUT + FADE_IN:
+                if self.frame == first:
+                    mem[BGP_ADDR] = palette
+            if self.frame == WARP_FRAME:
+                mem[MAP_ADDR], mem[Y_ADDR], mem[X_ADDR] = 40, 7, 3
+                mem[TILEMAP_ADDR:TILEMAP_ADDR + TILEMAP_SIZE] = bytes([0x31]) * TILEMAP_SIZE
+
+
+def make_runner():
+    runner = PyBoyRunner.__new__(PyBoyRunner)
+    runner.pyboy = DoorPyBoy()
+    return runner
+
+
+def test_settle_waits_out_door_warp():
+    runner = make_runner()
+    frames = runner.settle()
+
+    mem = runner.pyboy.memory
+    assert mem[MAP_ADDR] == 40
+    assert (mem[X_ADDR], mem[Y_ADDR]) == (3, 7)
+    assert mem[BGP_ADDR] == NORMAL_PALETTE
+    # fade in finished on frame 93, then 12 stable frames and the rendered frame
+    assert frames == 93 + 12 + 1
+    assert runner.pyboy.rendered == [False] * (frames - 1) + [True]
+
+
+def test_settle_does_not_stop_on_black_screen():
+    runner = make_runner()
+    # the screen holds black for longer than stable_frames before the warp
+    frames = runner.settle(stable_frames=20)
+    assert frames > WARP_FRAME
+    assert runner.pyboy.memory[BGP_ADDR] == NORMAL_PALETTE